@@ -1,11 +1,579 @@
-import requests
-from datetime import datetime
+import time
+# 开始导入app的时刻，启动分析从这里开始计时
+IMPORT_STARTED = time.perf_counter()
+import json
+import queue
+import argparse
+import atexit
+import codecs
+import contextlib
+import heapq
+import itertools
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from collections import deque
 import sys
 import re
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, urljoin
 import os
+import random
+import threading
 
-BASE_URL = "https://form.qun100.com"
+# 可通过环境变量指向本地模拟服务器，见 mock_server.py
+BASE_URL = os.environ.get("QUN100_BASE_URL", "https://form.qun100.com")
+
+# 开始前多少秒预热连接
+WARMUP_LEAD = 5
+# 表单版本号缓存有效期（秒）
+VERSION_TTL = 60
+# 开始前多少秒同步服务器时钟
+CLOCK_SYNC_LEAD = 30
+# 第一次提交在开始时刻加上时钟估计误差之后，再晚多少秒到达服务器
+LAUNCH_MARGIN = 0.003
+# 开始前多少秒做就绪检查，只在时钟同步之前进行
+PREFLIGHT_LEADS = (600, 120)
+# 每次就绪检查最多用多少秒，包括其中的全部请求
+PREFLIGHT_TIMEOUT = 10
+# 待命期间检查表单是否修改的间隔（秒）
+WATCH_INTERVAL = 60
+# 定时器最后多少纳秒改为忙等
+SPIN_NS = 20_000_000
+# 提交引擎：sync为阻塞引擎，async为asyncio引擎
+ENGINE = os.environ.get("QUN100_ENGINE", "sync")
+# 对冲提交：请求超过多少秒没有响应时发出备份请求
+HEDGE_DELAY = 0.3
+# 对冲提交时同时在途的提交请求上限
+MAX_IN_FLIGHT = 2
+# 服务器错误退避的上限（秒）
+BACKOFF_CAP = 2.0
+# 服务器要求的Retry-After最多等待多少秒
+RETRY_AFTER_CAP = 10.0
+# 名单监控的默认和最短轮询间隔（秒）
+MONITOR_INTERVAL = 15
+MONITOR_MIN_INTERVAL = 5
+# 交互模式下名单完成情况最多等待多少秒，只用于显示
+ROSTER_WAIT = 1.0
+# 表单信息缓存目录
+CACHE_DIR = os.environ.get("QUN100_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "qun100"))
+# qun100 表单时间均为北京时间
+SERVER_TZ = timezone(timedelta(hours=8))
+
+def percentile(values, p):
+    """计算百分位数（最近秩法）"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+class Tracer:
+    """请求计时记录器
+    每个请求一条记录，由后台线程写入JSONL文件，写文件不占用提交线程
+    """
+    def __init__(self, path, mode="a"):
+        self.path = path
+        self.queue = queue.Queue()
+        self.file = open(path, mode, encoding="utf-8")
+        self.closed = False
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+        # 程序退出时写完剩余记录
+        atexit.register(self.close)
+
+    def emit(self, record):
+        self.queue.put_nowait(record)
+
+    def finish(self, record, status, content, size=None):
+        """补充响应状态和表单返回的code/msg后写入记录
+        Args:
+            record: 已记录各阶段耗时的字典
+            status: HTTP状态码
+            content: 响应体字节，流式响应只有开头的一段
+            size: 响应体的实际字节数，默认为len(content)
+        """
+        size = len(content) if size is None else size
+        record["status"] = status
+        record["bytes"] = size
+        # 大的响应（如目录）只用正则取code，避免完整解析
+        if size <= 65536:
+            try:
+                data = json.loads(content)
+                record["code"] = data.get("code")
+                record["msg"] = data.get("msg") or data.get("message")
+            except (ValueError, AttributeError):
+                pass
+        else:
+            match = re.search(rb'"code"\s*:\s*(-?\d+)', content[:512])
+            if match:
+                record["code"] = int(match.group(1))
+        self.emit(record)
+
+    def _write(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self.queue.empty():
+                self.file.flush()
+        self.file.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+class StartupProfiler:
+    """启动分析
+    默认关闭，开启后记录从导入app到待命之间各阶段的耗时（导入requests、解析请求头、
+    获取表单信息和目录、选课、构建提交方案、就绪检查等），可选同时运行cProfile和tracemalloc，
+    待命时打印各阶段耗时并写入JSON报告。关闭时span只有一次属性判断的开销
+    """
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.spans = []
+        self.cprofile = None
+        self.memory = False
+        self.reported = False
+        self._depth = threading.local()
+
+    def enable(self, path=None, cprofile=False, memory=False):
+        """开启启动分析
+        Args:
+            path: JSON报告路径，None表示只打印；开启cProfile时统计写入path.prof
+            cprofile: 是否同时运行cProfile
+            memory: 是否用tracemalloc记录各阶段的内存变化和峰值
+        """
+        self.enabled = True
+        self.path = path
+        # 导入app本身的耗时在开启之前就已经发生，补记一条
+        self.spans.append({"name": "导入app", "start": 0.0, "duration": self._ms(IMPORT_FINISHED),
+                           "depth": 0, "thread": "MainThread"})
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+            self.memory = True
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @staticmethod
+    def _ms(moment):
+        """换算为从开始导入app起的毫秒数"""
+        return round((moment - IMPORT_STARTED) * 1000, 3)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """记录一个阶段的耗时，可以嵌套"""
+        if not self.enabled:
+            yield
+            return
+        depth = getattr(self._depth, "value", 0)
+        self._depth.value = depth + 1
+        if self.memory:
+            import tracemalloc
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._depth.value = depth
+            span = {"name": name, "start": self._ms(start), "duration": round((end - start) * 1000, 3),
+                    "depth": depth, "thread": threading.current_thread().name}
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                span["memory_kb"] = round((current - memory_before) / 1024, 1)
+                span["peak_kb"] = round(peak / 1024, 1)
+            self.spans.append(span)
+
+    def report(self):
+        """到达待命状态时调用：停止分析，打印各阶段耗时并写入报告，只报告一次"""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        armed = self._ms(time.perf_counter())
+        if self.cprofile:
+            self.cprofile.disable()
+        print_colored(f"\n=== 启动分析：{armed:.1f}ms 到达待命 ===", "cyan", "bold")
+        for span in sorted(self.spans, key=lambda span: span["start"]):
+            memory = f"  内存{span['memory_kb']:+.0f}KB 峰值{span['peak_kb']:.0f}KB" if "memory_kb" in span else ""
+            thread = "" if span["thread"] == "MainThread" else f"  [{span['thread']}]"
+            name = "  " * span["depth"] + span["name"]
+            # 中文占两列，按显示宽度对齐
+            padding = 28 - sum(2 if ord(char) > 0x2E80 else 1 for char in name)
+            print(f"{name}{' ' * max(padding, 1)}{span['start']:9.1f} +{span['duration']:8.1f}ms{memory}{thread}")
+        report = {"armed": armed, "spans": self.spans}
+        if self.memory:
+            import tracemalloc
+            report["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        if self.cprofile:
+            import io
+            import pstats
+            stream = io.StringIO()
+            stats = pstats.Stats(self.cprofile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(15)
+            print(stream.getvalue())
+            if self.path:
+                stats.dump_stats(self.path + ".prof")
+        if self.path:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+            print(f"启动分析已写入 {self.path}")
+
+PROFILER = StartupProfiler()
+
+class Qun100Client:
+    """qun100 HTTP客户端
+    持有一个共享的 keep-alive 会话，所有请求复用同一个连接池，
+    请求头只设置一次，开始前预热连接，避免在开始时刻才进行TCP/TLS握手
+    """
+    # 粘贴的请求头中与连接相关、不能复用的字段
+    SKIP_HEADERS = ("host", "content-length", "connection")
+
+    def __init__(self, base_url=BASE_URL, headers=None, pool_size=4):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.headers = {}
+        self.tracer = None
+        # 录制请求的写入器和回放用的传输层，见enable_record和enable_replay
+        self.recorder = None
+        self.replay = None
+        self.warmed = False
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._settings = {}
+        if headers:
+            self.set_headers(headers)
+
+    @property
+    def session(self):
+        """共享会话，第一次使用时才导入requests并创建"""
+        if self._session is None:
+            # preload的后台线程和第一个请求可能同时到这里，只创建一次
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        with PROFILER.span("导入requests并创建会话"):
+            from transport import Qun100Adapter, TracedSession
+            session = TracedSession()
+            adapter = self.replay or Qun100Adapter(pool_connections=2, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.headers)
+            session.tracer = self.tracer
+            session.recorder = self.recorder
+            return session
+
+    def preload(self):
+        """在后台线程中导入requests，与读取配置等本地工作并行"""
+        threading.Thread(target=lambda: self.session, daemon=True).start()
+
+    def set_headers(self, headers):
+        """设置会话请求头
+        Args:
+            headers: 用户粘贴解析得到的请求头字典
+        """
+        for key, value in headers.items():
+            if key.lower() not in self.SKIP_HEADERS:
+                self.headers[key] = value
+        if self._session is not None:
+            self._session.headers.update(self.headers)
+
+    def enable_trace(self, path):
+        """开启请求计时记录
+        Args:
+            path: JSONL记录文件路径
+        """
+        self.tracer = Tracer(path)
+        if self._session is not None:
+            self._session.tracer = self.tracer
+
+    def enable_record(self, path):
+        """录制之后的每个请求和响应，认证信息替换为<redacted>
+        Args:
+            path: JSONL录制文件路径，已有的内容会被覆盖
+        """
+        self.recorder = Tracer(path, "w")
+        if self._session is not None:
+            self._session.recorder = self.recorder
+
+    def enable_replay(self, path, scale=1.0):
+        """不再联网，按录制文件回放响应
+        Args:
+            path: enable_record录制的JSONL文件
+            scale: 时间比例，见ReplayAdapter
+        Returns:
+            ReplayAdapter: 回放传输层，form_id为录制中的表单ID
+        """
+        from transport import ReplayAdapter
+        self.replay = ReplayAdapter(path, scale, SERVER_TZ)
+        self.base_url = self.replay.base_url
+        if self._session is not None:
+            self._session.mount("https://", self.replay)
+            self._session.mount("http://", self.replay)
+        return self.replay
+
+    def spawn(self, pool_size=1):
+        """创建请求头、记录和回放设置相同，但使用独立连接池的客户端"""
+        client = Qun100Client(self.base_url, headers=self.headers, pool_size=pool_size)
+        client.tracer, client.recorder, client.replay = self.tracer, self.recorder, self.replay
+        return client
+
+    def close(self):
+        """关闭会话，写完尚未写入的计时记录和录制"""
+        if self.tracer:
+            self.tracer.close()
+            self.tracer = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def get(self, path, form_id, **kwargs):
+        """发送GET请求
+        Args:
+            path: 以/开头的接口路径
+            form_id: 表单ID，用于Client-Form-Id请求头
+        Returns:
+            response: requests响应对象
+        """
+        return self.session.get(self.base_url + path, headers={"Client-Form-Id": form_id}, **kwargs)
+
+    def post(self, path, form_id, **kwargs):
+        """发送POST请求，参数同get"""
+        headers = kwargs.pop("headers", None) or {}
+        headers["Client-Form-Id"] = form_id
+        return self.session.post(self.base_url + path, headers=headers, **kwargs)
+
+    def prepare_post(self, path, form_id, headers=None):
+        """预先构建POST请求模板
+        合并会话请求头、Cookie等工作只做一次，之后每次发送只替换请求体
+        Args:
+            path: 以/开头的接口路径
+            form_id: 表单ID
+            headers: 额外的请求头
+        Returns:
+            request: 不含请求体的requests.PreparedRequest
+        """
+        import requests
+        headers = dict(headers or {})
+        headers["Client-Form-Id"] = form_id
+        return self.session.prepare_request(requests.Request("POST", self.base_url + path, headers=headers))
+
+    def send(self, request, body, **kwargs):
+        """以预先构建的请求模板发送请求
+        Args:
+            request: prepare_post返回的请求模板
+            body: 已编码的请求体
+        Returns:
+            response: requests响应对象
+        """
+        request = request.copy()
+        request.body = body
+        request.headers["Content-Length"] = str(len(body))
+        settings = self._settings.get(request.url)
+        if settings is None:
+            # 代理等环境设置按URL缓存，只在第一次发送时读取
+            settings = self.session.merge_environment_settings(request.url, {}, None, None, None)
+            self._settings[request.url] = settings
+        return self.session.send(request, **settings, **kwargs)
+
+    def pin_hosts(self, timeout=WARMUP_LEAD / 2):
+        """解析服务器主机名并固定最快的地址，开始时新建连接不再经过系统解析
+        Args:
+            timeout: 每个地址的连接超时（秒）
+        Returns:
+            str: 固定的地址，回放或失败时返回None
+        """
+        if self.replay:
+            return None
+        from transport import PINS
+        parsed = urlparse(self.base_url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        try:
+            address, elapsed = PINS.pin(parsed.hostname, port, timeout)
+        except OSError as e:
+            RENDERER.log(f"\n地址固定失败，继续使用系统解析: {str(e)}", "yellow")
+            return None
+        count = len(PINS.pinned[parsed.hostname])
+        if address != parsed.hostname:
+            RENDERER.log(f"\n✓ 已固定 {parsed.hostname} → {address}"
+                         f"{f'（{count}个地址中最快）' if count > 1 else ''}，连接{elapsed * 1000:.0f}ms", "green")
+        return address
+
+    def warm_up(self, form_id):
+        """预热连接
+        提前请求一次表单信息，建立并保持TCP/TLS连接，
+        之后的提交直接复用该连接，只需一次往返
+        Args:
+            form_id: 表单ID
+        Returns:
+            form_data: 预热时顺带获取的表单信息，失败返回None
+        """
+        start = time.perf_counter()
+        try:
+            form_data = get_form_profile(form_id, verbose=False)
+        except Exception as e:
+            form_data = None
+            RENDERER.log(f"\n连接预热失败: {str(e)}", "red")
+        self.warmed = form_data is not None
+        if self.warmed:
+            RENDERER.log(f"\n✓ 连接已预热 ({(time.perf_counter() - start) * 1000:.0f}ms)", "green")
+        return form_data
+
+CLIENT = Qun100Client()
+
+class FormVersionCache:
+    """表单版本号缓存
+    提交时只需要表单版本号，不必每次都重新获取表单信息，
+    只有服务器返回版本冲突或缓存超过有效期时才重新获取
+    """
+    def __init__(self, form_id, ttl=VERSION_TTL):
+        self.form_id = form_id
+        self.ttl = ttl
+        self.version = None
+        self.updated_at = 0.0
+
+    def set(self, version):
+        """写入版本号并重新计算有效期"""
+        self.version = version
+        self.updated_at = time.monotonic()
+
+    def invalidate(self):
+        """使缓存失效，下次读取时重新获取"""
+        self.version = None
+
+    def expired(self):
+        return self.version is None or time.monotonic() - self.updated_at > self.ttl
+
+    def refresh(self):
+        """重新获取表单版本号
+        在提交循环中调用，网络错误不抛出，由调用方按网络错误退避后重试
+        Returns:
+            version: 最新版本号，获取失败返回None
+        """
+        try:
+            form_data = get_form_profile(self.form_id, verbose=False)
+        except Exception:
+            return None
+        if not form_data:
+            return None
+        self.set(form_data.get("version", 1))
+        return self.version
+
+    def get(self):
+        """读取版本号，缓存失效时自动刷新
+        Returns:
+            version: 版本号，获取失败返回None
+        """
+        if self.expired():
+            return self.refresh()
+        return self.version
+
+def parse_begin_time(begin_time):
+    """把表单开始时间解析为时间戳
+    Args:
+        begin_time: 形如 2024-09-01 14:00:00 的北京时间字符串
+    Returns:
+        float: Unix时间戳（秒）
+    """
+    return datetime.strptime(begin_time, "%Y-%m-%d %H:%M:%S").replace(tzinfo=SERVER_TZ).timestamp()
+
+class ClockSync:
+    """服务器时钟同步
+    用NTP的方式估计本地时钟与服务器时钟的偏差：每次采样记录请求的发出和收到时间，
+    服务器在这段时间内的某一时刻生成了Date响应头。Date只精确到秒，
+    所以每次采样得到的是偏差的一个区间，后续采样安排在预测的服务器整秒附近，
+    每次采样区间大约减半，最终得到偏差和误差范围
+    """
+    def __init__(self, form_id, samples=6):
+        self.form_id = form_id
+        self.samples = samples
+        # 服务器时间 = 本地时间 + offset
+        self.offset = 0.0
+        self.error = None
+        self.rtt = 0.0
+
+    def sample(self):
+        """采样一次
+        Returns:
+            (t0, t1, date): 请求发出时间、收到响应时间、服务器Date时间戳
+        """
+        t0 = time.time()
+        response = CLIENT.get(f"/v1/form/{self.form_id}/profile", self.form_id)
+        t1 = time.time()
+        date = parsedate_to_datetime(response.headers["Date"]).timestamp()
+        return t0, t1, date
+
+    def sync(self, deadline=None):
+        """多次采样估计时钟偏差
+        Args:
+            deadline: 本地时间戳，采样不会超过该时间
+        Returns:
+            bool: 是否同步成功
+        """
+        low, high = float("-inf"), float("inf")
+        rtts = []
+        for i in range(self.samples):
+            if rtts:
+                # 让下一次请求到达服务器的时刻落在预测的服务器整秒上
+                estimate = (low + high) / 2
+                boundary = int(time.time() + estimate) + 1
+                wait = boundary - estimate - min(rtts) / 2 - time.time()
+                if deadline is not None and time.time() + wait + min(rtts) > deadline:
+                    break
+                time.sleep(max(wait, 0))
+            try:
+                t0, t1, date = self.sample()
+            except Exception as e:
+                RENDERER.log(f"时钟同步采样失败: {str(e)}", "red")
+                continue
+            rtts.append(t1 - t0)
+            # 服务器在[t0, t1]内的某一时刻生成Date，且Date向下取整到秒
+            sample_low, sample_high = date - t1, date + 1 - t0
+            if sample_low > high or sample_high < low:
+                # 与之前的采样矛盾（如请求落到了另一台服务器），从这次重新开始
+                low, high = sample_low, sample_high
+            else:
+                low, high = max(low, sample_low), min(high, sample_high)
+        if not rtts:
+            return False
+        self.offset = (low + high) / 2
+        self.error = (high - low) / 2
+        self.rtt = min(rtts)
+        return True
+
+    def server_time(self, local_time=None):
+        """把本地时间戳换算为服务器时间戳"""
+        return (time.time() if local_time is None else local_time) + self.offset
+
+    def send_time(self, server_time):
+        """计算请求应在何时发出，使其恰好在server_time到达服务器
+        Args:
+            server_time: 服务器时间戳
+        Returns:
+            float: 本地时间戳
+        """
+        return server_time - self.offset - self.rtt / 2
+
+    def launch_time(self, begin):
+        """计算第一次提交的发出时刻
+        偏差只知道在±error之内，按估计值对准开始时刻时请求可能提前到达而被拒绝，
+        因此对准begin + error再加LAUNCH_MARGIN，保证到达时表单已经开放
+        Args:
+            begin: 开始时间（服务器时间戳）
+        Returns:
+            float: 本地时间戳
+        """
+        return self.send_time(begin + (self.error or 0.0) + LAUNCH_MARGIN)
 
 def parse_headers(header_text):
     """解析请求头文本为字典"""
@@ -47,98 +615,554 @@ def get_headers():
     header_text = '\n'.join(lines)
     return parse_headers(header_text)
 
-def get_form_profile(form_id):
+def print_form_profile(form_data):
+    """打印表单的标题、开始时间和结束时间"""
+    print("\n表单详情：")
+    print(f"标题：{form_data.get('title')}")
+    
+    config = form_data.get("config", {})
+    start_time = config.get("actBeginTime")
+    end_time = config.get("actEndTime")
+    print(f"开始时间：{start_time}")
+    print(f"结束时间：{end_time}")
+
+def get_form_profile(form_id, verbose=True, timeout=None):
     """获取表单详细信息
     获取表单的标题、开始时间、结束时间等基本信息
     Args:
         form_id: 表单ID
+        verbose: 是否打印表单详情
+        timeout: 请求超时（秒）
     Returns:
-        form_data: 表单详细信息字典，获取失败返回None
+        form_data: 表单详细信息字典，获取失败返回None，失败原因交给RENDERER显示
     """
-    url = f"{BASE_URL}/v1/form/{form_id}/profile"
-    headers = HEADERS.copy()
-    headers["Client-Form-Id"] = form_id
-    
-    response = requests.get(url, headers=headers)
+    with PROFILER.span("获取表单信息"):
+        response = CLIENT.get(f"/v1/form/{form_id}/profile", form_id, timeout=timeout)
     if response.status_code == 200:
         data = response.json()
         if data.get("code") == 0:
             form_data = data["data"]
-            print("\n表单详情：")
-            print(f"标题：{form_data.get('title')}")
-            
-            config = form_data.get("config", {})
-            start_time = config.get("actBeginTime")
-            end_time = config.get("actEndTime")
-            print(f"开始时间：{start_time}")
-            print(f"结束时间：{end_time}")
-            
+            if verbose:
+                print_form_profile(form_data)
             return form_data
         else:
-            print(f"获取表单详情失败，错误代码：{data.get('code')}")
+            RENDERER.log(f"获取表单详情失败，错误代码：{data.get('code')}", "red")
             return None
     else:
-        print(f"请求失败，状态码：{response.status_code}")
+        RENDERER.log(f"请求失败，状态码：{response.status_code}", "red")
         return None
 
-def get_form_catalog(form_id):
+class CatalogOption:
+    """表单选项"""
+    __slots__ = ("cid", "content", "limit", "question")
+
+    def __init__(self, cid, content, limit, question):
+        self.cid = cid
+        self.content = content
+        # 名额上限，None表示无限制
+        self.limit = limit
+        self.question = question
+
+class CatalogQuestion:
+    """表单问题，选项按内容建立索引"""
+    __slots__ = ("cid", "type", "title", "slot", "options", "options_by_content")
+
+    def __init__(self, cid, type, title, slot):
+        self.cid = cid
+        self.type = type
+        self.title = title
+        # 题目中的上课时段，如14:10-14:50，没有则为None
+        self.slot = slot
+        self.options = []
+        self.options_by_content = {}
+
+    def option(self, content):
+        """按内容查找选项，未找到返回None"""
+        return self.options_by_content.get(content)
+
+    def signature(self):
+        """问题的内容，用于判断目录更新后问题是否变化"""
+        return self.type, self.title, [(o.cid, o.content, o.limit) for o in self.options]
+
+class FormCatalog:
+    """解析后的表单目录
+    接口返回的目录只解析一次，问题和选项按cid、标题关键字、
+    上课时段和选项内容建立索引，之后的查找不再遍历或字符串化原始数据
+    """
+    SLOT_PATTERN = re.compile(r"\d{1,2}:\d{2}-\d{1,2}:\d{2}")
+
+    def __init__(self, catalogs):
+        """
+        Args:
+            catalogs: 接口返回的问题类型目录
+        """
+        self.questions = []
+        self.by_cid = {}
+        self.by_slot = {}
+        self.options = {}
+        self._keywords = {}
+        for catalog in catalogs:
+            self.add(catalog)
+
+    @staticmethod
+    def parse_limit(config):
+        """解析选项的LIMIT配置
+        Returns:
+            int: 名额上限，无限制或无法解析时返回None
+        """
+        try:
+            return int((config or {}).get("LIMIT", {}).get("content"))
+        except (TypeError, ValueError):
+            return None
+
+    def _parse(self, catalog):
+        """从接口返回的问题中取出(cid, 类型, 标题, [(选项cid, 内容, 名额)])"""
+        items = catalog.get("formCatalogs", [])
+        title = next((item.get("content") for item in items if item.get("role") == "TITLE"), "") or ""
+        options = [(item["cid"], item["content"], self.parse_limit(item.get("config"))) for item in items
+                   if item.get("role") == "OPTION" and item.get("content") and item.get("cid")]
+        return catalog.get("cid"), catalog.get("type"), title, options
+
+    def add(self, catalog):
+        """解析并索引一个问题
+        Returns:
+            CatalogQuestion: 解析得到的问题
+        """
+        return self._add_question(*self._parse(catalog))
+
+    def _add_question(self, cid, type, title, options, index=None):
+        match = self.SLOT_PATTERN.search(title)
+        question = CatalogQuestion(cid, type, title, match.group(0) if match else None)
+        for option_cid, content, limit in options:
+            option = CatalogOption(option_cid, content, limit, question)
+            question.options.append(option)
+            question.options_by_content.setdefault(content, option)
+            self.options[option_cid] = option
+        if index is None:
+            self.questions.append(question)
+        else:
+            self.questions.insert(index, question)
+        self.by_cid[cid] = question
+        if question.slot:
+            self.by_slot.setdefault(question.slot, question)
+        self._keywords.clear()
+        return question
+
+    def _remove_question(self, cid):
+        """从所有索引中删除一个问题
+        Returns:
+            int: 问题原来的位置
+        """
+        question = self.by_cid.pop(cid)
+        index = self.questions.index(question)
+        del self.questions[index]
+        for option in question.options:
+            if self.options.get(option.cid) is option:
+                del self.options[option.cid]
+        if question.slot and self.by_slot.get(question.slot) is question:
+            del self.by_slot[question.slot]
+            replacement = next((q for q in self.questions if q.slot == question.slot), None)
+            if replacement:
+                self.by_slot[question.slot] = replacement
+        self._keywords.clear()
+        return index
+
+    def sync(self, catalogs):
+        """按新的目录增量更新，只重建内容有变化的问题的索引
+        Args:
+            catalogs: 接口返回的问题类型目录
+        Returns:
+            list: 新增、修改或删除的问题cid
+        """
+        changed = []
+        # 问题cid在接口返回中的位置
+        seen = {}
+        for catalog in catalogs:
+            cid, type, title, options = self._parse(catalog)
+            seen.setdefault(cid, len(seen))
+            question = self.by_cid.get(cid)
+            if question is not None and question.signature() == (type, title, options):
+                continue
+            index = self._remove_question(cid) if question is not None else None
+            self._add_question(cid, type, title, options, index)
+            changed.append(cid)
+        for question in [q for q in self.questions if q.cid not in seen]:
+            self._remove_question(question.cid)
+            changed.append(question.cid)
+        # 新增的问题追加在末尾，问题也可能被挪动，按接口返回的顺序重排
+        if [q.cid for q in self.questions] != list(seen):
+            self.questions.sort(key=lambda q: seen[q.cid])
+            self.by_slot = {}
+            for question in self.questions:
+                if question.slot:
+                    self.by_slot.setdefault(question.slot, question)
+            self._keywords.clear()
+        return changed
+
+    def find(self, keyword):
+        """查找标题包含关键字的第一个问题，结果按关键字缓存
+        Returns:
+            CatalogQuestion: 未找到返回None
+        """
+        if keyword not in self._keywords:
+            self._keywords[keyword] = next((q for q in self.questions if keyword in q.title), None)
+        return self._keywords[keyword]
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def to_dict(self):
+        """转换为只包含本工具用到字段的紧凑结构，用于磁盘缓存"""
+        return {"questions": [
+            [q.cid, q.type, q.title, [[o.cid, o.content, o.limit] for o in q.options]]
+            for q in self.questions
+        ]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """从to_dict的结果重建目录，不需要再解析原始接口数据"""
+        catalog = cls(())
+        for cid, type, title, options in data["questions"]:
+            catalog._add_question(cid, type, title, options)
+        return catalog
+
+class FormRevalidation(threading.Thread):
+    """后台校验缓存的表单是否过期
+    只请求一次表单信息，版本号变化时才重新获取目录并更新缓存
+    """
+    def __init__(self, cache, form_id, form_data):
+        super().__init__(daemon=True)
+        self.cache = cache
+        self.form_id = form_id
+        self.version = form_data.get("version")
+        self.changed = False
+        self.form_data = form_data
+        self.catalog = None
+
+    def run(self):
+        try:
+            form_data = get_form_profile(self.form_id, verbose=False)
+            if not form_data:
+                return
+            if form_data.get("version") == self.version:
+                # 版本号不变时开始时间等设置也可能被修改，始终使用最新的表单信息
+                if form_data != self.form_data:
+                    self.cache.save_profile(self.form_id, form_data)
+                self.form_data = form_data
+                return
+            catalog = get_form_catalog(self.form_id, verbose=False)
+            if catalog is None:
+                return
+            self.cache.save(self.form_id, form_data, catalog)
+            self.form_data, self.catalog, self.changed = form_data, catalog, True
+        except Exception:
+            # 校验失败时继续使用缓存，开始前预热还会再获取版本号
+            pass
+
+class FormCache:
+    """表单信息磁盘缓存
+    每个表单一个JSON文件，保存表单信息、紧凑的目录和已做好的选择，按表单版本号校验，
+    重启时毫秒级加载，也可以在开放前离线完成选择
+    """
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def path(self, form_id):
+        return os.path.join(self.directory, f"{form_id}.json")
+
+    def load(self, form_id):
+        """读取缓存
+        Returns:
+            dict: 包含profile、catalog(FormCatalog)、selection的缓存，没有缓存返回None
+        """
+        try:
+            with open(self.path(form_id), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            entry["catalog"] = FormCatalog.from_dict(entry["catalog"])
+            if not isinstance(entry["profile"], dict) or "version" not in entry:
+                raise KeyError("profile")
+        except (KeyError, TypeError, ValueError):
+            # 字段缺失或格式不对的缓存当作没有缓存，重新获取后会被覆盖
+            return None
+        return entry
+
+    def _dump(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # 先写临时文件再替换，中途崩溃也不会留下损坏的缓存
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _write(self, form_id, entry):
+        self._dump(self.path(form_id), entry)
+
+    def save(self, form_id, form_data, catalog):
+        """保存表单信息和目录，版本变化后之前保存的选择作废"""
+        self._write(form_id, {
+            "form_id": form_id,
+            "version": form_data.get("version"),
+            "saved_at": time.time(),
+            "profile": form_data,
+            "catalog": catalog.to_dict(),
+            "selection": None,
+        })
+
+    def save_profile(self, form_id, form_data):
+        """只更新缓存中的表单信息，版本号不变时保留目录和已保存的选择"""
+        entry = self.load(form_id)
+        if entry is None:
+            return
+        entry["catalog"] = entry["catalog"].to_dict()
+        entry["profile"] = form_data
+        entry["saved_at"] = time.time()
+        self._write(form_id, entry)
+
+    def save_selection(self, form_id, catalogs, show_questions, preferences=None):
+        """在缓存中保存选择结果和各时段的志愿，重启后可以直接使用"""
+        entry = self.load(form_id)
+        if entry is None:
+            return
+        entry["catalog"] = entry["catalog"].to_dict()
+        entry["selection"] = {"catalogs": catalogs, "show_questions": show_questions,
+                              "preferences": preferences or {}}
+        self._write(form_id, entry)
+
+    @property
+    def links_path(self):
+        return os.path.join(self.directory, "links.json")
+
+    def _load_links(self):
+        try:
+            with open(self.links_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load_link(self, url):
+        """查询短链接已解析出的表单ID，没有记录返回None"""
+        return self._load_links().get(url.strip())
+
+    def save_link(self, url, form_id):
+        """记录短链接对应的表单ID，短链接指向的表单不会改变，记录不过期"""
+        links = self._load_links()
+        links[url.strip()] = form_id
+        self._dump(self.links_path, links)
+
+    def revalidate(self, form_id, form_data):
+        """在后台校验缓存是否过期
+        Returns:
+            FormRevalidation: 已启动的校验线程
+        """
+        revalidation = FormRevalidation(self, form_id, form_data)
+        revalidation.start()
+        return revalidation
+
+FORM_CACHE = FormCache()
+
+# 流式解析时每次读取的字节数
+STREAM_CHUNK = 65536
+_ARRAY_SKIP = re.compile(r"[\s,]*")
+
+def iter_json_array(chunks, key):
+    """流式解析响应中名为key的第一个数组，逐个产出数组元素
+    边接收边解析，内存中只保留当前元素和尚未解析的数据，不构建整个响应的对象树。
+    数组元素应为对象
+    Args:
+        chunks: 响应体的字节块迭代器
+        key: 数组的字段名
+    Yields:
+        dict: 数组中的每个元素
+    Raises:
+        RuntimeError: 响应中没有该数组（如接口返回错误）或响应不完整
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = iter(chunks)
+    buffer = ""
+    # 找到数组的开始位置，之前的内容很短
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        match = marker.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+    else:
+        buffer += text.decode(b"", final=True)
+        try:
+            data = json.loads(buffer)
+        except ValueError:
+            raise RuntimeError("响应格式错误")
+        raise RuntimeError(f"错误代码：{data.get('code')}，{data.get('msg') or data.get('message') or '未知错误'}")
+    
+    pos = 0
+    while True:
+        pos = _ARRAY_SKIP.match(buffer, pos).end()
+        if pos < len(buffer):
+            if buffer[pos] == "]":
+                return
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                yield value
+                continue
+            except ValueError:
+                # 元素还没有接收完整
+                pass
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise RuntimeError("响应不完整")
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = 0
+
+def iter_response_array(response, key):
+    """流式解析requests响应中的数组，结束后关闭响应
+    Args:
+        response: 使用stream=True发出的请求的响应
+        key: 数组的字段名
+    Yields:
+        dict: 数组中的每个元素
+    """
+    try:
+        if response.status_code != 200:
+            # 读完错误响应，连接可以继续复用
+            response.content
+            raise RuntimeError(f"请求失败，状态码：{response.status_code}")
+        yield from iter_json_array(response.iter_content(STREAM_CHUNK), key)
+    finally:
+        response.close()
+
+def get_form_catalog(form_id, verbose=True, timeout=None):
     """获取表单目录信息
     获取表单的所有问题和选项信息
     Args:
         form_id: 表单ID
+        verbose: 是否打印获取结果
+        timeout: 请求超时（秒）
     Returns:
-        list: 问题类型的目录列表，获取失败返回None
+        FormCatalog: 只包含问题类型目录的解析结果，获取失败返回None，失败原因交给RENDERER显示
     """
-    url = f"{BASE_URL}/v1/form/{form_id}/catalog"
-    headers = HEADERS.copy()
-    headers["Client-Form-Id"] = form_id
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        if data.get("code") == 0:
-            print("表单目录获取成功！")
-            catalogs = data["data"].get("catalogs", [])
-            # 只返回问题类型的目录
-            return [c for c in catalogs if c.get("catalogType") == "QUESTION"]
-        else:
-            print(f"获取表单目录失败，错误代码：{data.get('code')}")
+    # 边接收边解析，逐个问题建立索引，不保留原始目录
+    with PROFILER.span("获取并解析目录"):
+        response = CLIENT.get(f"/v1/form/{form_id}/catalog", form_id, stream=True, timeout=timeout)
+        try:
+            catalog = FormCatalog(c for c in iter_response_array(response, "catalogs")
+                                  if c.get("catalogType") == "QUESTION")
+        except Exception as e:
+            RENDERER.log(f"获取表单目录失败，{str(e)}", "red")
             return None
-    else:
-        print(f"请求失败，状态码：{response.status_code}")
-        return None
+    if verbose:
+        print("表单目录获取成功！")
+    return catalog
 
-def get_option_id_from_response(catalog, target_content):
-    """从目录中获取指定选项的ID
+def get_option_id_from_response(question, target_content):
+    """从问题中获取指定选项的ID
     根据选项内容查找对应的选项ID
     Args:
-        catalog: 目录数据
+        question: FormCatalog中的问题
         target_content: 目标选项内容
     Returns:
         str: 选项ID，未找到返回None
     """
-    try:
-        # 获取所有选项类型的条目
-        options = [item for item in catalog.get("formCatalogs", []) if item.get("role") == "OPTION"]
-        # 查找匹配内容的选项
-        for option in options:
-            if option.get("content") == target_content:
-                return option.get("cid")
-    except Exception as e:
-        print(f"获取选项ID时出错: {e}")
-    return None
+    option = question.option(target_content)
+    return option.cid if option else None
+
+def is_senior_class(class_name):
+    """判断是否是10文及以上的班级"""
+    return any(x in class_name for x in ["10文", "10理", "11文", "11理"])
+
+def slot_selectable(question, senior):
+    """判断该班级是否需要在这个时段选课
+    Args:
+        question: 时段问题
+        senior: 是否是10文及以上的班级
+    """
+    return question.slot in ("14:10-14:50", "15:05-15:45") or (question.slot == "15:55-16:35" and not senior)
+
+def resolve_selection(catalog_data, name, class_name, courses):
+    """按内容解析非交互模式的选择
+    班级和课程都按名称匹配，不依赖列表中的编号
+    Args:
+        catalog_data: FormCatalog表单目录
+        name: 姓名
+        class_name: 班级名称
+        courses: {时段或标题关键字: 课程名称或按志愿排序的课程名称列表}
+    Returns:
+        catalogs: 选择的课程列表
+        show_questions: 显示的问题列表
+        preferences: 各时段按志愿排序的课程，见SubmissionPlan
+    Raises:
+        ValueError: 配置与目录不符，消息中列出全部问题
+    """
+    errors = []
+    if not name:
+        errors.append("未填写姓名")
+    class_question = catalog_data.find("学生班级")
+    class_option = class_question.option(class_name) if class_question and class_name else None
+    if class_option is None:
+        choices = "、".join(o.content for o in class_question.options) if class_question else "无"
+        errors.append(f"找不到班级「{class_name}」，可选: {choices}")
+    senior = is_senior_class(class_name or "")
+    
+    chosen = {}
+    for key, contents in courses.items():
+        question = catalog_data.by_slot.get(key) or catalog_data.find(key)
+        if question is None:
+            errors.append(f"找不到时段「{key}」")
+            continue
+        if not slot_selectable(question, senior):
+            errors.append(f"{question.title}: 班级「{class_name}」不能选择此时段的课程")
+            continue
+        ranked = []
+        for content in [contents] if isinstance(contents, str) else contents:
+            option = question.option(content)
+            if option is None:
+                choices = "、".join(o.content for o in question.options)
+                errors.append(f"{question.title} 没有课程「{content}」，可选: {choices}")
+            else:
+                ranked.append(option)
+        if ranked:
+            chosen[question.cid] = ranked
+    for question in catalog_data:
+        if question.type == "RADIO_V2" and question.slot and slot_selectable(question, senior) \
+                and question.cid not in chosen:
+            errors.append(f"{question.title} 未选择课程")
+    if errors:
+        raise ValueError("\n".join(errors))
+    
+    catalogs = []
+    show_questions = []
+    for question in catalog_data:
+        show_questions.append(question.cid)
+        if question.type == "WORD":
+            catalogs.append({"type": "WORD", "cid": question.cid, "value": name})
+        elif question is class_question:
+            catalogs.append({"type": "RADIO_V2", "cid": question.cid,
+                             "value": {"cid": class_option.cid, "customValue": ""}})
+        elif question.cid in chosen:
+            catalogs.append({"type": "RADIO_V2", "cid": question.cid,
+                             "value": {"cid": chosen[question.cid][0].cid, "customValue": ""}})
+    preferences = {cid: [[option.cid, option.content] for option in ranked] for cid, ranked in chosen.items()}
+    return catalogs, show_questions, preferences
 
 def auto_select_choices(catalog_data):
     """自动选择课程
     处理用户输入并自动选择对应的课程
     Args:
-        catalog_data: 表单目录数据
+        catalog_data: FormCatalog表单目录
     Returns:
         catalogs: 选择的课程列表
         show_questions: 显示的问题列表
+        preferences: 各时段按志愿排序的课程，见SubmissionPlan
     """
     catalogs = []
     show_questions = []
+    preferences = {}
     
     # 获取用户输入
     print_colored("\n请输入您的信息：", "cyan", "bold")
@@ -147,49 +1171,42 @@ def auto_select_choices(catalog_data):
     # 显示可选班级
     print_colored("\n可选班级：", "cyan")
     class_options = {}
-    for catalog in catalog_data:
-        if "学生班级" in str(catalog):
-            for option in catalog.get("formCatalogs", []):
-                if option.get("role") == "OPTION":
-                    class_name = option.get("content")
-                    class_id = option.get("cid")
-                    if class_name and class_id:
-                        class_options[len(class_options) + 1] = (class_name, class_id)
-                        print(f"{len(class_options)}. {class_name}")
+    class_question = catalog_data.find("学生班级")
+    for option in class_question.options if class_question else []:
+        class_options[len(class_options) + 1] = (option.content, option.cid)
+        print(f"{len(class_options)}. {option.content}")
     
     class_choice = int(input("\n请选择班级编号: "))
     selected_class = class_options.get(class_choice)
     
     if not selected_class:
         print_colored("无效的班级选择！", "red")
-        return None, None
+        return None, None, None
     
     # 判断是否是10文及以上的班级
-    is_senior_class = any(x in selected_class[0] for x in ["10文", "10理", "11文", "11理"])
+    senior = is_senior_class(selected_class[0])
         
     # 处理每个问题
-    for catalog in catalog_data:
-        catalog_id = catalog.get("cid")
-        show_questions.append(catalog_id)
+    for question in catalog_data:
+        show_questions.append(question.cid)
         
-        if catalog.get("type") == "WORD":
+        if question.type == "WORD":
             # 处理姓名输入
             catalogs.append({
                 "type": "WORD",
-                "cid": catalog_id,
+                "cid": question.cid,
                 "value": name
             })
             print(f"\n✓ 已设置姓名: {name}")
             
-        elif catalog.get("type") == "RADIO_V2":
-            title = next((item.get("content") for item in catalog.get("formCatalogs", []) 
-                        if item.get("role") == "TITLE"), "")
+        elif question.type == "RADIO_V2":
+            title = question.title
             
-            if "学生班级" in title:
+            if question is class_question:
                 # 处理班级选择
                 catalogs.append({
                     "type": "RADIO_V2",
-                    "cid": catalog_id,
+                    "cid": question.cid,
                     "value": {
                         "cid": selected_class[1],
                         "customValue": ""
@@ -198,126 +1215,633 @@ def auto_select_choices(catalog_data):
                 print(f"\n✓ 已选择班级: {selected_class[0]}")
                 
             # 根据班级判断可选课程时段
-            elif "14:10-14:50" in title or "15:05-15:45" in title or (
-                "15:55-16:35" in title and not is_senior_class):
+            elif slot_selectable(question, senior):
                 # 显示该时段可选课程
                 print_colored(f"\n{title}可选课程：", "cyan")
                 course_options = {}
-                for option in catalog.get("formCatalogs", []):
-                    if option.get("role") == "OPTION":
-                        course_name = option.get("content")
-                        course_id = option.get("cid")
-                        if course_name and course_id:
-                            course_options[len(course_options) + 1] = (course_name, course_id)
-                            limit = option.get("config", {}).get("LIMIT", {}).get("content", "无限制")
-                            print(f"{len(course_options)}. {course_name} (限额: {limit}人)")
+                for option in question.options:
+                    course_options[len(course_options) + 1] = (option.content, option.cid)
+                    limit = option.limit if option.limit is not None else "无限制"
+                    print(f"{len(course_options)}. {option.content} (限额: {limit}人)")
                 
                 if course_options:
-                    course_choice = int(input("\n请选择课程编号: "))
-                    selected_course = course_options.get(course_choice)
+                    # 可以按志愿顺序输入多个编号，首选满额后自动改选后面的课程
+                    course_choices = re.split(r"[,，\s]+", input("\n请选择课程编号（可按志愿顺序输入多个，如 3,1,5）: ").strip())
+                    ranked = [course_options.get(int(choice)) for choice in course_choices if choice.isdigit()]
                     
-                    if selected_course:
+                    if ranked and all(ranked):
+                        selected_course = ranked[0]
                         catalogs.append({
                             "type": "RADIO_V2",
-                            "cid": catalog_id,
+                            "cid": question.cid,
                             "value": {
                                 "cid": selected_course[1],
                                 "customValue": ""
                             }
                         })
-                        print(f"✓ 已选择课程: {selected_course[0]}")
+                        preferences[question.cid] = [[cid, content] for content, cid in ranked]
+                        print(f"✓ 已选择课程: {' > '.join(content for content, _ in ranked)}")
                     else:
                         print_colored("无效的课程选择！", "red")
-                        return None, None
-            elif "15:55-16:35" in title and is_senior_class:
+                        return None, None, None
+            elif question.slot == "15:55-16:35" and senior:
                 print_colored(f"\n{title}: 您所在的班级不能选择此时段的课程", "yellow")
     
-    return catalogs, show_questions
+    return catalogs, show_questions, preferences
+
+class FidSequence:
+    """表单提交ID序列
+    以第一次使用时毫秒时间戳的后5位为起点，之后每次加一，
+    同一毫秒内的多次提交也不会重复，一次运行中不会循环
+    """
+    def __init__(self, form_id):
+        self.base = int(form_id)
+        # count的next在GIL下是原子的，多个线程取号不需要加锁
+        self.counter = itertools.count(int(time.time() * 1000) % 100000)
+
+    def next(self):
+        return str(self.base + next(self.counter))
+
+# 每个表单一个提交ID序列
+FID_SEQUENCES = {}
 
 def get_new_fid(form_id):
     """生成新的表单提交ID
-    通过当前时间戳生成一个唯一的表单提交ID，避免重复提交
+    每次尝试使用新的ID；同一次尝试的对冲请求使用同一个ID，服务器按ID去重
     Args:
         form_id: 原始表单ID
     Returns:
         new_fid: 新生成的表单提交ID
     """
-    # 获取毫秒级时间戳
-    timestamp = int(datetime.now().timestamp() * 1000)
-    # 使用时间戳最后5位作为增量，确保每次生成不同的ID
-    increment = int(str(timestamp)[-5:])
-    # 将原始form_id加上增量得到新的ID
-    new_fid = str(int(form_id) + increment)
-    return new_fid
+    sequence = FID_SEQUENCES.get(form_id)
+    if sequence is None:
+        sequence = FID_SEQUENCES.setdefault(form_id, FidSequence(form_id))
+    return sequence.next()
+
+class HedgedSender:
+    """对冲提交
+    提交请求超过delay秒没有响应时，用同一个请求体（同一个fid）再发一个备份请求，
+    先返回的响应作为本次结果，慢的那个在后台读完。同时在途的请求不超过limit个，
+    上一次尝试的慢请求还没有返回时，新的尝试不再对冲，尾延迟下降而不会成倍增加服务器负载
+    """
+    def __init__(self, delay=HEDGE_DELAY, limit=MAX_IN_FLIGHT):
+        """
+        Args:
+            delay: 发出备份请求前等待的秒数，按正常响应的尾延迟设定
+            limit: 同时在途的请求上限，至少为1，为1时不会对冲
+        """
+        self.delay = delay
+        self.limit = max(1, limit)
+        self.slots = threading.BoundedSemaphore(self.limit)
+        self._async_slots = None
+        self._tasks = set()
+        # 发出备份请求的次数和备份先返回的次数
+        self.hedged = 0
+        self.backup_wins = 0
+        # 请求在常驻的后台线程中发送，预热时启动，不在提交时创建线程
+        self.jobs = queue.SimpleQueue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """启动发送线程，asyncio引擎不需要"""
+        with self.lock:
+            while len(self.workers) < self.limit:
+                worker = threading.Thread(target=self._worker, daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def _worker(self):
+        while True:
+            future, request, body = self.jobs.get()
+            try:
+                future.set_result(CLIENT.send(request, body))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.slots.release()
+
+    def _start(self, request, body):
+        from concurrent.futures import Future
+        if len(self.workers) < self.limit:
+            self.start()
+        future = Future()
+        self.jobs.put((future, request, body))
+        return future
+
+    def send(self, request, body):
+        """发送一次提交，必要时对冲，返回最先成功的响应
+        Args:
+            request: prepare_post返回的请求模板
+            body: 已编码的请求体
+        Returns:
+            response: requests响应对象
+        Raises:
+            Exception: 所有请求都失败时抛出第一个错误
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+        self.slots.acquire()
+        primary = self._start(request, body)
+        pending = {primary}
+        if not wait(pending, timeout=self.delay).done and self.slots.acquire(blocking=False):
+            self.hedged += 1
+            pending.add(self._start(request, body))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.backup_wins += 1
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def send_async(self, post):
+        """send的asyncio版本
+        Args:
+            post: 发送一次请求的协程函数，不接受参数
+        Returns:
+            post的返回值，取最先成功的请求
+        """
+        import asyncio
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.limit)
+        slots = self._async_slots
+
+        async def attempt():
+            try:
+                return await post()
+            finally:
+                slots.release()
+
+        await slots.acquire()
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        done, _ = await asyncio.wait(pending, timeout=self.delay)
+        if not done and not slots.locked():
+            await slots.acquire()
+            self.hedged += 1
+            pending.add(asyncio.ensure_future(attempt()))
+        # 慢的请求在后台继续，保留引用直到完成，结束后取走异常避免asyncio报告未处理
+        for task in pending:
+            self._tasks.add(task)
+            task.add_done_callback(self._discard)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        self.backup_wins += 1
+                    return task.result()
+                error = error or task.exception()
+        raise error
+
+    def _discard(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def warm_up(self, form_id):
+        """备份请求走另一个连接，预热时在后台再建立limit-1个连接
+        Returns:
+            list: 预热线程，调用方等待它们结束
+        """
+        self.start()
+        threads = [threading.Thread(target=self._touch, args=(form_id,), daemon=True) for _ in range(self.limit - 1)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    @staticmethod
+    def _touch(form_id):
+        try:
+            CLIENT.get(f"/v1/form/{form_id}/profile", form_id, timeout=WARMUP_LEAD).content
+        except Exception:
+            pass
+
+    def summary(self):
+        return f"{self.hedged}次对冲，备份先返回{self.backup_wins}次"
+
+class PreparedSubmission:
+    """预编译的提交数据
+    提交内容在每次尝试之间只有fid和formVersion会变化，
+    因此只在选课完成后构建并编码一次请求体和请求头，
+    每次提交只需把新的fid和版本号拼接进预编码的字节中
+    """
+    FID_MARK = "__FID__"
+    VERSION_MARK = "__FORM_VERSION__"
+
+    def __init__(self, form_id, catalogs, show_questions):
+        """
+        Args:
+            form_id: 表单ID
+            catalogs: auto_select_choices返回的选择列表
+            show_questions: auto_select_choices返回的问题列表
+        """
+        self.form_id = form_id
+        # 过滤出实际需要显示的问题
+        answered = {c["cid"] for c in catalogs}
+        payload = {
+            "fid": self.FID_MARK,
+            "subscribe": {
+                "qgPso1tQCJF6E-jChXfP9bvtWFqKvN5wvMDFjCop400": 0,
+                "vj0_jH-hZaQ3pSSN_icqYZt5NEZz64vlA8Q3dTfQJ68": 0,
+                "9frpvZ2b6QJAUgG83Xkg8uq9g0JqjqqKJ7B7I33G7jE": 0
+            },
+            "catalogs": catalogs,
+            "showQuestions": [q for q in show_questions if q in answered],
+            "examUsedTime": None,
+            "formVersion": self.VERSION_MARK,
+            "userCommonInfo": {}
+        }
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        # 按占位符把请求体切成三段，fid和版本号拼接在中间
+        head, rest = body.split(json.dumps(self.FID_MARK).encode())
+        middle, tail = rest.split(json.dumps(self.VERSION_MARK).encode())
+        self.parts = (head + b'"', b'"' + middle, tail)
+        self._version = None
+        self._version_bytes = b""
+        self.request = CLIENT.prepare_post(f"/v1/{form_id}/form_data", form_id,
+                                           {"Content-Type": "application/json"})
+
+    def body(self, fid, version):
+        """拼接本次提交的请求体
+        Args:
+            fid: 本次提交ID
+            version: 表单版本号
+        Returns:
+            bytes: 编码后的请求体
+        """
+        if version != self._version:
+            # 版本号很少变化，编码结果缓存起来
+            self._version = version
+            self._version_bytes = json.dumps(version).encode()
+        head, middle, tail = self.parts
+        return b"".join((head, fid.encode(), middle, self._version_bytes, tail))
+
+    def send(self, version, sender=None):
+        """生成新的fid并发送一次提交
+        Args:
+            version: 表单版本号
+            sender: 对冲提交的HedgedSender，None表示直接发送
+        Returns:
+            response: requests响应对象
+        """
+        body = self.body(get_new_fid(self.form_id), version)
+        if sender is not None:
+            return sender.send(self.request, body)
+        return CLIENT.send(self.request, body)
+
+class SubmissionPlan:
+    """按志愿排序的提交方案
+    每个时段可以按顺序填多门课程，所有课程组合在开始前都编码成PreparedSubmission，
+    按志愿序号之和排序，首选组合在前。某门课程满额后，
+    直接切换到不含已满课程的下一个组合，不需要重新选择或重新编码
+    """
+    def __init__(self, form_id, catalogs, show_questions, preferences=None):
+        """
+        Args:
+            form_id: 表单ID
+            catalogs: 首选的选择列表
+            show_questions: 显示的问题列表
+            preferences: {问题cid: [[选项cid, 课程名称], ...]}，按志愿排序，第一项为首选
+        """
+        self.form_id = form_id
+        self.full = set()
+        self.build(catalogs, show_questions, preferences)
+
+    def build(self, catalogs, show_questions, preferences=None):
+        """编码所有组合，表单修改后按新的选择重新编码时也调用
+        已知满额的课程仍然排除，之前因错误信息无法识别而排除的组合重新可用
+        """
+        # 只有填了备选的时段会产生多个组合，只填了一门的时段也记在选择中，名额已满时才能认出
+        slots = [(cid, ranked) for cid, ranked in (preferences or {}).items() if ranked]
+        combos = sorted(itertools.product(*(range(len(ranked)) for _, ranked in slots)),
+                        key=lambda combo: (sum(combo), combo))
+        # [(选择, PreparedSubmission)]，选择为{问题cid: (选项cid, 课程名称)}，包括所有选了课程的时段
+        # 先全部编码再替换，替换前的提交仍使用原来的组合
+        variants = []
+        for combo in combos:
+            choice = {cid: tuple(ranked[i]) for (cid, ranked), i in zip(slots, combo)}
+            variant = [dict(c, value={"cid": choice[c["cid"]][0], "customValue": ""}) if c["cid"] in choice else c
+                       for c in catalogs]
+            variants.append((choice, PreparedSubmission(self.form_id, variant, show_questions)))
+        self.index = 0
+        self.dropped = set()
+        self.variants = variants
+        self._advance()
+
+    @property
+    def current(self):
+        """当前使用的提交数据"""
+        return self.variants[self.index][1]
+
+    def describe(self):
+        """当前组合的课程，如 篮球/书法"""
+        choice = self.variants[self.index][0]
+        return "/".join(content for _, content in choice.values()) or "首选"
+
+    def _advance(self):
+        """切换到第一个可用的组合
+        Returns:
+            bool: 是否还有可用的组合
+        """
+        for index, (choice, _) in enumerate(self.variants):
+            if index not in self.dropped and not any(cid in self.full for cid, _ in choice.values()):
+                self.index = index
+                return True
+        return False
+
+    def mark_full(self, option_cid):
+        """已知某个选项名额已满（如名额监控发现LIMIT已达到）
+        Returns:
+            bool: 是否还有可用的组合
+        """
+        self.full.add(option_cid)
+        return self._advance()
+
+    def fallback(self, reason):
+        """服务器返回名额已满后切换组合
+        错误信息与当前所有已选课程比较：能认出已满的课程时，只排除包含它的组合，
+        其他时段保持原来的志愿，已满的课程没有备选时不再切换；认不出时只排除当前组合
+        Args:
+            reason: 服务器返回的错误信息
+        Returns:
+            bool: 是否还有可用的组合
+        """
+        choice = self.variants[self.index][0]
+        matched = {cid: content for cid, content in choice.values() if content in reason}
+        # 课程名称互相包含时（如 篮球 和 小篮球）只认最长的
+        matched = [cid for cid, content in matched.items()
+                   if not any(content != other and content in other for other in matched.values())]
+        if matched:
+            self.full.update(matched)
+        else:
+            self.dropped.add(self.index)
+        return self._advance()
+
+    def on_decision(self, decision):
+        """名额已满且还有备选时，把停止改为切换组合后立即重试
+        Returns:
+            RetryDecision: 替换后的处理方式
+        """
+        if decision.kind != "full":
+            return decision
+        if not self.fallback(decision.reason):
+            return RetryDecision("full", RetryDecision.STOP, reason=f"{decision.reason}，没有不含已满课程的备选组合")
+        return RetryDecision("full", RetryDecision.RETRY, 0.0, f"{decision.reason}，改用备选: {self.describe()}")
+
+class RetryDecision:
+    """一次提交结果的分类和处理方式"""
+    __slots__ = ("kind", "action", "delay", "reason")
+    
+    # 处理方式
+    DONE = "done"          # 提交成功
+    RETRY = "retry"        # 等待delay秒后重试
+    STOP = "stop"          # 不可恢复，停止提交
+    
+    def __init__(self, kind, action, delay=0.0, reason=""):
+        self.kind = kind
+        self.action = action
+        self.delay = delay
+        self.reason = reason
+    
+    def describe(self):
+        """在尝试日志中显示的处理说明"""
+        if self.action == self.DONE:
+            return f"已提交过，视为成功: {self.reason}" if self.kind == "duplicate" else "提交成功"
+        if self.action == self.STOP:
+            return f"停止提交: {self.reason}"
+        if self.delay <= 0:
+            return f"{self.reason}，立即重试"
+        return f"{self.reason}，{self.delay * 1000:.0f}ms后重试"
+
+class RetryPolicy:
+    """按错误类型决定如何重试
+    不同的失败原因处理方式不同：
+        版本已修改    刷新版本号后立即重试
+        尚未开始      等到预计的开放时刻，已过开放时刻时从很短的间隔开始加倍重试
+        HTTP 5xx/429/网络  指数退避加随机抖动，服务器给出Retry-After时按其等待
+        已提交过      之前的某次提交（如对冲的另一个请求）已被接受，视为成功
+        名额已满/已结束/登录失效/其他4xx  重试没有意义，停止并报告
+    """
+    # 按表单返回的msg关键字分类，顺序即优先级
+    MESSAGE_KINDS = (
+        ("auth", ("登录", "授权", "token")),
+        ("duplicate", ("已提交过", "重复提交", "已经提交")),
+        ("full", ("名额已满", "已满", "人数已达")),
+        ("ended", ("已结束", "已截止", "已关闭")),
+        ("version", ("版本", "修改")),
+        ("not_open", ("尚未开始", "未开始", "还未开始")),
+    )
+    TERMINAL = {"auth": "登录已失效，请更新请求头", "ended": "表单已结束"}
+    # 过了预计的开放时刻多少秒内仍尚未开始时按EARLY_GAP加倍重试，之后说明开始时间有误，按提交间隔重试
+    EARLY_GRACE = 1.0
+    # 宽限期内第一次重试的间隔，连续尚未开始时加倍，不超过提交间隔
+    EARLY_GAP = 0.02
+    
+    def __init__(self, interval=0.1, backoff_cap=BACKOFF_CAP, open_at=None):
+        """
+        Args:
+            interval: 尚未开始和未知错误的重试间隔，也是退避的基数（秒）
+            backoff_cap: 退避的上限（秒）
+            open_at: 预计表单开放、第一次提交发出的本地时间戳，None表示未知
+        """
+        self.interval = interval
+        self.backoff_cap = backoff_cap
+        self.open_at = open_at
+        # 连续的服务器错误次数，用于计算退避
+        self.failures = 0
+        # 宽限期内连续尚未开始的次数
+        self.early = 0
+        self.last = None
+        # 各类结果的次数
+        self.counts = {}
+    
+    def decide(self, kind, action, delay=0.0, reason=""):
+        if kind != "server":
+            self.failures = 0
+        if kind != "not_open":
+            self.early = 0
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.last = RetryDecision(kind, action, delay, reason)
+        return self.last
+    
+    def backoff(self, retry_after=None):
+        """计算服务器错误后的等待时间：全抖动指数退避，服务器要求的更久时以服务器为准"""
+        self.failures += 1
+        delay = random.uniform(0, min(self.backoff_cap, self.interval * 2 ** self.failures))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RETRY_AFTER_CAP))
+        return delay
+    
+    def not_open_delay(self):
+        """尚未开始时的等待时间
+        提交按开始时刻加时钟误差发出，仍被拒绝说明只是略早到达，先等很短的间隔就重试，
+        连续被拒绝时加倍，不会每个往返都发一次请求；还没到预计的开放时刻时等到那一刻
+        """
+        if self.open_at is None:
+            return self.interval
+        wait = self.open_at - time.time()
+        if wait > 0:
+            return wait
+        if -wait >= self.EARLY_GRACE:
+            return self.interval
+        self.early += 1
+        return min(self.interval, self.EARLY_GAP * 2 ** (self.early - 1))
+    
+    def settings(self):
+        """重试策略的说明，显示在提交配置中"""
+        return (f"尚未开始时等到开放时刻，之后从{self.EARLY_GAP * 1000:.0f}ms加倍重试，最长{self.interval:g}秒；"
+                f"服务器错误指数退避，最长{self.backoff_cap:g}秒；版本修改后立即重试")
+
+    @staticmethod
+    def retry_after(headers):
+        """解析Retry-After响应头（秒数或HTTP日期），没有时返回None"""
+        value = headers.get("Retry-After") if headers else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def classify(self, status, data, headers=None):
+        """对一次提交的响应分类
+        Args:
+            status: HTTP状态码
+            data: 解析后的响应JSON，不是JSON时为None
+            headers: 响应头
+        Returns:
+            RetryDecision: 处理方式
+        """
+        data = data if isinstance(data, dict) else {}
+        if status == 200 and data.get("code") == 0:
+            return self.decide("ok", RetryDecision.DONE)
+        if status in (401, 403):
+            return self.decide("auth", RetryDecision.STOP, reason=self.TERMINAL["auth"])
+        if status == 429 or status >= 500:
+            delay = self.backoff(self.retry_after(headers))
+            return self.decide("server", RetryDecision.RETRY, delay, f"服务器繁忙(HTTP {status})")
+        msg = str(data.get("msg") or data.get("message") or "")
+        for kind, keywords in self.MESSAGE_KINDS:
+            if any(keyword in msg for keyword in keywords):
+                break
+        else:
+            kind = None
+        if kind == "duplicate":
+            return self.decide(kind, RetryDecision.DONE, reason=msg)
+        if kind == "full":
+            return self.decide(kind, RetryDecision.STOP, reason=msg)
+        if kind in self.TERMINAL:
+            return self.decide(kind, RetryDecision.STOP, reason=self.TERMINAL[kind])
+        if kind == "version":
+            return self.decide(kind, RetryDecision.RETRY, 0.0, "表单版本已修改，刷新版本号")
+        if kind == "not_open":
+            return self.decide(kind, RetryDecision.RETRY, self.not_open_delay(), "表单尚未开始")
+        if 400 <= status < 500:
+            # 请求本身被拒绝（如参数错误、表单不存在），原样重试不会成功
+            reason = f"请求被拒绝(HTTP {status})" + (f": {msg}" if msg else "")
+            return self.decide("rejected", RetryDecision.STOP, reason=reason)
+        return self.decide("unknown", RetryDecision.RETRY, self.interval, msg or f"HTTP状态码 {status}")
+    
+    def classify_error(self, error):
+        """对网络异常分类，按服务器错误退避"""
+        return self.decide("server", RetryDecision.RETRY, self.backoff(), f"网络错误({type(error).__name__})")
+    
+    def summary(self):
+        """各类结果的次数，如 版本已修改×1 服务器错误×2"""
+        names = {"ok": "成功", "version": "版本已修改", "not_open": "尚未开始", "server": "服务器错误",
+                 "duplicate": "已提交过", "full": "名额已满", "ended": "已结束", "auth": "登录失效",
+                 "rejected": "请求被拒绝", "unknown": "其他错误"}
+        return " ".join(f"{names[kind]}×{count}" for kind, count in self.counts.items())
 
-def submit_form_data(form_id, catalogs, show_questions):
+def submit_form_data(form_id, catalogs, show_questions, version_cache=None, prepared=None, policy=None,
+                     sender=None):
     """提交表单数据
-    处理表单提交，包括获取最新版本、生成提交ID等
+    处理表单提交，包括获取版本号、生成提交ID等，结果通过RENDERER显示
     Args:
         form_id: 表单ID
         catalogs: 选择的课程列表
         show_questions: 显示的问题列表
+        version_cache: 表单版本号缓存，不传则每次提交前重新获取
+        prepared: 预编译的提交数据，不传则每次提交时重新构建
+        policy: 重试策略，提交后policy.last为本次结果的处理方式
+        sender: 对冲提交的HedgedSender，None表示直接发送
     Returns:
         提交成功返回响应数据，失败返回None
     """
-    # 每次提交前重新获取表单信息，确保使用最新版本
-    form_data = get_form_profile(form_id)
-    if not form_data:
-        print_colored("获取表单信息失败", "red")
+    if version_cache is None:
+        version_cache = FormVersionCache(form_id)
+    if policy is None:
+        policy = RetryPolicy()
+    # 使用缓存的版本号，只有版本冲突或过期时才重新获取
+    form_version = version_cache.get()
+    if form_version is None:
+        RENDERER.log("获取表单信息失败", "red")
+        policy.classify_error(ConnectionError("获取表单信息失败"))
         return None
-        
-    # 获取最新的表单版本号，避免版本冲突
-    form_version = form_data.get("version", 1)
-    
-    url = f"{BASE_URL}/v1/{form_id}/form_data"
-    headers = HEADERS.copy()
-    headers["Client-Form-Id"] = form_id
-    
-    # 过滤出实际需要显示的问题
-    filtered_show_questions = [q for q in show_questions if any(c["cid"] == q for c in catalogs)]
-    
-    # 生成新的提交ID
-    new_fid = get_new_fid(form_id)
-    
-    # 构建提交数据
-    payload = {
-        "fid": new_fid,
-        "subscribe": {
-            "qgPso1tQCJF6E-jChXfP9bvtWFqKvN5wvMDFjCop400": 0,
-            "vj0_jH-hZaQ3pSSN_icqYZt5NEZz64vlA8Q3dTfQJ68": 0,
-            "9frpvZ2b6QJAUgG83Xkg8uq9g0JqjqqKJ7B7I33G7jE": 0
-        },
-        "catalogs": catalogs,
-        "showQuestions": filtered_show_questions,
-        "examUsedTime": None,
-        "formVersion": form_version,  # 使用最新版本号
-        "userCommonInfo": {}
-    }
+    
+    if prepared is None:
+        prepared = PreparedSubmission(form_id, catalogs, show_questions)
     
     try:
         # 发送提交请求
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == 0:
-                return data
-            else:
-                error_msg = data.get('msg', '未知错误')
-                print_colored(f"提交失败: {error_msg}", "red")
-                # 如果是版本错误，显示详细信息以便调试
-                if "版本" in error_msg or "修改" in error_msg:
-                    print_colored(f"当前版本: {form_version}", "yellow")
-        else:
-            try:
-                error_data = response.json()
-                print_colored(f"提交失败: {error_data.get('message', '未知错误')}", "red")
-            except:
-                print_colored(f"提交失败: HTTP状态码 {response.status_code}", "red")
-        return None
+        response = prepared.send(form_version, sender)
     except Exception as e:
-        print_colored(f"提交失败: {str(e)}", "red")
+        RENDERER.log(f"提交失败: {str(e)}", "red")
+        policy.classify_error(e)
         return None
+    
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    decision = policy.classify(response.status_code, data, response.headers)
+    if decision.action == RetryDecision.DONE:
+        if decision.kind == "duplicate":
+            RENDERER.log(decision.describe(), "yellow")
+        return data
+    if data and response.status_code == 200:
+        RENDERER.log(f"提交失败: {data.get('msg', '未知错误')}", "red")
+    elif data:
+        RENDERER.log(f"提交失败: {data.get('message', '未知错误')}", "red")
+    else:
+        RENDERER.log(f"提交失败: HTTP状态码 {response.status_code}", "red")
+    if decision.kind == "version":
+        # 显示当前版本并让缓存失效，下次提交前重新获取
+        RENDERER.log(f"当前版本: {form_version}", "yellow")
+        version_cache.invalidate()
+    return None
+
+COLORS = {
+    "red": "91",
+    "green": "92",
+    "yellow": "93",
+    "blue": "94",
+    "purple": "95",
+    "cyan": "96",
+    "white": "97",
+    "gray": "90"
+}
+STYLES = {
+    "normal": "0",
+    "bold": "1",
+    "underline": "4",
+    "dim": "2"
+}
+# 清屏并把光标移到左上角，不需要启动cls/clear子进程
+CLEAR_SCREEN = "\033[H\033[2J\033[3J"
+
+def colorize(text, color="white", style="normal"):
+    """给文本加上颜色和样式的ANSI控制码"""
+    return f"\033[{STYLES[style]};{COLORS[color]}m{text}\033[0m"
 
 def print_colored(text, color="white", style="normal", end="\n"):
     """打印彩色文本
@@ -328,23 +1852,89 @@ def print_colored(text, color="white", style="normal", end="\n"):
         style: 文本样式，支持normal/bold/underline/dim
         end: 结束符，默认换行
     """
-    colors = {
-        "red": "91",
-        "green": "92",
-        "yellow": "93",
-        "blue": "94",
-        "purple": "95",
-        "cyan": "96",
-        "white": "97",
-        "gray": "90"
-    }
-    styles = {
-        "normal": "0",
-        "bold": "1",
-        "underline": "4",
-        "dim": "2"
-    }
-    print(f"\033[{styles[style]};{colors[color]}m{text}\033[0m", end=end, flush=True)
+    print(colorize(text, color, style), end=end, flush=True)
+
+class Renderer(threading.Thread):
+    """终端渲染线程
+    提交和倒计时只把要显示的内容放进队列，由本线程按不超过fps的帧率合并写出，
+    慢终端（SSH、Windows控制台）不会拉长提交间隔。
+    log追加一行，status设置最后一行的临时状态（如倒计时），新的状态覆盖旧的
+    """
+    def __init__(self, fps=20):
+        super().__init__(daemon=True)
+        self.frame = 1 / fps
+        self.queue = queue.Queue()
+        self.status_line = ""
+        self.lock = threading.Lock()
+
+    def _put(self, event):
+        # 第一次使用时才启动线程
+        if not self.is_alive():
+            with self.lock:
+                if not self.is_alive():
+                    self.start()
+        self.queue.put_nowait(event)
+
+    def log(self, text, color="white", style="normal"):
+        """追加一行"""
+        self._put(("log", colorize(text, color, style)))
+
+    def status(self, text, color="white", style="normal"):
+        """设置最后一行的临时状态，空字符串表示清除"""
+        self._put(("status", colorize(text, color, style) if text else ""))
+
+    def clear(self):
+        """清屏"""
+        self._put(("clear", None))
+
+    def flush(self, timeout=1.0):
+        """等待已放入的内容全部写出，之后可以直接print或input"""
+        done = threading.Event()
+        self._put(("flush", done))
+        done.wait(timeout)
+
+    def run(self):
+        while True:
+            events = [self.queue.get()]
+            while True:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.render(events)
+            for kind, value in events:
+                if kind == "flush":
+                    value.set()
+            # 限制帧率，这段时间内的内容合并到下一帧
+            time.sleep(self.frame)
+
+    def render(self, events):
+        """把一帧内的事件合并成一次写入"""
+        lines = []
+        clear = False
+        status = self.status_line
+        for kind, value in events:
+            if kind == "log":
+                lines.append(value)
+            elif kind == "status":
+                status = value
+            elif kind == "clear":
+                clear, lines = True, []
+            elif kind == "flush" and status:
+                # flush之后调用方会直接打印，临时状态不再保留
+                lines.append(status)
+                status = ""
+        if not lines and not clear and status == self.status_line:
+            return
+        out = CLEAR_SCREEN if clear else "\r\033[K"
+        if lines:
+            out += "\n".join(lines) + "\n"
+        out += status
+        self.status_line = status
+        sys.stdout.write(out)
+        sys.stdout.flush()
+
+RENDERER = Renderer()
 
 def print_banner():
     """打印程序标题横幅
@@ -382,72 +1972,1051 @@ def print_success_banner():
     """
     print_colored(success_banner, "green", "bold")
 
-def wait_and_submit(form_id, begin_time, catalogs, show_questions):
-    """等待并提交表单
-    在指定时间自动开始提交表单，直到提交成功
+class LaunchTimer:
+    """高精度发射定时器
+    把目标时间换算到单调时钟上，不受系统时间调整影响。
+    先粗粒度sleep到目标前SPIN_NS，再忙等到目标时刻，
+    释放误差通常在1ms以内，实际释放误差记录在release_error_ns中
+    """
+    def __init__(self, target):
+        """
+        Args:
+            target: 释放时刻的本地时间戳（秒）
+        """
+        self.deadline = 0
+        self.release_error_ns = None
+        # 释放时刻每修改一次加一，等待期间据此判断是否需要重新安排
+        self.generation = 0
+        self._changed = threading.Event()
+        self.set_target(target)
+
+    def set_target(self, target):
+        """修改释放时刻，正在等待的线程会按新时刻继续等待"""
+        # 同时读取系统时间和单调时钟，把目标换算到单调时钟
+        wall_ns = time.time_ns()
+        self.deadline = time.perf_counter_ns() + int(target * 1e9) - wall_ns
+        self.generation += 1
+        self._changed.set()
+
+    def remaining(self):
+        """距离释放时刻还有多少秒"""
+        return (self.deadline - time.perf_counter_ns()) / 1e9
+
+    def wait(self, before=0.0):
+        """等待到释放时刻
+        Args:
+            before: 提前多少秒返回，大于0时只做粗粒度sleep，不忙等
+        Returns:
+            int: 释放误差（纳秒），before大于0时返回None
+        """
+        before_ns = int(before * 1e9)
+        spin_ns = 0 if before_ns else SPIN_NS
+        while True:
+            self._changed.clear()
+            left = self.deadline - before_ns - time.perf_counter_ns()
+            if left <= spin_ns:
+                break
+            self._changed.wait(min((left - spin_ns) / 1e9, 1.0))
+        if before_ns:
+            return None
+        return self._spin()
+
+    async def wait_async(self, before=0.0):
+        """wait的asyncio版本，粗粒度等待期间不阻塞事件循环"""
+        import asyncio
+        before_ns = int(before * 1e9)
+        spin_ns = 0 if before_ns else SPIN_NS
+        while True:
+            left = self.deadline - before_ns - time.perf_counter_ns()
+            if left <= spin_ns:
+                break
+            await asyncio.sleep(min((left - spin_ns) / 1e9, 1.0))
+        if before_ns:
+            return None
+        return self._spin()
+
+    def _spin(self):
+        # 最后一小段忙等，避免sleep唤醒延迟
+        deadline = self.deadline
+        while time.perf_counter_ns() < deadline:
+            pass
+        self.release_error_ns = time.perf_counter_ns() - deadline
+        return self.release_error_ns
+
+class Countdown(threading.Thread):
+    """倒计时显示线程
+    倒计时显示与定时完全分开，只把状态交给RENDERER，不影响释放时刻，
+    临近释放时停止更新，避免与忙等的提交线程争抢
+    """
+    def __init__(self, timer, interval=0.1, quiet=0.3):
+        super().__init__(daemon=True)
+        self.timer = timer
+        self.interval = interval
+        self.quiet = quiet
+        self.stopped = threading.Event()
+
+    def run(self):
+        last = None
+        while not self.stopped.is_set():
+            left = self.timer.remaining()
+            if left <= self.quiet:
+                break
+            seconds = int(left)
+            if seconds != last:
+                if seconds >= 10:
+                    # 10秒及以上显示时分秒格式
+                    RENDERER.status(f"距离开始还有: {seconds//3600:02d}:{(seconds%3600)//60:02d}:{seconds%60:02d}", "cyan")
+                else:
+                    if last is None or last >= 10:
+                        RENDERER.status("")
+                        RENDERER.log("\n=== 倒计时最后10秒 ===", "yellow", "bold")
+                    RENDERER.status(f"{seconds + 1}...", "red")
+                last = seconds
+            self.stopped.wait(min(self.interval, max(left - self.quiet, 0)))
+        if not self.stopped.is_set():
+            RENDERER.status("")
+            RENDERER.log("\n=== 准备开始 ===", "green", "bold")
+
+    def stop(self):
+        self.stopped.set()
+
+class Preflight:
+    """开始前的就绪检查
+    按设定的提前量在时钟同步之前检查：登录是否有效、开始时间和版本号是否变化、
+    准备好的选项cid是否仍在当前目录中，并报告剩余时间和往返耗时。
+    只请求一次表单信息和名单的开头，版本号与缓存相同时直接用缓存的目录核对。
+    整次检查共用一个截止时刻，不超过距发射窗口的时间，每个请求的超时为剩余的时间，
+    过了截止时刻就跳过剩下的请求，检查不会与时钟同步、预热和提交重叠
+    """
+    # 开始前多少秒检查，可通过--preflight修改
+    leads = PREFLIGHT_LEADS
+
+    def __init__(self, form_id, begin_timestamp, catalogs, preferences=None, log=None):
+        """
+        Args:
+            form_id: 表单ID
+            begin_timestamp: 开始时间（服务器时间戳）
+            catalogs: 首选的选择列表
+            preferences: 各时段按志愿排序的课程，见SubmissionPlan
+            log: 输出函数，默认为RENDERER.log
+        """
+        self.form_id = form_id
+        self.begin_timestamp = begin_timestamp
+        self.log = log or RENDERER.log
+        self.set_choices(catalogs, preferences)
+        self.passed = None
+        # 已经检查过的提前量，以及安排检查时释放时刻的版本
+        self.checked = set()
+        self.generation = None
+
+    def set_choices(self, catalogs, preferences=None):
+        """设置需要核对的(问题cid, 选项cid)，包括所有备选"""
+        self.choices = {(c["cid"], c["value"]["cid"]) for c in catalogs
+                        if isinstance(c.get("value"), dict) and c["value"].get("cid")}
+        for question_cid, ranked in (preferences or {}).items():
+            self.choices.update((question_cid, option_cid) for option_cid, _ in ranked)
+
+    def pending(self, remaining):
+        """还来得及进行的检查
+        Args:
+            remaining: 距离开始还有多少秒
+        Returns:
+            list: 从早到晚的提前量，都在时钟同步之前
+        """
+        return sorted((lead for lead in self.leads if CLOCK_SYNC_LEAD < lead < remaining), reverse=True)
+
+    def next_lead(self, timer):
+        """单个表单的引擎中下一次检查的提前量
+        开始时间修改后释放时刻随之变化，已做过的检查作废，按新的开始时间重新安排
+        Args:
+            timer: 引擎的LaunchTimer
+        Returns:
+            float: 提前量，没有需要检查的时返回None
+        """
+        if timer.generation != self.generation:
+            self.generation, self.checked = timer.generation, set()
+        pending = [lead for lead in self.pending(timer.remaining()) if lead not in self.checked]
+        return pending[0] if pending else None
+
+    def due(self, timer, lead):
+        """等到提前量之后调用，记录这次检查
+        Returns:
+            bool: 是否应该检查，等待期间开始时间提前、已错过这次检查时返回False
+        """
+        self.checked.add(lead)
+        return timer.remaining() > lead - 1.0
+
+    def check(self, remaining, headroom=None):
+        """检查一次并报告结果
+        Args:
+            remaining: 距离开始还有多少秒
+            headroom: 距最近的发射窗口还有多少秒，默认为remaining - CLOCK_SYNC_LEAD
+        Returns:
+            bool: 是否通过，来不及检查时返回None
+        """
+        if headroom is None:
+            headroom = remaining - CLOCK_SYNC_LEAD
+        timeout = min(PREFLIGHT_TIMEOUT, headroom)
+        if timeout <= 0:
+            return None
+        problems = []
+        start = time.perf_counter()
+        # requests的超时只限制单次读写，整次检查的用时按截止时刻控制
+        deadline = start + timeout
+        try:
+            response = CLIENT.get(f"/v1/form/{self.form_id}/profile", self.form_id, timeout=timeout)
+            rtt = time.perf_counter() - start
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            decision = RetryPolicy().classify(response.status_code, data, response.headers)
+        except Exception as e:
+            self.log(f"\n✗ 就绪检查失败: 无法访问表单 ({type(e).__name__})，请检查网络", "red", "bold")
+            self.passed = False
+            return False
+        form_data = data.get("data") if decision.kind == "ok" else None
+        if decision.kind == "auth":
+            problems.append(decision.reason)
+        elif not form_data:
+            problems.append(f"获取表单信息失败: {decision.reason or decision.kind}")
+        elif deadline - time.perf_counter() <= 0:
+            problems.append(f"网络过慢，{timeout:.0f}秒内未完成检查，跳过名单和目录核对")
+        else:
+            # 名单接口需要登录，只读到第一个人就断开
+            roster = iter_name_list(self.form_id, timeout=deadline - time.perf_counter())
+            try:
+                next(roster, None)
+            except Exception as e:
+                problems.append(f"名单接口访问失败（{e}），登录可能已失效，请更新请求头")
+            finally:
+                roster.close()
+            problems.extend(self.verify(form_data, deadline))
+        
+        if problems:
+            for problem in problems:
+                self.log(f"\n✗ 就绪检查: {problem}", "red", "bold")
+        else:
+            seconds = int(remaining)
+            self.log(f"\n✓ 就绪检查通过: 登录有效，版本 {form_data.get('version')}，{len(self.choices)}个选项均有效，"
+                     f"距离开始 {seconds//3600:02d}:{(seconds%3600)//60:02d}:{seconds%60:02d}，"
+                     f"往返{rtt * 1000:.0f}ms", "green")
+        self.passed = not problems
+        return self.passed
+
+    def verify(self, form_data, deadline):
+        """核对开始时间，以及准备好的选项是否仍在当前版本的目录中
+        Args:
+            form_data: 刚获取的表单信息
+            deadline: 本次检查的截止时刻（perf_counter），过了截止时刻不再获取目录
+        Returns:
+            list: 发现的问题
+        """
+        problems = []
+        begin_time = form_data.get("config", {}).get("actBeginTime")
+        if begin_time and parse_begin_time(begin_time) != self.begin_timestamp:
+            problems.append(f"开始时间已改为 {begin_time}")
+        version = form_data.get("version")
+        cached = FORM_CACHE.load(self.form_id)
+        if cached and cached["version"] == version:
+            catalog = cached["catalog"]
+        else:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                return problems + ["网络过慢，未在截止时刻前核对表单目录"]
+            try:
+                catalog = get_form_catalog(self.form_id, verbose=False, timeout=timeout)
+            except Exception as e:
+                return problems + [f"获取表单目录失败（{type(e).__name__}）"]
+            if catalog is None:
+                return problems + ["获取表单目录失败"]
+        missing = [option_cid for question_cid, option_cid in self.choices
+                   if option_cid not in catalog.options or catalog.options[option_cid].question.cid != question_cid]
+        if missing:
+            problems.append(f"表单已修改（版本 {version}），{len(missing)}个选项已不在目录中，请重新选择")
+        return problems
+
+class SyncEngine:
+    """阻塞提交引擎
+    在指定时间自动开始提交表单，直到提交成功
+    """
+    def __init__(self, form_id, begin_time, catalogs, show_questions, interval=0.1, preferences=None,
+                 clock=None, label=None, sender=None):
+        """
+        Args:
+            form_id: 表单ID
+            begin_time: 开始时间
+            catalogs: 选择的课程列表
+            show_questions: 显示的问题列表
+            interval: 尚未开始等可重试错误的提交间隔（秒），见RetryPolicy
+            preferences: 各时段按志愿排序的课程，见SubmissionPlan
+            clock: 共用的服务器时钟，不传则单独同步
+            label: 多个表单同时待命时显示在输出前的名称
+            sender: 对冲提交的HedgedSender，多个表单共用时在途上限对所有表单生效
+        """
+        self.form_id = form_id
+        self.sender = sender
+        self.catalogs = catalogs
+        self.show_questions = show_questions
+        self.preferences = preferences or {}
+        self.interval = interval
+        self.label = label
+        # 解析开始时间，按服务器时钟计算请求发出的本地时间
+        self.begin_timestamp = parse_begin_time(begin_time)
+        self.clock = clock or ClockSync(form_id)
+        self.timer = LaunchTimer(self.clock.launch_time(self.begin_timestamp))
+        self.version_cache = FormVersionCache(form_id)
+        # 提交数据只编码一次，循环中只替换fid和版本号，名额已满时切换到预先编码的备选组合
+        self.plan = SubmissionPlan(form_id, catalogs, show_questions, preferences)
+        self.policy = RetryPolicy(interval, open_at=self.clock.launch_time(self.begin_timestamp))
+        self.preflight = Preflight(form_id, self.begin_timestamp, catalogs, preferences, log=self.log)
+        self.submit_count = 0
+        # 每次提交的耗时（秒）
+        self.latencies = []
+        self.result = None
+        self.started = None
+        self.finished = False
+
+    def log(self, text, color="white", style="normal"):
+        """通过RENDERER输出，有名称时加在开头的换行之后"""
+        if self.label:
+            body = text.lstrip("\n")
+            text = f"{text[:len(text) - len(body)]}[{self.label}] {body}"
+        RENDERER.log(text, color, style)
+
+    def retarget(self):
+        """时钟偏差更新后，重新计算请求发出的时刻"""
+        self.policy.open_at = self.clock.launch_time(self.begin_timestamp)
+        self.timer.set_target(self.policy.open_at)
+
+    def sync_clock(self, deadline):
+        """同步服务器时钟并重新计算发出时刻
+        Args:
+            deadline: 本地时间戳，采样不会超过该时间
+        Returns:
+            bool: 是否同步成功
+        """
+        clock = self.clock
+        if not clock.sync(deadline=deadline):
+            self.log("\n时钟同步失败，使用本地时间", "yellow")
+            return False
+        self.log(f"\n✓ 时钟同步完成: 服务器时间比本地{'快' if clock.offset >= 0 else '慢'}"
+                 f"{abs(clock.offset):.3f}秒 (±{clock.error:.3f}秒), 往返{clock.rtt * 1000:.0f}ms", "green")
+        self.retarget()
+        return True
+
+    def warm_up(self):
+        """提前几秒建立连接并缓存版本号，开始时只需一次往返"""
+        CLIENT.pin_hosts()
+        extra = self.sender.warm_up(self.form_id) if self.sender else []
+        form_data = CLIENT.warm_up(self.form_id)
+        if form_data:
+            self.version_cache.set(form_data.get("version", 1))
+        for thread in extra:
+            thread.join(WARMUP_LEAD / 2)
+
+    def fire(self):
+        """等到开始时刻后提交，直到成功或遇到不可恢复的错误
+        Returns:
+            data: 提交成功的响应数据，失败返回None
+        """
+        try:
+            self.timer.wait()
+            return self.submit()
+        finally:
+            self.finished = True
+
+    def run(self):
+        """运行引擎直到提交成功
+        运行期间只通过RENDERER显示，结束时等待显示完成
+        Returns:
+            data: 提交成功的响应数据，失败返回None
+        """
+        try:
+            return self._run()
+        finally:
+            RENDERER.flush()
+
+    def _run(self):
+        timer = self.timer
+        countdown = Countdown(timer)
+        countdown.start()
+        try:
+            while True:
+                lead = self.preflight.next_lead(timer)
+                if lead is None:
+                    break
+                timer.wait(before=lead)
+                if self.preflight.due(timer, lead):
+                    self.preflight.check(timer.remaining())
+            if timer.remaining() > WARMUP_LEAD:
+                # 开始前同步一次服务器时钟，第一次提交按服务器时间到达
+                timer.wait(before=CLOCK_SYNC_LEAD)
+                self.sync_clock(deadline=time.time() + timer.remaining() - WARMUP_LEAD)
+            
+            timer.wait(before=WARMUP_LEAD)
+            self.warm_up()
+            
+            timer.wait()
+        finally:
+            countdown.stop()
+        try:
+            return self.submit()
+        finally:
+            self.finished = True
+
+    def submit(self):
+        """到达开始时间后循环提交
+        Returns:
+            data: 提交成功的响应数据，失败返回None
+        """
+        self.started = datetime.now()
+        self.log("\n=== 开始提交 ===", "green", "bold")
+        self.log(f"释放误差: {self.timer.release_error_ns / 1e6:.3f}ms")
+        
+        # 循环尝试提交，按重试策略决定等待多久，直到成功或遇到不可恢复的错误
+        policy = self.policy
+        while True:
+            self.submit_count += 1
+            self.log(f"\n第 {self.submit_count} 次尝试提交...", "yellow")
+            self.log(f"已运行时间: {datetime.now() - self.started}")
+            start = time.perf_counter()
+            result = submit_form_data(self.form_id, self.catalogs, self.show_questions, self.version_cache,
+                                      self.plan.current, policy, self.sender)
+            self.latencies.append(time.perf_counter() - start)
+            decision = self.plan.on_decision(policy.last)
+            if decision.action == RetryDecision.DONE:
+                self.result = result
+                return result
+            if decision.action == RetryDecision.STOP:
+                self.log(f"✗ {decision.describe()}", "red", "bold")
+                return None
+            self.log(f"→ {decision.describe()}", "gray")
+            if decision.delay > 0:
+                time.sleep(decision.delay)
+
+def start_monitor(engine, interval):
+    """在引擎待命期间启动名单监控
+    Args:
+        engine: 提交引擎
+        interval: 轮询间隔（秒），None表示不监控
+    Returns:
+        RosterMonitor: 已启动的监控线程，不监控时为None
+    """
+    if interval is None:
+        return None
+    monitor = RosterMonitor(engine.form_id, interval, timer=engine.timer, plan=engine.plan)
+    monitor.start()
+    return monitor
+
+def print_submit_summary(engine, pause=True):
+    """提交成功后清屏并显示成功信息
+    Args:
+        engine: 已成功提交的引擎
+        pause: 是否等待按回车键退出
+    """
+    print(CLEAR_SCREEN, end="")
+    print_success_banner()
+    print(f"\n总尝试次数: {engine.submit_count}")
+    print(f"结果分类: {engine.policy.summary()}")
+    if engine.sender:
+        print(f"对冲提交: {engine.sender.summary()}")
+    print(f"总耗时: {datetime.now() - engine.started}")
+    if pause:
+        print_colored("\n按回车键退出程序...", "cyan")
+        input()
+
+def wait_and_submit(form_id, begin_time, catalogs, show_questions, pause=True, preferences=None, monitor=None,
+                    catalog_data=None, version=None, watch=None, sender=None, revalidation=None):
+    """等待并提交表单
+    在指定时间自动开始提交表单，直到提交成功
     Args:
         form_id: 表单ID
         begin_time: 开始时间
         catalogs: 选择的课程列表
         show_questions: 显示的问题列表
+        pause: 成功后是否等待按回车键退出
+        preferences: 各时段按志愿排序的课程，见SubmissionPlan
+        monitor: 名单监控的轮询间隔（秒），None表示不监控
+        catalog_data: 选择时使用的FormCatalog，表单修改后据此重新选择
+        version: 选择时的表单版本号
+        watch: 检查表单修改的间隔（秒），None或0表示不检查
+        sender: 对冲提交的HedgedSender，None表示不对冲
+        revalidation: 使用缓存时后台校验缓存的FormRevalidation，完成后按最新的表单信息更新
     """
-    from datetime import datetime
-    import time
-    
-    # 解析开始时间
-    begin_datetime = datetime.strptime(begin_time, "%Y-%m-%d %H:%M:%S")
-    
     # 显示提交配置信息
     print_colored("\n=== 提交配置 ===", "cyan", "bold")
     print("目标时间:", begin_time)
-    print("提交间隔: 0.1秒")
     print("按 Ctrl+C 可随时停止程序")
     
-    while True:
-        now = datetime.now()
-        if now >= begin_datetime:
-            # 到达开始时间，开始提交
-            print_colored("\n=== 开始提交 ===", "green", "bold")
-            submit_count = 0
-            start_time = datetime.now()
-            
-            # 提交前获取最新表单信息
-            form_data = get_form_profile(form_id)
-            if not form_data:
-                print_colored("获取表单信息失败，请检查网络", "red")
-                return
-                
-            # 循环尝试提交，直到成功
+    with PROFILER.span("构建提交方案"):
+        engine = SyncEngine(form_id, begin_time, catalogs, show_questions, preferences=preferences, sender=sender)
+    print("重试策略:", engine.policy.settings())
+    if len(engine.plan.variants) > 1:
+        print(f"备选组合: {len(engine.plan.variants)}个")
+    if sender:
+        print(f"对冲提交: {sender.delay * 1000:.0f}ms未响应时发出备份，最多{sender.limit}个请求在途")
+    PROFILER.report()
+    roster = start_monitor(engine, monitor)
+    watcher = start_watcher(engine, catalog_data, version, watch, revalidation)
+    try:
+        result = engine.run()
+    finally:
+        if roster:
+            roster.stop()
+        if watcher:
+            watcher.stop()
+    if result:
+        print_submit_summary(engine, pause)
+
+class ScheduleStatus(threading.Thread):
+    """多表单的状态行
+    把每个表单的倒计时或提交进度合并显示在同一行，
+    任一表单临近释放时停止更新，避免与忙等的提交线程争抢
+    """
+    def __init__(self, engines, interval=0.2, quiet=0.3):
+        super().__init__(daemon=True)
+        self.engines = engines
+        self.interval = interval
+        self.quiet = quiet
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def describe(engine):
+        """单个表单的状态，如 [数学] 00:12:03、[物理] 提交中×3、[化学] ✓"""
+        if engine.finished:
+            state = "✓" if engine.result else "✗"
+        elif engine.started:
+            state = f"提交中×{engine.submit_count}"
+        else:
+            seconds = max(int(engine.timer.remaining()), 0)
+            state = f"{seconds//3600:02d}:{(seconds%3600)//60:02d}:{seconds%60:02d}"
+        return f"[{engine.label}] {state}"
+
+    def run(self):
+        last = None
+        while not self.stopped.is_set():
+            if not any(0 < engine.timer.remaining() <= self.quiet for engine in self.engines):
+                text = "  ".join(self.describe(engine) for engine in self.engines)
+                if text != last:
+                    RENDERER.status(text, "cyan")
+                    last = text
+            self.stopped.wait(self.interval)
+        RENDERER.status("")
+
+    def stop(self):
+        self.stopped.set()
+
+class Scheduler:
+    """多表单调度器
+    一个进程同时待命多个开始时间不同的表单。所有表单共用CLIENT的连接池和同一个
+    服务器时钟偏差估计；时钟同步和各表单的预热按时间放进同一个定时堆，
+    由调度线程依次处理。某个表单预热后交给自己的线程精确等待开始时刻并提交，
+    一个表单的重试不会耽误其他表单的释放
+    """
+    def __init__(self, interval=0.1, sender=None):
+        self.interval = interval
+        # 所有表单共用一个HedgedSender，在途上限对整个进程生效
+        self.sender = sender
+        self.clock = None
+        self.engines = []
+        # 定时堆：(服务器时间, 序号, 事件, 引擎, 提前量)，提前量为事件在开始前多少秒
+        self.heap = []
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        # 开始时间变化后唤醒调度线程，按新的堆顶重新等待
+        self.wakeup = threading.Event()
+        self.synced = False
+
+    def add(self, form_id, begin_time, catalogs, show_questions, preferences=None, label=None):
+        """加入一个表单，参数同SyncEngine
+        Returns:
+            SyncEngine: 该表单的提交引擎
+        """
+        if self.clock is None:
+            # 同一个服务器只需要估计一次时钟偏差，用第一个表单的接口采样
+            self.clock = ClockSync(form_id)
+        engine = SyncEngine(form_id, begin_time, catalogs, show_questions, self.interval, preferences,
+                            clock=self.clock, label=label or form_id[-4:], sender=self.sender)
+        self.engines.append(engine)
+        return engine
+
+    def headroom(self):
+        """距最近的发射窗口还有多少秒，有表单正在预热或提交时不大于0"""
+        if any(engine.started and not engine.finished for engine in self.engines):
+            return 0.0
+        waiting = [engine.timer.remaining() for engine in self.engines if not engine.started]
+        return min(waiting) - CLOCK_SYNC_LEAD if waiting else 0.0
+
+    def _push(self, kind, engine, lead):
+        heapq.heappush(self.heap, (engine.begin_timestamp - lead, next(self.seq), kind, engine, lead))
+
+    def _push_sync(self):
+        """在最早一个还来得及同步的表单开始前同步时钟"""
+        pending = [engine for engine in self.engines
+                   if not engine.started and engine.timer.remaining() > WARMUP_LEAD]
+        if pending:
+            self._push("sync", min(pending, key=lambda engine: engine.begin_timestamp), CLOCK_SYNC_LEAD)
+
+    def rearm(self, engine):
+        """某个表单的开始时间变化后，按新的时间重排定时堆并唤醒调度线程
+        该表单的就绪检查按新的开始时间重新安排，已经来不及的不再进行
+        """
+        with self.lock:
+            events = [(kind, other, lead) for _, _, kind, other, lead in self.heap
+                      if kind != "sync" and not (kind == "check" and other is engine)]
+            self.heap = []
+            for kind, other, lead in events:
+                self._push(kind, other, lead)
+            if not engine.started:
+                for lead in engine.preflight.pending(engine.timer.remaining()):
+                    self._push("check", engine, lead)
+            if not self.synced:
+                self._push_sync()
+        self.wakeup.set()
+
+    def _next(self):
+        """等到堆顶事件的时刻后取出
+        Returns:
+            (kind, engine): 事件和对应的表单，堆为空时返回None
+        """
+        while True:
+            self.wakeup.clear()
+            with self.lock:
+                if not self.heap:
+                    return None
+                _, _, kind, engine, lead = self.heap[0]
+                left = engine.timer.remaining() - lead
+                if left <= 0:
+                    heapq.heappop(self.heap)
+                    return kind, engine
+            # 堆中只有同步、检查和预热，不需要忙等；开始时间变化时提前醒来
+            self.wakeup.wait(min(left, 1.0))
+
+    def run(self):
+        """按开始时间依次处理所有表单，直到全部提交结束
+        Returns:
+            list: 各表单的提交结果，顺序与add相同，失败的为None
+        """
+        # 堆中的时间为服务器时间，时钟偏差更新后顺序不变；等待时用对应表单的LaunchTimer换算
+        with self.lock:
+            self._push_sync()
+            for engine in self.engines:
+                for lead in engine.preflight.pending(engine.timer.remaining()):
+                    self._push("check", engine, lead)
+                self._push("warm", engine, WARMUP_LEAD)
+        
+        status = ScheduleStatus(self.engines)
+        status.start()
+        workers = []
+        try:
             while True:
-                submit_count += 1
-                print_colored(f"\n第 {submit_count} 次尝试提交...", "yellow")
-                print(f"已运行时间: {datetime.now() - start_time}")
-                result = submit_form_data(form_id, catalogs, show_questions)
-                if result and result.get("code") == 0:
-                    # 提交成功，清屏并显示成功信息
-                    os.system('cls' if os.name == 'nt' else 'clear')  # 兼容不同操作系统
-                    print_success_banner() 
-                    print(f"\n总尝试次数: {submit_count}")
-                    print(f"总耗时: {datetime.now() - start_time}")
-                    print_colored("\n按回车键退出程序...", "cyan")
-                    input() 
-                    return
-                time.sleep(0.1)  # 提交间隔0.1秒，避免请求过于频繁
+                event = self._next()
+                if event is None:
+                    break
+                kind, engine = event
+                if kind == "check":
+                    # 不能进入任何一个表单的发射窗口
+                    engine.preflight.check(engine.timer.remaining(), self.headroom())
+                elif kind == "sync":
+                    self.synced = True
+                    if engine.sync_clock(deadline=time.time() + engine.timer.remaining() - WARMUP_LEAD):
+                        for other in self.engines:
+                            if not other.started:
+                                other.retarget()
+                else:
+                    engine.warm_up()
+                    worker = threading.Thread(target=engine.fire, daemon=True)
+                    worker.start()
+                    workers.append(worker)
+            for worker in workers:
+                # 分段等待，Ctrl+C可以随时中断
+                while worker.is_alive():
+                    worker.join(0.5)
+        finally:
+            status.stop()
+            RENDERER.flush()
+        return [engine.result for engine in self.engines]
+
+def print_schedule_summary(scheduler):
+    """显示每个表单的提交结果"""
+    print_colored("\n=== 提交结果 ===", "cyan", "bold")
+    for engine in scheduler.engines:
+        if engine.result:
+            print_colored(f"✓ [{engine.label}] 提交成功", "green", "bold")
         else:
-            # 未到开始时间，显示倒计时
-            time_left = begin_datetime - now
-            seconds = int(time_left.total_seconds())
-            if seconds > 10:
-                # 超过10秒显示时分秒格式
-                print_colored(f"\r距离开始还有: {seconds//3600:02d}:{(seconds%3600)//60:02d}:{seconds%60:02d}", color="cyan", end="")
-                time.sleep(0.1)
+            print_colored(f"✗ [{engine.label}] 未成功", "red", "bold")
+        if engine.started:
+            print(f"  尝试次数: {engine.submit_count}  结果分类: {engine.policy.summary()}  "
+                  f"释放误差: {engine.timer.release_error_ns / 1e6:.3f}ms")
+    if scheduler.sender:
+        print(f"对冲提交: {scheduler.sender.summary()}")
+
+def aiohttp_trace_config():
+    """生成记录各阶段耗时的aiohttp TraceConfig
+    记录字典通过trace_request_ctx传入，aiohttp不单独报告TLS握手，包含在connect中
+    """
+    import aiohttp
+    from transport import to_ms
+
+    def mark(name):
+        async def callback(session, context, params):
+            record = context.trace_request_ctx
+            now = time.perf_counter()
+            if name == "start":
+                record["_start"] = now
+            elif name in ("dns", "connect"):
+                record[f"_{name}"] = now
+            elif name in ("dns_end", "connect_end"):
+                key = name[:-4]
+                record[key] = to_ms(now - record.pop(f"_{key}"))
+            elif name == "sent":
+                record["_sent"] = now
+                setup = record.get("dns", 0) + record.get("connect", 0)
+                record["send"] = round((now - record["_start"]) * 1000 - setup, 3)
+                record["reused"] = "connect" not in record
+            elif name == "end" and "_sent" in record:
+                record["ttfb"] = to_ms(now - record["_sent"])
+        return callback
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(mark("start"))
+    config.on_dns_resolvehost_start.append(mark("dns"))
+    config.on_dns_resolvehost_end.append(mark("dns_end"))
+    config.on_connection_create_start.append(mark("connect"))
+    config.on_connection_create_end.append(mark("connect_end"))
+    config.on_request_headers_sent.append(mark("sent"))
+    config.on_request_end.append(mark("end"))
+    return config
+
+def pinned_resolver():
+    """生成使用PINS中固定地址的aiohttp解析器，没有固定的主机交给aiohttp默认的解析器"""
+    import socket
+    from aiohttp.abc import AbstractResolver
+    from aiohttp.resolver import DefaultResolver
+    from transport import PINS
+
+    class PinnedResolver(AbstractResolver):
+        def __init__(self):
+            self.fallback = DefaultResolver()
+
+        async def resolve(self, host, port=0, family=socket.AF_INET):
+            addresses = PINS.pinned.get(host)
+            if not addresses:
+                return await self.fallback.resolve(host, port, family)
+            return [{"hostname": host, "host": address, "port": port,
+                     "family": socket.AF_INET6 if ":" in address else socket.AF_INET,
+                     "proto": 0, "flags": socket.AI_NUMERICHOST} for address in addresses]
+
+        async def close(self):
+            await self.fallback.close()
+
+    return PinnedResolver()
+
+class AsyncEngine:
+    """asyncio提交引擎
+    与wait_and_submit输入相同，使用aiohttp的持久连接提交。
+    调度、响应处理和倒计时是三个独立的任务，显示都交给RENDERER线程，
+    终端慢或查询状态都不会推迟下一次提交
+    """
+    def __init__(self, form_id, begin_time, catalogs, show_questions, interval=0.1, preferences=None, sender=None):
+        self.form_id = form_id
+        self.sender = sender
+        self.catalogs = catalogs
+        self.show_questions = show_questions
+        self.preferences = preferences or {}
+        self.begin_timestamp = parse_begin_time(begin_time)
+        self.interval = interval
+        self.clock = ClockSync(form_id)
+        self.timer = LaunchTimer(self.clock.launch_time(self.begin_timestamp))
+        self.version_cache = FormVersionCache(form_id)
+        self.plan = SubmissionPlan(form_id, catalogs, show_questions, preferences)
+        self.policy = RetryPolicy(interval, open_at=self.clock.launch_time(self.begin_timestamp))
+        self.preflight = Preflight(form_id, self.begin_timestamp, catalogs, preferences)
+        # 复用共享会话合并好的请求头，长度由aiohttp重新计算，各组合的请求头相同
+        self.post_headers = {k: v for k, v in self.plan.current.request.headers.items()
+                             if k.lower() != "content-length"}
+        self.get_headers = dict(CLIENT.session.headers, **{"Client-Form-Id": form_id})
+        self.submit_count = 0
+        # 每次提交的耗时（秒）
+        self.latencies = []
+        self.result = None
+        self.started = None
+        self.results = None
+
+    def emit(self, text, color="white", style="normal"):
+        """把要显示的内容交给渲染线程，事件循环不写终端"""
+        RENDERER.log(text, color, style)
+
+    # 与SyncEngine相同的输出接口，供表单监视使用
+    log = emit
+
+    def retarget(self):
+        """开始时间或时钟偏差变化后，重新计算请求发出的时刻"""
+        self.policy.open_at = self.clock.launch_time(self.begin_timestamp)
+        self.timer.set_target(self.policy.open_at)
+
+    async def fetch_version(self, session):
+        """异步获取表单版本号，顺带建立并保持连接
+        Returns:
+            version: 版本号，获取失败返回None
+        """
+        url = f"{CLIENT.base_url}/v1/form/{self.form_id}/profile"
+        try:
+            status, content, _ = await self.request(session, "GET", url, headers=self.get_headers)
+            data = json.loads(content)
+        except Exception as e:
+            self.emit(f"获取表单信息失败: {str(e)}", "red")
+            return None
+        if data.get("code") != 0:
+            self.emit(f"获取表单详情失败，错误代码：{data.get('code')}", "red")
+            return None
+        self.version_cache.set(data["data"].get("version", 1))
+        return self.version_cache.version
+
+    async def schedule(self, session):
+        """调度任务：同步时钟、预热连接、按时发出每一次提交
+        结束时放入None，通知响应处理任务处理完剩余结果后结束
+        """
+        try:
+            await self.submit_loop(session)
+        finally:
+            self.results.put_nowait(None)
+
+    async def submit_loop(self, session):
+        import asyncio
+        while True:
+            lead = self.preflight.next_lead(self.timer)
+            if lead is None:
+                break
+            await self.timer.wait_async(before=lead)
+            if self.preflight.due(self.timer, lead):
+                # 就绪检查使用阻塞客户端，放到线程中执行
+                await asyncio.to_thread(self.preflight.check, self.timer.remaining())
+        if self.timer.remaining() > WARMUP_LEAD:
+            await self.timer.wait_async(before=CLOCK_SYNC_LEAD)
+            # 时钟同步使用阻塞客户端，放到线程中执行
+            deadline = time.time() + self.timer.remaining() - WARMUP_LEAD
+            if await asyncio.to_thread(self.clock.sync, deadline):
+                self.emit(f"\n✓ 时钟同步完成: 服务器时间比本地{'快' if self.clock.offset >= 0 else '慢'}"
+                          f"{abs(self.clock.offset):.3f}秒 (±{self.clock.error:.3f}秒), 往返{self.clock.rtt * 1000:.0f}ms", "green")
+                self.retarget()
             else:
-                # 最后10秒显示倒计时
-                print_colored(f"\n=== 倒计时最后{seconds}秒 ===", "yellow", "bold")
-                for i in range(seconds, 0, -1):
-                    print_colored(f"\r{i}...", "red", end="")
-                    time.sleep(1)
-                print_colored("\n=== 准备开始 ===", "green", "bold")
+                self.emit("\n时钟同步失败，使用本地时间", "yellow")
+
+        await self.timer.wait_async(before=WARMUP_LEAD)
+        start = time.perf_counter()
+        # 固定地址使用阻塞的解析和连接，放到线程中执行
+        await asyncio.to_thread(CLIENT.pin_hosts)
+        # 对冲时备份请求走另一个连接，同时建立足够的连接
+        extra = [self.fetch_version(session) for _ in range(self.sender.limit - 1)] if self.sender else []
+        version, *_ = await asyncio.gather(self.fetch_version(session), *extra)
+        if version is not None:
+            self.emit(f"\n✓ 连接已预热 ({(time.perf_counter() - start) * 1000:.0f}ms)", "green")
+
+        await self.timer.wait_async()
+        self.started = datetime.now()
+        self.emit("\n=== 开始提交 ===", "green", "bold")
+        self.emit(f"释放误差: {self.timer.release_error_ns / 1e6:.3f}ms")
+
+        url = self.plan.current.request.url
+        policy = self.policy
+        while True:
+            version = self.version_cache.version
+            if self.version_cache.expired():
+                version = await self.fetch_version(session)
+                if version is None:
+                    # 与提交时的网络错误一样退避后重试
+                    decision = policy.classify_error(ConnectionError("获取表单信息失败"))
+                    self.emit(f"→ {decision.describe()}", "gray")
+                    await asyncio.sleep(decision.delay)
+                    continue
+            self.submit_count += 1
+            self.emit(f"\n第 {self.submit_count} 次尝试提交...", "yellow")
+            self.emit(f"已运行时间: {datetime.now() - self.started}")
+            body = self.plan.current.body(get_new_fid(self.form_id), version)
+            start = time.perf_counter()
+            try:
+                if self.sender:
+                    status, content, headers = await self.sender.send_async(
+                        lambda: self.request(session, "POST", url, data=body, headers=self.post_headers))
+                else:
+                    status, content, headers = await self.request(session, "POST", url, data=body,
+                                                                  headers=self.post_headers)
+                self.latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                decision = policy.classify_error(e)
+                await self.results.put((None, str(e), version, decision))
+            else:
+                try:
+                    data = json.loads(content)
+                except ValueError:
+                    data = None
+                # 分类很快，在这里完成，下一次提交的时机取决于结果
+                decision = self.plan.on_decision(policy.classify(status, data, headers))
+                if decision.kind == "version":
+                    self.version_cache.invalidate()
+                await self.results.put((status, data, version, decision))
+            if decision.action != RetryDecision.RETRY:
+                return
+            if decision.delay > 0:
+                await asyncio.sleep(decision.delay)
+            else:
+                # 让出事件循环，让响应处理和界面任务先处理本次结果
+                await asyncio.sleep(0)
+
+    async def request(self, session, method, url, **kwargs):
+        """发送请求并读取响应体，开启记录时写入计时记录
+        Returns:
+            (status, content, headers): HTTP状态码、响应体和响应头
+        """
+        from transport import exchange_record, to_ms
+        tracer, recorder = CLIENT.tracer, CLIENT.recorder
+        if recorder is not None:
+            ts, start = time.time(), time.perf_counter()
+            async with session.request(method, url, **kwargs) as response:
+                content = await response.read()
+            headers = dict(self.get_headers if method == "GET" else self.post_headers, **kwargs.get("headers", {}))
+            recorder.emit(exchange_record(method, url, headers, kwargs.get("data"), response.status,
+                                          response.headers, content, ts, time.perf_counter() - start))
+            return response.status, content, response.headers
+        if tracer is None:
+            async with session.request(method, url, **kwargs) as response:
+                return response.status, await response.read(), response.headers
+        parsed = urlparse(url)
+        record = {"ts": round(time.time(), 6), "method": method, "host": parsed.netloc, "path": parsed.path}
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, trace_request_ctx=record, **kwargs) as response:
+                # 复用连接上的小响应读完后连接已经释放，从响应的协议对象取传输层
+                protocol = response.connection.protocol if response.connection else getattr(response, "_protocol", None)
+                transport = protocol.transport if protocol is not None else None
+                peer = transport.get_extra_info("peername") if transport is not None else None
+                if peer:
+                    record["peer"] = peer[0]
+                content = await response.read()
+        except Exception as e:
+            record["total"] = to_ms(time.perf_counter() - start)
+            record["error"] = f"{type(e).__name__}: {e}"
+            tracer.emit(record)
+            raise
+        record["total"] = to_ms(time.perf_counter() - start)
+        for key in [key for key in record if key.startswith("_")]:
+            del record[key]
+        tracer.finish(record, response.status, content)
+        return response.status, content, response.headers
+
+    async def handle(self):
+        """响应处理任务：显示每次提交的结果和重试策略的处理方式，成功时记录结果"""
+        while True:
+            item = await self.results.get()
+            if item is None:
+                return
+            status, data, version, decision = item
+            if status is None:
+                self.emit(f"提交失败: {data}", "red")
+            elif decision.action == RetryDecision.DONE:
+                self.result = data
+                if decision.kind == "duplicate":
+                    self.emit(decision.describe(), "yellow")
+                continue
+            elif data is None:
+                self.emit(f"提交失败: HTTP状态码 {status}", "red")
+            elif status != 200:
+                self.emit(f"提交失败: {data.get('message', '未知错误')}", "red")
+            else:
+                self.emit(f"提交失败: {data.get('msg', '未知错误')}", "red")
+                if decision.kind == "version":
+                    self.emit(f"当前版本: {version}", "yellow")
+            if decision.action == RetryDecision.STOP:
+                self.emit(f"✗ {decision.describe()}", "red", "bold")
+            else:
+                self.emit(f"→ {decision.describe()}", "gray")
+
+    async def refresh_ui(self):
+        """倒计时任务：每秒更新一次倒计时状态"""
+        import asyncio
+        last = None
+        while not self.started:
+            left = self.timer.remaining()
+            # 临近释放时不再更新倒计时，避免占用事件循环
+            if left <= 0.3:
+                break
+            seconds = int(left)
+            if seconds != last:
+                if seconds >= 10:
+                    RENDERER.status(f"距离开始还有: {seconds//3600:02d}:{(seconds%3600)//60:02d}:{seconds%60:02d}", "cyan")
+                else:
+                    RENDERER.status(f"{seconds + 1}...", "red")
+                last = seconds
+            await asyncio.sleep(min(0.1, max(left - 0.3, 0)))
+        RENDERER.status("")
+
+    async def run(self):
+        """运行引擎直到提交成功
+        Returns:
+            data: 提交成功的响应数据，失败返回None
+        """
+        import asyncio
+        import aiohttp
+        self.results = asyncio.Queue()
+        ui = asyncio.create_task(self.refresh_ui())
+        connector = aiohttp.TCPConnector(limit=max(4, self.sender.limit if self.sender else 0), keepalive_timeout=75,
+                                         resolver=pinned_resolver())
+        trace_configs = [aiohttp_trace_config()] if CLIENT.tracer else []
+        async with aiohttp.ClientSession(connector=connector, trace_configs=trace_configs) as session:
+            tasks = [asyncio.create_task(self.schedule(session)), asyncio.create_task(self.handle())]
+            try:
+                # 调度任务结束时会通知响应处理任务，正常情况下两者都会结束
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    # 任务异常退出时抛出，不要静默结束
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        ui.cancel()
+        # 等待剩余的内容显示完
+        await asyncio.to_thread(RENDERER.flush)
+        return self.result
+
+def async_wait_and_submit(form_id, begin_time, catalogs, show_questions, pause=True, preferences=None, monitor=None,
+                          catalog_data=None, version=None, watch=None, sender=None, revalidation=None):
+    """使用asyncio引擎等待并提交表单，参数同wait_and_submit"""
+    import asyncio
+    try:
+        with PROFILER.span("导入aiohttp"):
+            import aiohttp
+    except ImportError:
+        print_colored("asyncio引擎需要安装aiohttp: pip install aiohttp", "red")
+        return
+    
+    print_colored("\n=== 提交配置 ===", "cyan", "bold")
+    print("目标时间:", begin_time)
+    print("提交引擎: asyncio")
+    print("按 Ctrl+C 可随时停止程序")
+    
+    with PROFILER.span("构建提交方案"):
+        engine = AsyncEngine(form_id, begin_time, catalogs, show_questions, preferences=preferences, sender=sender)
+    print("重试策略:", engine.policy.settings())
+    if len(engine.plan.variants) > 1:
+        print(f"备选组合: {len(engine.plan.variants)}个")
+    if sender:
+        print(f"对冲提交: {sender.delay * 1000:.0f}ms未响应时发出备份，最多{sender.limit}个请求在途")
+    PROFILER.report()
+    # 监控在独立线程中运行，不占用事件循环
+    roster = start_monitor(engine, monitor)
+    watcher = start_watcher(engine, catalog_data, version, watch, revalidation)
+    try:
+        result = asyncio.run(engine.run())
+    finally:
+        if roster:
+            roster.stop()
+        if watcher:
+            watcher.stop()
+    if result:
+        print_submit_summary(engine, pause)
 
 def validate_form_id(form_id):
     try:
@@ -457,37 +3026,79 @@ def validate_form_id(form_id):
     except:
         return False
 
+# 只有该地址的短链接才联网解析，其他链接直接从地址中取表单ID
+SHORT_LINK_HOST = "s.qun100.com/link/"
+# 短链接最多跟随的跳转次数
+MAX_LINK_HOPS = 5
+# 跳转响应体不超过该大小时读完以复用连接，否则直接断开
+LINK_DRAIN_LIMIT = 65536
+
+def form_id_in_url(url):
+    """从URL中取出表单ID，依次查找form_id/fid/id参数和URL中的19位数字
+    Returns:
+        str: 表单ID，没有找到返回None
+    """
+    query_params = parse_qs(urlparse(url).query)
+    for param in ['form_id', 'fid', 'id']:
+        if param in query_params and validate_form_id(query_params[param][0]):
+            return query_params[param][0]
+    match = re.search(r'(\d{19})', url)
+    return match.group(1) if match else None
+
+def resolve_short_link(url, max_hops=MAX_LINK_HOPS):
+    """逐跳解析短链接，某一跳的Location中出现表单ID时立即停止
+    不自动跟随跳转，也不下载最终页面，通常只需要一到两次请求
+    Args:
+        url: 短链接
+        max_hops: 最多请求次数
+    Returns:
+        (form_id, hops): 表单ID和实际请求次数，解析失败时form_id为None
+    """
+    import requests
+    # 使用单独的会话，用户粘贴的Cookie和认证等请求头不会发给短链接和跳转经过的主机
+    with requests.Session() as session:
+        for hop in range(1, max_hops + 1):
+            response = session.get(url, allow_redirects=False, stream=True)
+            try:
+                location = response.headers.get("Location") if response.is_redirect else None
+                if location is None:
+                    return form_id_in_url(response.url), hop
+                length = response.headers.get("Content-Length")
+                if length is not None and int(length) <= LINK_DRAIN_LIMIT:
+                    response.content
+            finally:
+                response.close()
+            url = urljoin(url, location)
+            form_id = form_id_in_url(url)
+            if form_id:
+                return form_id, hop
+    return None, max_hops
+
 def extract_form_id_from_url(url):
+    """从表单链接或短链接中取出表单ID
+    短链接的解析结果保存在本地缓存中，再次运行时不需要联网
+    """
+    with PROFILER.span("解析链接"):
+        return _extract_form_id_from_url(url)
+
+def _extract_form_id_from_url(url):
     try:
-        if "s.qun100.com/link/" in url:
+        form_id = form_id_in_url(url)
+        if not form_id:
+            form_id = FORM_CACHE.load_link(url)
+            if form_id:
+                print_colored("✓ 已从缓存加载短链接", "green")
+        if not form_id and SHORT_LINK_HOST in url:
             print_colored("\n正在解析短链接...", "cyan")
-            response = requests.get(url, allow_redirects=True)
-            if response.status_code == 200:
-                final_url = response.url
-                print("解析成功！")
+            form_id, hops = resolve_short_link(url)
+            if form_id and validate_form_id(form_id):
+                print(f"解析成功！（{hops} 次请求）")
+                FORM_CACHE.save_link(url, form_id)
             else:
                 print_colored("短链接解析失败", "red")
                 return None
-        else:
-            final_url = url
-            
-        # 从URL中提取form_id参数
-        parsed_url = urlparse(final_url)
-        query_params = parse_qs(parsed_url.query)
         
-        # 尝试不同的参数名称
-        form_id = None
-        for param in ['form_id', 'fid', 'id']:
-            if param in query_params:
-                form_id = query_params[param][0]
-                break
-                
-        if not form_id:
-            match = re.search(r'(\d{19})', final_url)
-            if match:
-                form_id = match.group(1)
-        
-        if form_id and validate_form_id(form_id):
+        if validate_form_id(form_id):
             print(f"获取到表单ID: {form_id}")
             return form_id
         else:
@@ -498,58 +3109,809 @@ def extract_form_id_from_url(url):
         print_colored(f"解析链接出错: {str(e)}", "red")
         return None
 
-def get_name_list(form_id):
-    """获取名单完成情况"""
-    url = f"{BASE_URL}/v1/{form_id}/name_list/used"
-    headers = HEADERS.copy()
-    headers["Client-Form-Id"] = form_id
+def iter_name_list(form_id, client=None, timeout=None):
+    """流式获取名单，边接收边产出，只保留用到的字段
+    Args:
+        form_id: 表单ID
+        client: 使用的客户端，默认为共享客户端
+        timeout: 请求超时（秒）
+    Yields:
+        (key, name, completed): 人员标识、姓名、是否已完成
+    Raises:
+        RuntimeError: 请求失败或接口返回错误
+    """
+    response = (client or CLIENT).get(f"/v1/{form_id}/name_list/used", form_id, stream=True, timeout=timeout)
+    for person in iter_response_array(response, "nameList"):
+        name = person.get("name")
+        yield person.get("id") or person.get("uid") or name, name, person.get("status") == 1
+
+def count_name_list(form_id):
+    """统计名单完成情况
+    Returns:
+        (total, completed): 总人数和已完成的姓名列表
+    """
+    total = 0
+    completed = []
+    # 一次遍历统计人数并收集已完成名单
+    for _, name, done in iter_name_list(form_id):
+        total += 1
+        if done:
+            completed.append(name)
+    return total, completed
+
+def print_name_list(total, completed):
+    """显示名单完成情况
+    Returns:
+        bool: 名单为空时返回False
+    """
+    if not total:
+        return False
+    
+    print_colored("\n=== 完成情况统计 ===", "cyan", "bold")
+    print(f"总人数: {total}")
+    print(f"已完成: {len(completed)}")
+    print(f"未完成: {total - len(completed)}")
+    
+    # 打印已完成的名单
+    if completed:
+        print_colored("\n已完成名单:", "green")
+        print("\n".join(f"✓ {name}" for name in completed))
+    return True
+
+class RosterMonitor(threading.Thread):
+    """名单和名额监控线程
+    按较低的频率轮询名单，保存上一次的快照，只报告新完成的人和每分钟完成人数；
+    目录中有各选项已选人数时，报告剩余名额的变化，并把已满的课程告诉提交方案。
+    使用独立的连接，在释放前后的一段时间内不轮询，不会推迟任何一次提交
+    """
+    # 目录选项中表示已选人数的字段，其他含义不明的计数字段不使用，以免误判课程已满
+    USED_KEYS = ("usedCount",)
+    
+    def __init__(self, form_id, interval=MONITOR_INTERVAL, timer=None, plan=None, quiet=(WARMUP_LEAD, 3.0)):
+        """
+        Args:
+            form_id: 表单ID
+            interval: 轮询间隔（秒），不小于MONITOR_MIN_INTERVAL
+            timer: 提交引擎的LaunchTimer，释放前后不轮询
+            plan: 提交方案，发现课程已满时调用mark_full
+            quiet: (释放前, 释放后)多少秒内不轮询
+        """
+        super().__init__(daemon=True)
+        self.form_id = form_id
+        self.interval = max(interval, MONITOR_MIN_INTERVAL)
+        self.timer = timer
+        self.plan = plan
+        self.quiet = quiet
+        self.stopped = threading.Event()
+        # 独立的客户端和连接池，不占用提交使用的连接
+        self.client = CLIENT.spawn()
+        # 上一次的快照：已完成的人和各选项剩余名额
+        self.completed = None
+        self.total = 0
+        self.remaining = {}
+        self.seats = True
+        # 第一次快照的时间和最近一分钟内的(时间, 新完成人数)
+        self.baseline = None
+        self.recent = deque()
+    
+    def quiet_now(self):
+        """是否处于释放前后不轮询的时间段"""
+        if self.timer is None:
+            return False
+        before, after = self.quiet
+        return -after < self.timer.remaining() < before
+    
+    def poll_roster(self, now):
+        """轮询一次名单
+        Returns:
+            str: 变化的描述，没有变化时为None
+        """
+        total = 0
+        completed = {}
+        for key, name, done in iter_name_list(self.form_id, self.client):
+            total += 1
+            if done:
+                completed[key] = name
+        self.total = total
+        if self.completed is None:
+            self.completed = completed
+            self.baseline = now
+            return f"已完成 {len(completed)}/{self.total}"
+        new = [name for key, name in completed.items() if key not in self.completed]
+        self.completed = completed
+        self.recent.append((now, len(new)))
+        while now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        if not new:
+            return None
+        # 按第一次快照以来、最多最近一分钟计算
+        span = (now - max(self.baseline, now - 60)) / 60
+        rate = sum(count for _, count in self.recent) / span
+        shown = "、".join(new[:10]) + (f" 等{len(new)}人" if len(new) > 10 else "")
+        return (f"+{len(new)} {shown} | 已完成 {len(completed)}/{self.total} "
+                f"({len(completed) / max(self.total, 1):.0%}) | {rate:.1f}人/分钟")
+    
+    def poll_seats(self):
+        """轮询一次目录中的已选人数
+        Returns:
+            str: 剩余名额变化的描述，目录不提供人数或没有变化时为None
+        """
+        response = self.client.get(f"/v1/form/{self.form_id}/catalog", self.form_id, stream=True)
+        changes = []
+        found = False
+        for catalog in iter_response_array(response, "catalogs"):
+            for item in catalog.get("formCatalogs", []):
+                used = next((item[key] for key in self.USED_KEYS if isinstance(item.get(key), int)), None)
+                limit = FormCatalog.parse_limit(item.get("config"))
+                if used is None or limit is None:
+                    continue
+                found = True
+                left = max(limit - used, 0)
+                if self.remaining.get(item["cid"]) != left:
+                    self.remaining[item["cid"]] = left
+                    changes.append(f"{item.get('content')} {'已满' if left == 0 else f'剩余{left}'}")
+                    if left == 0 and self.plan is not None and self.plan.mark_full(item["cid"]):
+                        changes[-1] += f"（改用备选: {self.plan.describe()}）"
+        # 目录不提供已选人数时不再请求目录
+        self.seats = found
+        return " | ".join(changes) or None
+    
+    def run(self):
+        while not self.stopped.is_set():
+            if not self.quiet_now():
+                now = time.monotonic()
+                try:
+                    roster = self.poll_roster(now)
+                    if roster:
+                        RENDERER.log(f"[名单 {datetime.now():%H:%M:%S}] {roster}", "blue")
+                    seats = self.poll_seats() if self.seats else None
+                    if seats:
+                        RENDERER.log(f"[名额 {datetime.now():%H:%M:%S}] {seats}", "purple")
+                except Exception as e:
+                    RENDERER.log(f"[名单] 获取失败: {str(e)}", "gray")
+            self.stopped.wait(self.interval)
+        # 共享的记录器由CLIENT关闭
+        self.client.tracer = self.client.recorder = None
+        self.client.close()
+    
+    def stop(self):
+        self.stopped.set()
+
+def locate_question(catalog_data, cid, title, slot):
+    """在修改后的目录中找回原来的问题：先按cid，再按上课时段，最后按完整标题"""
+    question = catalog_data.by_cid.get(cid)
+    if question is None and slot:
+        question = catalog_data.by_slot.get(slot)
+    if question is None:
+        question = next((q for q in catalog_data if q.title == title), None)
+    return question
+
+class FormWatcher(threading.Thread):
+    """表单修改监视线程
+    从待命到发射窗口之前，按较低的频率获取表单信息：开始时间变化时重新设定发射时刻；
+    版本号变化时获取目录，只重建内容有变化的问题的索引，按课程名称重新解析选择，
+    在后台重新编码提交数据。开始时刻使用的提交数据始终是最新的，不需要多一次往返
+    """
+    def __init__(self, engine, catalog_data, version, interval=WATCH_INTERVAL, on_retarget=None, headroom=None,
+                 revalidation=None):
+        """
+        Args:
+            engine: 提交引擎
+            catalog_data: 选择时使用的FormCatalog，修改后在原对象上增量更新
+            version: 选择时的表单版本号
+            interval: 检查间隔（秒），None或0表示只处理revalidation的结果
+            on_retarget: 开始时间变化后的回调，参数为引擎，多表单时用于重排定时堆
+            headroom: 返回距最近的发射窗口还有多少秒的函数，默认只看本表单
+            revalidation: 使用缓存待命时后台校验缓存的FormRevalidation，完成后按它获取的表单信息更新
+        """
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.catalog = catalog_data
+        self.version = version
+        self.interval = interval
+        self.on_retarget = on_retarget
+        self.headroom = headroom or (lambda: engine.timer.remaining() - CLOCK_SYNC_LEAD)
+        self.revalidation = revalidation
+        self.stopped = threading.Event()
+
+    def run(self):
+        engine = self.engine
+        if self.revalidation is not None:
+            self.revalidate()
+        while self.interval:
+            # 最后一次检查在发射窗口前一秒左右，之后由预热和提交时的版本号处理
+            wait = min(self.interval, engine.timer.remaining() - CLOCK_SYNC_LEAD - 1)
+            if wait <= 0 or self.stopped.wait(wait):
+                return
+            headroom = self.headroom()
+            if headroom <= 0:
+                continue
+            try:
+                self.check(min(PREFLIGHT_TIMEOUT, headroom))
+            except Exception as e:
+                engine.log(f"[表单] 检查修改失败: {str(e)}", "gray")
+
+    def revalidate(self):
+        """等待后台校验缓存完成，按最新的表单信息重新设定开始时间或重新选择
+        引擎已经按缓存待命，校验在发射窗口前仍未完成时不再等待
+        """
+        self.revalidation.join(max(self.engine.timer.remaining() - CLOCK_SYNC_LEAD - 1, 0))
+        headroom = self.headroom()
+        if self.revalidation.is_alive() or self.stopped.is_set() or headroom <= 0:
+            return
+        try:
+            self.apply(self.revalidation.form_data, min(PREFLIGHT_TIMEOUT, headroom))
+        except Exception as e:
+            self.engine.log(f"[表单] 按最新的表单信息更新失败: {str(e)}", "gray")
+
+    def stop(self):
+        self.stopped.set()
+
+    def check(self, timeout):
+        """检查一次开始时间和版本号"""
+        form_data = get_form_profile(self.engine.form_id, verbose=False, timeout=timeout)
+        if form_data:
+            self.apply(form_data, timeout)
+
+    def apply(self, form_data, timeout):
+        """按获取到的表单信息处理开始时间和版本号的变化"""
+        engine = self.engine
+        begin_time = form_data.get("config", {}).get("actBeginTime")
+        if begin_time and parse_begin_time(begin_time) != engine.begin_timestamp:
+            engine.begin_timestamp = engine.preflight.begin_timestamp = parse_begin_time(begin_time)
+            engine.retarget()
+            if self.on_retarget:
+                self.on_retarget(engine)
+            engine.log(f"\n⚠️ 开始时间已改为 {begin_time}，已重新设定", "yellow", "bold")
+        version = form_data.get("version")
+        if version != self.version:
+            self.update(form_data, timeout)
+
+    def snapshot(self):
+        """按内容记录当前的选择，目录更新后据此重新解析
+        Returns:
+            list: 与engine.catalogs对应的(问题cid, 标题, 时段, 选项内容或None)
+        """
+        snapshot = []
+        for entry in self.engine.catalogs:
+            question = self.catalog.by_cid.get(entry["cid"])
+            value = entry.get("value")
+            option = self.catalog.options.get(value["cid"]) if isinstance(value, dict) else None
+            snapshot.append((entry["cid"], question.title if question else "", question.slot if question else None,
+                             option.content if option else None))
+        return snapshot
+
+    def update(self, form_data, timeout):
+        """表单版本变化后增量更新目录并重新编码提交数据"""
+        engine = self.engine
+        version = form_data.get("version")
+        snapshot = self.snapshot()
+        response = CLIENT.get(f"/v1/form/{engine.form_id}/catalog", engine.form_id, stream=True, timeout=timeout)
+        changed = self.catalog.sync(c for c in iter_response_array(response, "catalogs")
+                                    if c.get("catalogType") == "QUESTION")
+        previous, self.version = self.version, version
+        engine.version_cache.set(version)
+        if not changed:
+            engine.log(f"\n[表单] 版本 {previous} → {version}，目录没有变化", "gray")
+        else:
+            try:
+                catalogs, show_questions, preferences = self.reselect(snapshot)
+            except ValueError as e:
+                for error in str(e).splitlines():
+                    engine.log(f"\n✗ 表单已修改（版本 {previous} → {version}）: {error}", "red", "bold")
+                engine.log("仍使用原来的选择，请检查后重新运行", "red", "bold")
+                return
+            # 原地重建，名单监控持有的plan引用仍然有效
+            engine.plan.build(catalogs, show_questions, preferences)
+            engine.catalogs, engine.show_questions, engine.preferences = catalogs, show_questions, preferences
+            engine.preflight.set_choices(catalogs, preferences)
+            engine.log(f"\n✓ 表单已修改（版本 {previous} → {version}，{len(changed)}个问题变化），"
+                       f"已按课程名称重新选择并重新编码提交数据", "green", "bold")
+            selected = {entry["cid"] for entry in catalogs}
+            for cid in changed:
+                question = self.catalog.by_cid.get(cid)
+                if question and question.slot and question.type == "RADIO_V2" and cid not in selected:
+                    engine.log(f"⚠️ 新增的问题「{question.title}」没有选择", "yellow")
+        if not CLIENT.replay:
+            FORM_CACHE.save(engine.form_id, form_data, self.catalog)
+            FORM_CACHE.save_selection(engine.form_id, engine.catalogs, engine.show_questions, engine.preferences)
+
+    def reselect(self, snapshot):
+        """按课程名称在更新后的目录中重新解析选择和各时段的志愿
+        Returns:
+            (catalogs, show_questions, preferences)
+        Raises:
+            ValueError: 原来的问题或课程已不存在，消息中列出全部问题
+        """
+        engine = self.engine
+        errors = []
+        catalogs = []
+        preferences = {}
+        for entry, (cid, title, slot, content) in zip(engine.catalogs, snapshot):
+            question = locate_question(self.catalog, cid, title, slot)
+            if question is None:
+                errors.append(f"问题「{title}」已删除")
+                continue
+            if content is None:
+                catalogs.append(dict(entry, cid=question.cid))
+                continue
+            ranked = [option for option in (question.option(c) for _, c in engine.preferences.get(cid, [[None, content]]))
+                      if option is not None]
+            if not ranked:
+                errors.append(f"{question.title} 没有课程「{content}」，可选: "
+                              f"{'、'.join(o.content for o in question.options)}")
+                continue
+            if cid in engine.preferences:
+                preferences[question.cid] = [[option.cid, option.content] for option in ranked]
+            catalogs.append(dict(entry, cid=question.cid, value={"cid": ranked[0].cid, "customValue": ""}))
+        if errors:
+            raise ValueError("\n".join(errors))
+        return catalogs, [question.cid for question in self.catalog], preferences
+
+def start_watcher(engine, catalog_data, version, interval, revalidation=None, **kwargs):
+    """在引擎待命期间启动表单修改监视
+    Args:
+        engine: 提交引擎
+        catalog_data: 选择时使用的FormCatalog，None表示不监视
+        version: 选择时的表单版本号
+        interval: 检查间隔（秒），None或0表示不定期检查
+        revalidation: 后台校验缓存的FormRevalidation，不定期检查时也会处理它的结果
+    Returns:
+        FormWatcher: 已启动的监视线程，不监视时为None
+    """
+    if not (interval or revalidation) or catalog_data is None:
+        return None
+    watcher = FormWatcher(engine, catalog_data, version, interval, revalidation=revalidation, **kwargs)
+    watcher.start()
+    return watcher
+
+def summarize_trace(path):
+    """打印计时记录的分位数统计
+    按接口分组，列出各阶段耗时的p50/p90/p99和返回结果分布
+    Args:
+        path: JSONL记录文件路径
+    """
+    groups = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            path = re.sub(r"\d{19}", "{id}", record["path"])
+            key = f"{record['method']} {path}"
+            groups.setdefault(key, []).append(record)
+    
+    for key, records in groups.items():
+        print_colored(f"\n{key}  共{len(records)}次", "cyan", "bold")
+        print(f"  {'阶段':8s}{'次数':>6s}{'p50':>10s}{'p90':>10s}{'p99':>10s}{'最大':>10s}")
+        for phase in ("dns", "connect", "tls", "send", "ttfb", "total"):
+            values = [r[phase] for r in records if r.get(phase) is not None]
+            if values:
+                print(f"  {phase:10s}{len(values):6d}{percentile(values, 50):10.2f}{percentile(values, 90):10.2f}"
+                      f"{percentile(values, 99):10.2f}{max(values):10.2f}")
+        results = {}
+        for r in records:
+            result = r.get("error") or f"HTTP {r.get('status')} code={r.get('code')} {r.get('msg') or ''}".strip()
+            results[result] = results.get(result, 0) + 1
+        for result, count in sorted(results.items(), key=lambda item: -item[1]):
+            print(f"  {count:6d} × {result}")
+        peers = {}
+        for r in records:
+            if r.get("peer"):
+                peers[r["peer"]] = peers.get(r["peer"], 0) + 1
+        if peers:
+            print("  服务地址: " + "，".join(f"{peer}×{count}" for peer, count in
+                                           sorted(peers.items(), key=lambda item: -item[1])))
+
+def load_config(args):
+    """读取配置文件，命令行参数优先
+    配置文件为JSON，例如：
+    课程可以是按志愿排序的列表，首选满额后自动改选后面的课程
+        {
+            "headers_file": "headers.txt",
+            "form": "https://s.qun100.com/link/xxxx",
+            "name": "张三",
+            "class": "10文1班",
+            "courses": {"14:10-14:50": ["篮球", "足球"], "15:05-15:45": "编程"},
+            "engine": "sync",
+            "preflight": [600, 120]
+        }
+    同时待命多个表单时用forms列出，每项可以单独指定name、class、courses和显示名称label，
+    未指定的使用顶层配置，见run_schedule：
+        {
+            "headers_file": "headers.txt",
+            "name": "张三",
+            "class": "10文1班",
+            "forms": [
+                {"form": "1234567890123456789", "label": "周二", "courses": {"14:10-14:50": "篮球"}},
+                {"form": "https://s.qun100.com/link/xxxx", "label": "周四", "courses": {"15:05-15:45": "编程"}}
+            ]
+        }
+    Returns:
+        dict: 合并后的配置
+    """
+    config = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+    for key, value in (("headers_file", args.headers_file), ("form", args.form),
+                       ("name", args.name), ("class", args.class_name)):
+        if value:
+            config[key] = value
+    courses = dict(config.get("courses") or {})
+    for item in args.course:
+        slot, _, contents = item.partition("=")
+        courses[slot.strip()] = [content.strip() for content in re.split(r"[,，]", contents) if content.strip()]
+    config["courses"] = courses
+    return config
+
+class Prefetch(threading.Thread):
+    """在后台线程中执行一次获取
+    准备阶段互不依赖的请求在共享会话上同时发出，结果和异常在get时取出
+    """
+    def __init__(self, func, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+
+    def get(self, timeout=None):
+        """等待完成并返回结果，获取出错时重新抛出
+        Args:
+            timeout: 最多等待的秒数，None表示一直等待
+        Returns:
+            获取的结果，超时返回None
+        """
+        self.join(timeout)
+        if self.is_alive():
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def prefetch(func, *args, **kwargs):
+    """启动后台获取
+    Returns:
+        Prefetch: 已启动的获取线程
+    """
+    fetch = Prefetch(func, *args, **kwargs)
+    fetch.start()
+    return fetch
+
+def prepare_form(form_id, use_cache=True):
+    """获取表单信息和目录，优先使用缓存
+    使用缓存时不等待校验，直接按缓存待命，校验结果由FormWatcher在待命期间处理
+    Args:
+        form_id: 表单ID
+        use_cache: 是否读写磁盘缓存，回放时不使用
+    Returns:
+        (form_data, catalog_data, revalidation): 获取失败时为(None, None, None)；
+        revalidation为后台校验缓存的FormRevalidation，没有使用缓存时为None
+    """
+    with PROFILER.span("读取缓存"):
+        cached = FORM_CACHE.load(form_id) if use_cache else None
+    if cached:
+        return cached["profile"], cached["catalog"], FORM_CACHE.revalidate(form_id, cached["profile"])
+    # 目录不依赖表单信息，同时获取，到达后边收边解析，总共约一次往返
+    catalog = prefetch(get_form_catalog, form_id, verbose=False)
+    form_data = get_form_profile(form_id, verbose=False)
+    if not form_data:
+        return None, None, None
+    with PROFILER.span("等待目录"):
+        catalog_data = catalog.get()
+    if not catalog_data:
+        return None, None, None
+    if use_cache:
+        FORM_CACHE.save(form_id, form_data, catalog_data)
+    return form_data, catalog_data, None
+
+def run_monitor(form_id, interval):
+    """只监控名单和名额，不提交，按Ctrl+C退出
+    Returns:
+        int: 退出码
+    """
+    print_colored(f"\n=== 名单监控（每{max(interval, MONITOR_MIN_INTERVAL):g}秒，Ctrl+C退出） ===", "cyan", "bold")
+    monitor = RosterMonitor(form_id, interval)
+    monitor.start()
+    try:
+        while monitor.is_alive():
+            monitor.join(1)
+    except KeyboardInterrupt:
+        monitor.stop()
+    return 0
+
+def run_config(args):
+    """非交互模式
+    按配置文件和命令行参数完成全部准备，所有内容先校验，无需任何输入直接待命
+    Returns:
+        int: 退出码
+    """
+    # requests导入较慢，与读取配置并行
+    CLIENT.preload()
+    with PROFILER.span("读取配置"):
+        config = load_config(args)
+    if args.preflight is None and config.get("preflight") is not None:
+        Preflight.leads = tuple(config["preflight"])
+    
+    # 回放时不联网，请求头和表单ID可以省略
+    replay = CLIENT.replay
+    errors = []
+    headers = None
+    if not config.get("headers_file"):
+        if not replay:
+            errors.append("未指定请求头文件 headers_file")
+    else:
+        try:
+            with open(config["headers_file"], encoding="utf-8") as f, PROFILER.span("解析请求头"):
+                headers = parse_headers(f.read())
+        except OSError as e:
+            errors.append(f"无法读取请求头文件: {e}")
+        if headers is not None and not any(key.lower() == "authorization" for key in headers):
+            errors.append("请求头中缺少Authorization")
+    form = str(config.get("form") or (replay.form_id if replay else "") or "").strip()
+    if config.get("forms"):
+        for index, entry in enumerate(config["forms"], 1):
+            entry_form = str(entry.get("form") or "").strip()
+            if not entry_form.startswith("http") and not validate_form_id(entry_form):
+                errors.append(f"第{index}个表单的ID格式错误，应为19位数字或链接")
+    elif not form:
+        errors.append("未指定表单ID或链接 form")
+    elif not form.startswith("http") and not validate_form_id(form):
+        errors.append("表单ID格式错误，应为19位数字")
+    if errors:
+        for error in errors:
+            print_colored(f"❌ {error}", "red")
+        return 1
+    if headers:
+        CLIENT.set_headers(headers)
+    if config.get("forms"):
+        return run_schedule(args, config)
+    
+    form_id = extract_form_id_from_url(form) if form.startswith("http") else form
+    if not form_id:
+        return 1
+    if args.monitor_only:
+        return run_monitor(form_id, args.monitor or MONITOR_INTERVAL)
+    with PROFILER.span("准备表单"):
+        form_data, catalog_data, revalidation = prepare_form(form_id, use_cache=not replay)
+    if not form_data:
+        # 先显示完失败原因
+        RENDERER.flush()
+        print_colored("❌ 获取表单失败，请检查ID和请求头", "red")
+        return 1
+    print_form_profile(form_data)
+    begin_time = form_data.get("config", {}).get("actBeginTime")
+    if not begin_time:
+        print_colored("❌ 无法获取开始时间", "red")
+        return 1
     
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == 0:
-                name_lists = data["data"]
-                if name_lists:
-                    name_list = name_lists[0]["nameList"]
-                    total = len(name_list)
-                    completed = sum(1 for person in name_list if person["status"] == 1)
-                    
-                    print_colored("\n=== 完成情况统计 ===", "cyan", "bold")
-                    print(f"总人数: {total}")
-                    print(f"已完成: {completed}")
-                    print(f"未完成: {total - completed}")
-                    
-                    # 打印已完成的名单
-                    if completed > 0:
-                        print_colored("\n已完成名单:", "green")
-                        for person in name_list:
-                            if person["status"] == 1:
-                                print(f"✓ {person['name']}")
-                    
-                    return True
-            else:
-                print_colored(f"获取名单失败: {data.get('msg', '未知错误')}", "red")
+        with PROFILER.span("选课"):
+            catalogs, show_questions, preferences = resolve_selection(catalog_data, config.get("name"),
+                                                                      config.get("class"), config["courses"])
+    except ValueError as e:
+        for error in str(e).splitlines():
+            print_colored(f"❌ {error}", "red")
+        return 1
+    if not replay:
+        FORM_CACHE.save_selection(form_id, catalogs, show_questions, preferences)
+    
+    print_colored("\n═══ 选择结果 ═══", "cyan", "bold")
+    print_colored(f"✓ 姓名: {config['name']}", "green")
+    print_colored(f"✓ 班级: {config['class']}", "green")
+    for cid, ranked in preferences.items():
+        print_colored(f"✓ {catalog_data.by_cid[cid].title}: {' > '.join(content for _, content in ranked)}", "green")
+    
+    engine_name = config.get("engine") or args.engine
+    if replay and engine_name == "async":
+        # aiohttp不经过requests的传输层，回放只支持阻塞引擎
+        print_colored("回放只支持阻塞引擎，改用sync", "yellow")
+        engine_name = "sync"
+    if args.dry_run:
+        # 只构建引擎确认可以待命，不等待提交
+        with PROFILER.span("构建提交方案"):
+            engine = SyncEngine(form_id, begin_time, catalogs, show_questions, preferences=preferences)
+        if len(engine.plan.variants) > 1:
+            print(f"备选组合: {len(engine.plan.variants)}个")
+        with PROFILER.span("就绪检查"):
+            passed = engine.preflight.check(engine.timer.remaining())
+        RENDERER.flush()
+        PROFILER.report()
+        if passed is False:
+            return 1
+        print_colored("\n✓ 已就绪（--dry-run，不等待提交）", "green", "bold")
+        return 0
+    # 回放时没有录制待命期间的请求，不检查表单修改
+    watch = dict(catalog_data=catalog_data, version=form_data.get("version"), watch=None if replay else args.watch,
+                 sender=hedged_sender(args), revalidation=revalidation)
+    try:
+        if engine_name == "async":
+            async_wait_and_submit(form_id, begin_time, catalogs, show_questions, False, preferences, args.monitor,
+                                  **watch)
         else:
-            print_colored(f"请求失败，状态码: {response.status_code}", "red")
-    except Exception as e:
-        print_colored(f"获取名单时出错: {str(e)}", "red")
+            wait_and_submit(form_id, begin_time, catalogs, show_questions, False, preferences, args.monitor, **watch)
+    except KeyboardInterrupt:
+        print_colored("\n\n⚠️ 程序已停止", "yellow", "bold")
+    return 0
+
+def run_schedule(args, config):
+    """多表单模式
+    依次准备配置中forms列出的每个表单，全部成功后交给Scheduler，
+    在同一个进程中共用连接和时钟待命，各自在开始时间提交
+    Returns:
+        int: 退出码
+    """
+    replay = CLIENT.replay
+    if (config.get("engine") or args.engine) == "async":
+        print_colored("多表单模式只支持阻塞引擎，改用sync", "yellow")
+    scheduler = Scheduler(sender=hedged_sender(args))
+    watched = []
+    form_ids = []
+    for entry in config["forms"]:
+        form = str(entry["form"]).strip()
+        form_id = extract_form_id_from_url(form) if form.startswith("http") else form
+        if not form_id:
+            return 1
+        form_ids.append(form_id)
+    # 各表单互不依赖，同时准备
+    preparations = [prefetch(prepare_form, form_id, use_cache=not replay) for form_id in form_ids]
+    for entry, form_id, preparation in zip(config["forms"], form_ids, preparations):
+        with PROFILER.span("准备表单"):
+            form_data, catalog_data, revalidation = preparation.get()
+        if not form_data:
+            RENDERER.flush()
+            print_colored(f"❌ 获取表单 {form_id} 失败，请检查ID和请求头", "red")
+            return 1
+        label = entry.get("label") or (form_data.get("title") or form_id)[:8]
+        begin_time = form_data.get("config", {}).get("actBeginTime")
+        if not begin_time:
+            print_colored(f"❌ [{label}] 无法获取开始时间", "red")
+            return 1
+        try:
+            with PROFILER.span("选课"):
+                catalogs, show_questions, preferences = resolve_selection(
+                    catalog_data, entry.get("name") or config.get("name"),
+                    entry.get("class") or config.get("class"), entry.get("courses") or config["courses"])
+        except ValueError as e:
+            for error in str(e).splitlines():
+                print_colored(f"❌ [{label}] {error}", "red")
+            return 1
+        if not replay:
+            FORM_CACHE.save_selection(form_id, catalogs, show_questions, preferences)
+        courses = "，".join(" > ".join(content for _, content in ranked) for ranked in preferences.values())
+        print_colored(f"✓ [{label}] {begin_time} 开始: {courses}", "green")
+        with PROFILER.span("构建提交方案"):
+            scheduler.add(form_id, begin_time, catalogs, show_questions, preferences, label)
+        watched.append((catalog_data, form_data.get("version"), revalidation))
     
-    return False
+    if args.dry_run:
+        headroom = min(engine.timer.remaining() for engine in scheduler.engines) - CLOCK_SYNC_LEAD
+        with PROFILER.span("就绪检查"):
+            passed = [engine.preflight.check(engine.timer.remaining(), headroom) for engine in scheduler.engines]
+        RENDERER.flush()
+        PROFILER.report()
+        if False in passed:
+            return 1
+        print_colored(f"\n✓ {len(scheduler.engines)}个表单已就绪（--dry-run，不等待提交）", "green", "bold")
+        return 0
+    print_colored(f"\n=== {len(scheduler.engines)}个表单待命，按 Ctrl+C 可随时停止程序 ===", "cyan", "bold")
+    PROFILER.report()
+    monitors = [start_monitor(engine, args.monitor) for engine in scheduler.engines]
+    # 开始时间变化后重排定时堆；检查避开所有表单的发射窗口
+    monitors += [start_watcher(engine, catalog_data, version, None if replay else args.watch, revalidation,
+                               on_retarget=scheduler.rearm, headroom=scheduler.headroom)
+                 for engine, (catalog_data, version, revalidation) in zip(scheduler.engines, watched)]
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print_colored("\n\n⚠️ 程序已停止", "yellow", "bold")
+        return 0
+    finally:
+        for monitor in monitors:
+            if monitor:
+                monitor.stop()
+    print_schedule_summary(scheduler)
+    return 0
+
+def hedged_sender(args):
+    """按命令行参数创建对冲提交的HedgedSender
+    Returns:
+        HedgedSender: 未开启对冲或回放时为None，录制中没有备份请求，回放时不对冲
+    """
+    if args.hedge is None or CLIENT.replay:
+        return None
+    return HedgedSender(args.hedge / 1000, args.max_in_flight)
+
+def parse_leads(text):
+    """解析逗号分隔的秒数，如 600,120"""
+    return tuple(float(item) for item in re.split(r"[,，]", text) if item.strip())
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="选修课抢课小助手")
+    parser.add_argument("--engine", choices=["sync", "async"], default=ENGINE, help="提交引擎")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get("QUN100_TRACE"),
+                        help="把每个请求的计时记录写入JSONL文件")
+    parser.add_argument("--trace-summary", metavar="FILE", help="打印计时记录的统计后退出")
+    parser.add_argument("--record", metavar="FILE", nargs="?", const="requests.jsonl",
+                        help="录制每个请求和响应（认证信息已替换）到JSONL文件，默认requests.jsonl")
+    parser.add_argument("--replay", metavar="FILE", help="不联网，按录制文件回放响应（需要--config或--name等）")
+    parser.add_argument("--replay-scale", type=float, default=1.0, metavar="X",
+                        help="回放的时间比例，0.5表示两倍速")
+    parser.add_argument("--offline", action="store_true", help="只用缓存的表单信息完成选择并保存，不联网")
+    parser.add_argument("--monitor", type=float, nargs="?", const=MONITOR_INTERVAL, metavar="SECONDS",
+                        help=f"待命期间监控名单和名额变化，默认每{MONITOR_INTERVAL}秒一次")
+    parser.add_argument("--hedge", type=float, nargs="?", const=HEDGE_DELAY * 1000, metavar="MS",
+                        help=f"对冲提交：提交超过MS毫秒未响应时用同一个fid再发一个备份请求，默认{HEDGE_DELAY * 1000:.0f}ms")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, metavar="N",
+                        help=f"对冲提交时同时在途的提交请求上限，默认{MAX_IN_FLIGHT}")
+    parser.add_argument("--monitor-only", action="store_true", help="只监控名单和名额，不提交（需要--form）")
+    parser.add_argument("--watch", type=float, default=WATCH_INTERVAL, metavar="SECONDS",
+                        help=f"待命期间每隔多少秒检查表单是否修改，修改后重新选择并重新编码，默认{WATCH_INTERVAL}，0表示不检查")
+    parser.add_argument("--profile", metavar="FILE", nargs="?", const="startup_profile.json",
+                        default=os.environ.get("QUN100_PROFILE"),
+                        help="记录从启动到待命各阶段的耗时，待命时打印并写入JSON报告，默认startup_profile.json")
+    parser.add_argument("--cprofile", action="store_true", help="启动分析时同时运行cProfile，统计写入报告路径.prof")
+    parser.add_argument("--tracemalloc", action="store_true", help="启动分析时记录各阶段的内存变化")
+    parser.add_argument("--preflight", type=parse_leads, metavar="SECONDS",
+                        help=f"开始前多少秒检查登录和选择是否有效，逗号分隔，默认{','.join(map(str, PREFLIGHT_LEADS))}，"
+                             f"只在开始前{CLOCK_SYNC_LEAD}秒之前检查，空字符串表示不检查")
+    
+    # 非交互模式，见load_config
+    parser.add_argument("--config", metavar="FILE", help="JSON配置文件，指定后不再交互输入")
+    parser.add_argument("--headers-file", metavar="FILE", help="保存请求头的文本文件")
+    parser.add_argument("--form", help="表单ID或短链接")
+    parser.add_argument("--name", help="姓名")
+    parser.add_argument("--class", dest="class_name", help="班级名称")
+    parser.add_argument("--course", action="append", default=[], metavar="时段=课程",
+                        help="按内容选择课程，如 14:10-14:50=篮球,足球（按志愿排序），可重复")
+    parser.add_argument("--dry-run", action="store_true", help="完成全部准备后退出，不等待提交")
+    return parser.parse_args()
 
 def main():
+    if os.name == 'nt':
+        # 启用Windows控制台的ANSI控制码
+        os.system('')
+    args = parse_args()
+    if args.profile or args.cprofile or args.tracemalloc:
+        PROFILER.enable(args.profile, args.cprofile, args.tracemalloc)
+    if args.trace_summary:
+        summarize_trace(args.trace_summary)
+        return
+    if args.trace:
+        CLIENT.enable_trace(args.trace)
+    if args.record:
+        CLIENT.enable_record(args.record)
+    if args.replay:
+        CLIENT.enable_replay(args.replay, args.replay_scale)
+    if args.preflight is not None:
+        Preflight.leads = args.preflight
+    if args.config or args.form or args.replay:
+        sys.exit(run_config(args))
+    
     print_banner()
     print_help()
     
-    # 获取请求头
-    headers = get_headers()
-    if not headers:
-        print_colored("请求头获取失败，程序退出", "red")
-        return
-    
-    # 更新全局HEADERS
-    global HEADERS
-    HEADERS = headers
+    if args.offline:
+        print_colored("离线模式：只使用缓存的表单信息完成选择，不会提交", "yellow", "bold")
+    else:
+        # 获取请求头
+        with PROFILER.span("输入并解析请求头"):
+            headers = get_headers()
+        if not headers:
+            print_colored("请求头获取失败，程序退出", "red")
+            return
+        
+        # 请求头只设置一次，由共享会话携带
+        CLIENT.set_headers(headers)
     
     while True:
         try:
@@ -573,13 +3935,29 @@ def main():
                 form_id = user_input
             
             print_colored("\n═══ 表单详情 ═══", "cyan", "bold")
-            form_data = get_form_profile(form_id)
-            if not form_data:
-                print_colored("❌ 获取表单失败，请检查ID是否正确", "red")
+            cached = FORM_CACHE.load(form_id)
+            revalidation = None
+            catalog_fetch = None
+            # 名单只用于显示，和表单信息、目录同时获取，不等它返回
+            roster = None if args.offline else prefetch(count_name_list, form_id)
+            if cached:
+                # 先用缓存，后台校验版本，版本变化时才重新获取
+                form_data, catalog_data = cached["profile"], cached["catalog"]
+                print_colored(f"✓ 已从缓存加载表单（版本 {cached['version']}）", "green")
+                print_form_profile(form_data)
+                if not args.offline:
+                    revalidation = FORM_CACHE.revalidate(form_id, form_data)
+            elif args.offline:
+                print_colored("❌ 没有该表单的缓存，请先联网运行一次", "red")
                 continue
-            
-            # 添加获取名单完成情况
-            get_name_list(form_id)
+            else:
+                # 目录不依赖表单信息，同时获取，到达后边收边解析
+                catalog_fetch = prefetch(get_form_catalog, form_id, verbose=False)
+                form_data = get_form_profile(form_id)
+                if not form_data:
+                    RENDERER.flush()
+                    print_colored("❌ 获取表单失败，请检查ID是否正确", "red")
+                    continue
                 
             # 检查表单时间
             config = form_data.get("config", {})
@@ -588,13 +3966,58 @@ def main():
                 print("无法获取开始时间")
                 continue
             
-            print_colored("\n═══ 获取目录 ═══", "cyan", "bold")
-            catalog_data = get_form_catalog(form_id)
-            if not catalog_data:
-                continue
+            if not cached:
+                print_colored("\n═══ 获取目录 ═══", "cyan", "bold")
+                catalog_data = catalog_fetch.get()
+                if not catalog_data:
+                    RENDERER.flush()
+                    continue
+                print("表单目录获取成功！")
+                FORM_CACHE.save(form_id, form_data, catalog_data)
+            
+            # 添加获取名单完成情况，没有及时返回就跳过
+            if roster:
+                try:
+                    summary = roster.get(ROSTER_WAIT)
+                except Exception as e:
+                    print_colored(f"获取名单时出错: {str(e)}", "red")
+                else:
+                    if summary is None:
+                        print_colored("名单仍在获取，跳过显示", "gray")
+                    else:
+                        print_name_list(*summary)
             
             print_colored("\n═══ 自动选择 ═══", "cyan", "bold")
-            catalogs, show_questions = auto_select_choices(catalog_data)
+            selection = cached and cached.get("selection")
+            use_saved = False
+            if selection:
+                print_colored("发现已保存的选择，是否直接使用？(y/n): ", "yellow", end="")
+                use_saved = input().strip().lower() == 'y'
+            if use_saved:
+                catalogs, show_questions = selection["catalogs"], selection["show_questions"]
+                preferences = selection.get("preferences")
+            else:
+                with PROFILER.span("选课（含输入）"):
+                    catalogs, show_questions, preferences = auto_select_choices(catalog_data)
+                if catalogs and show_questions:
+                    FORM_CACHE.save_selection(form_id, catalogs, show_questions, preferences)
+            
+            if catalogs and show_questions and args.offline:
+                print_colored("\n✓ 选择已保存，开始前联网运行程序即可直接使用", "green", "bold")
+                sys.exit(0)
+            
+            # 选择期间已经完成的校验在这里处理，仍未完成的交给待命期间的FormWatcher，不等待
+            if revalidation and not revalidation.is_alive():
+                if revalidation.changed:
+                    print_colored(f"\n⚠️ 表单已更新（版本 {cached['version']} → {revalidation.form_data.get('version')}），"
+                                  "缓存已刷新，请重新选择", "yellow", "bold")
+                    continue
+                # 版本未变但开始时间可能已调整，以最新获取的表单信息为准
+                latest_begin = revalidation.form_data.get("config", {}).get("actBeginTime")
+                if latest_begin and latest_begin != begin_time:
+                    print_colored(f"\n⚠️ 开始时间已调整为 {latest_begin}", "yellow", "bold")
+                    begin_time = latest_begin
+                form_data, revalidation = revalidation.form_data, None
             
             if catalogs and show_questions:
                 print_colored("\n═══ 选择结果 ═══", "cyan", "bold")
@@ -606,8 +4029,15 @@ def main():
                 
                 print_colored("\n是否确认选择并等待自动提交？(y/n): ", "yellow", end="")
                 if input().strip().lower() == 'y':
+                    watch = dict(catalog_data=catalog_data, version=form_data.get("version"), watch=args.watch,
+                                 sender=hedged_sender(args), revalidation=revalidation)
                     try:
-                        wait_and_submit(form_id, begin_time, catalogs, show_questions)
+                        if args.engine == "async":
+                            async_wait_and_submit(form_id, begin_time, catalogs, show_questions,
+                                                  preferences=preferences, monitor=args.monitor, **watch)
+                        else:
+                            wait_and_submit(form_id, begin_time, catalogs, show_questions, preferences=preferences,
+                                            monitor=args.monitor, **watch)
                         sys.exit(0)
                     except KeyboardInterrupt:
                         print_colored("\n\n⚠️ 程序已停止", "yellow", "bold")
@@ -630,5 +4060,8 @@ def main():
             if input().strip().lower() != 'y':
                 sys.exit(0)
 
+# 导入app完成的时刻
+IMPORT_FINISHED = time.perf_counter()
+
 if __name__ == "__main__":
     main()
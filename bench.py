@@ -0,0 +1,717 @@
+"""性能基准测试
+用法：
+    python bench.py payload [-n 次数]
+    python bench.py release [-n 次数]
+    python bench.py e2e [--engines sync,async] [--scenarios open,bump] [--latency 5,30]
+    python bench.py startup [-n 次数] [--save 基线.json] [--compare 基线.json]
+    python bench.py parse [--questions 200] [--options 40] [--roster 20000]
+    python bench.py replay [--file 录制.jsonl] [--scale 1] [--runs 3]
+    python bench.py link [-n 次数] [--latency 30]
+    python bench.py dns [-n 次数] [--lookup 100] [--timeout 1]
+    python bench.py prepare [-n 次数] [--latency 50]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import requests
+
+import app
+import transport
+from mock_server import FORM_ID, MockQun100, build_catalogs
+
+def make_selection(questions=12, options=40):
+    """构造一份模拟的选课结果
+    Args:
+        questions: 问题数量
+        options: 每个问题的选项数量
+    Returns:
+        catalogs: 选择的课程列表
+        show_questions: 显示的问题列表
+    """
+    catalogs = [{"type": "WORD", "cid": "q0", "value": "张三"}]
+    show_questions = ["q0"]
+    for i in range(1, questions):
+        cid = f"q{i}"
+        show_questions.append(cid)
+        # 部分问题不作答，模拟不可选的时段
+        if i % 4:
+            catalogs.append({
+                "type": "RADIO_V2",
+                "cid": cid,
+                "value": {"cid": f"{cid}o{i % options}", "customValue": ""}
+            })
+    return catalogs, show_questions
+
+def legacy_attempt(session, form_id, catalogs, show_questions, version):
+    """改造前每次提交的本地开销：过滤问题、构建字典、序列化JSON"""
+    filtered_show_questions = [q for q in show_questions if any(c["cid"] == q for c in catalogs)]
+    payload = {
+        "fid": app.get_new_fid(form_id),
+        "subscribe": {
+            "qgPso1tQCJF6E-jChXfP9bvtWFqKvN5wvMDFjCop400": 0,
+            "vj0_jH-hZaQ3pSSN_icqYZt5NEZz64vlA8Q3dTfQJ68": 0,
+            "9frpvZ2b6QJAUgG83Xkg8uq9g0JqjqqKJ7B7I33G7jE": 0
+        },
+        "catalogs": catalogs,
+        "showQuestions": filtered_show_questions,
+        "examUsedTime": None,
+        "formVersion": version,
+        "userCommonInfo": {}
+    }
+    headers = {"Client-Form-Id": form_id}
+    request = requests.Request("POST", f"{app.BASE_URL}/v1/{form_id}/form_data", headers=headers, json=payload)
+    return session.prepare_request(request)
+
+def prepared_attempt(prepared, version):
+    """改造后每次提交的本地开销：拼接请求体并复制请求模板"""
+    request = prepared.request.copy()
+    request.body = prepared.body(app.get_new_fid(prepared.form_id), version)
+    request.headers["Content-Length"] = str(len(request.body))
+    return request
+
+def timeit(func, number):
+    """返回单次调用的平均CPU耗时（微秒）"""
+    start = time.process_time()
+    for _ in range(number):
+        func()
+    return (time.process_time() - start) / number * 1e6
+
+def bench_payload(args):
+    """对比每次提交构建请求的CPU开销"""
+    catalogs, show_questions = make_selection(args.questions)
+    session = app.CLIENT.session
+    prepared = app.PreparedSubmission(FORM_ID, catalogs, show_questions)
+
+    legacy = timeit(lambda: legacy_attempt(session, FORM_ID, catalogs, show_questions, 3), args.number)
+    fast = timeit(lambda: prepared_attempt(prepared, 3), args.number)
+
+    print(f"问题数: {args.questions}，迭代次数: {args.number}")
+    print(f"每次构建并编码:   {legacy:8.1f} us/次")
+    print(f"预编译拼接:       {fast:8.1f} us/次")
+    print(f"加速比:           {legacy / fast:8.1f}x")
+
+def legacy_release(target):
+    """改造前的倒计时：按datetime轮询，整秒sleep，返回释放误差（纳秒）"""
+    deadline = time.perf_counter_ns() + int((target - time.time()) * 1e9)
+    begin_datetime = datetime.now() + timedelta(seconds=target - time.time())
+    # 旧实现每次循环都会打印，这里丢弃输出只保留时序
+    with contextlib.redirect_stdout(io.StringIO()):
+        while True:
+            now = datetime.now()
+            if now >= begin_datetime:
+                break
+            seconds = int((begin_datetime - now).total_seconds())
+            if seconds > 10:
+                print(f"\r距离开始还有: {seconds}", end="")
+                time.sleep(0.1)
+            else:
+                print(f"\n=== 倒计时最后{seconds}秒 ===")
+                for i in range(seconds, 0, -1):
+                    print(f"\r{i}...", end="")
+                    time.sleep(1)
+    return time.perf_counter_ns() - deadline
+
+def timer_release(target):
+    """LaunchTimer释放，返回释放误差（纳秒）"""
+    return app.LaunchTimer(target).wait()
+
+def bench_release(args):
+    """对比倒计时释放时刻的误差"""
+    print(f"每种方式 {args.number} 次，目标时刻在 {args.min_lead}-{args.max_lead} 秒后")
+    for name, release in (("旧倒计时", legacy_release), ("LaunchTimer", timer_release)):
+        errors = []
+        cpu = time.process_time()
+        for _ in range(args.number):
+            target = time.time() + random.uniform(args.min_lead, args.max_lead)
+            errors.append(release(target) / 1e6)
+        cpu = time.process_time() - cpu
+        print(f"{name:12s} 误差 p50 {app.percentile(errors, 50):8.3f}ms  p99 {app.percentile(errors, 99):8.3f}ms  "
+              f"最大 {max(errors, key=abs):8.3f}ms  CPU {cpu:.2f}s")
+
+@contextlib.contextmanager
+def mock_client(server):
+    """让app在with块内使用指向模拟服务器的全新客户端"""
+    client = app.CLIENT
+    app.CLIENT = app.Qun100Client(server.base_url, headers={"Authorization": "mock"})
+    try:
+        yield app.CLIENT
+    finally:
+        app.CLIENT = client
+
+def pick_choices(catalog_data, name, depth=3):
+    """不经交互地完成选择：第一个班级，每个时段按顺序以前几门课程为志愿
+    Returns:
+        catalogs: 选择的课程列表
+        show_questions: 显示的问题列表
+        preferences: 各时段按志愿排序的课程
+    """
+    catalogs = []
+    show_questions = []
+    preferences = {}
+    for question in catalog_data:
+        show_questions.append(question.cid)
+        if question.type == "WORD":
+            catalogs.append({"type": "WORD", "cid": question.cid, "value": name})
+        elif question.options:
+            catalogs.append({"type": "RADIO_V2", "cid": question.cid,
+                             "value": {"cid": question.options[0].cid, "customValue": ""}})
+            if question.slot:
+                preferences[question.cid] = [[o.cid, o.content] for o in question.options[:depth]]
+    return catalogs, show_questions, preferences
+
+# 端到端场景：传给模拟服务器的参数
+SCENARIOS = {
+    "open": {},
+    "bump": {"bump_at": 0.0},
+    "errors": {"error_rate": 0.3},
+    "busy": {"error_rate": 0.5, "error_status": 503, "retry_after": 0.05},
+    "skew": {"skew": 0.4},
+    # 第一个时段的前两个志愿已满，切换到第三志愿
+    "full": {"full": ("q_slot0_o0", "q_slot0_o1")},
+    # 三分之一的提交被服务器额外延迟0.5秒，对比对冲提交
+    "tail": {"stall_rate": 0.3, "stall": 0.5},
+}
+
+def run_e2e(engine_name, lead, hedge=0.0, max_in_flight=app.MAX_IN_FLIGHT, **server_args):
+    """启动模拟服务器，运行一次完整的抢课流程
+    Args:
+        hedge: 对冲提交的等待时间（毫秒），0表示不对冲
+    Returns:
+        dict: 本次运行的指标（毫秒）
+    """
+    server = MockQun100(begin_in=lead, **server_args)
+    server.start()
+    try:
+        with mock_client(server), contextlib.redirect_stdout(io.StringIO()):
+            catalogs, show_questions, preferences = pick_choices(app.get_form_catalog(FORM_ID), "学生001")
+            sender = app.HedgedSender(hedge / 1000, max_in_flight) if hedge else None
+            if engine_name == "async":
+                engine = app.AsyncEngine(FORM_ID, server.begin_time, catalogs, show_questions, preferences=preferences,
+                                         sender=sender)
+                asyncio.run(engine.run())
+            else:
+                engine = app.SyncEngine(FORM_ID, server.begin_time, catalogs, show_questions, preferences=preferences,
+                                        sender=sender)
+                engine.run()
+    finally:
+        server.stop()
+    return {
+        # 没有成功时（如名额已满）记为停止提交的时刻
+        "accepted": ((server.accepted[0][0] if server.accepted else server.posts[-1]) - server.begin) * 1000,
+        "arrival": (server.posts[0] - server.begin) * 1000,
+        "release": engine.timer.release_error_ns / 1e6,
+        "attempts": engine.submit_count,
+        "latencies": [latency * 1000 for latency in engine.latencies],
+        "posts": len(server.posts),
+    }
+
+def bench_e2e(args):
+    """端到端基准：从开放到提交被接受的时间、每次提交延迟和释放误差"""
+    print(f"每种配置运行 {args.runs} 次，开始前 {args.lead} 秒启动（时间单位: ms）")
+    print(f"{'引擎':6s} {'场景':8s} {'延迟':>5s} {'对冲':>5s} {'开放→成功':>10s} {'首次到达':>9s} {'释放误差':>9s} "
+          f"{'尝试':>5s} {'请求':>5s} {'p50':>8s} {'p99':>8s}")
+    for engine_name in args.engines.split(","):
+        for scenario in args.scenarios.split(","):
+            for latency in args.latency.split(","):
+                for hedge in args.hedge.split(","):
+                    # 第i次运行使用相同的随机种子，各配置遇到相同的错误和延迟
+                    runs = [run_e2e(engine_name, args.lead, float(hedge), args.max_in_flight,
+                                    latency=float(latency) / 1000, seed=run, **SCENARIOS[scenario])
+                            for run in range(args.runs)]
+                    latencies = [value for run in runs for value in run["latencies"]]
+                    mean = lambda key: sum(run[key] for run in runs) / len(runs)
+                    print(f"{engine_name:8s} {scenario:10s} {latency:>5s} {hedge:>7s} {mean('accepted'):12.2f} "
+                          f"{mean('arrival'):12.2f} {mean('release'):12.3f} {mean('attempts'):7.1f} "
+                          f"{mean('posts'):7.1f} {app.percentile(latencies, 50):8.2f} "
+                          f"{app.percentile(latencies, 99):8.2f}")
+
+def run_process(args, env=None):
+    """运行一个Python子进程，返回墙钟耗时（毫秒）"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def profile_run(command, env, path):
+    """运行一次带启动分析的非交互模式
+    Returns:
+        (wall, report): 墙钟耗时（毫秒）和启动分析报告
+    """
+    wall = run_process([*command, "--profile", path], env)
+    with open(path, encoding="utf-8") as f:
+        return wall, json.load(f)
+
+def phase_table(reports):
+    """各阶段耗时的p50，同名阶段在一次运行中的耗时相加
+    Returns:
+        dict: {阶段: p50毫秒}，包括到达待命的armed
+    """
+    phases = {}
+    for report in reports:
+        totals = {"armed": report["armed"]}
+        for span in report["spans"]:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration"]
+        for name, duration in totals.items():
+            phases.setdefault(name, []).append(duration)
+    return {name: app.percentile(values, 50) for name, values in phases.items()}
+
+def bench_startup(args):
+    """冷启动基准：导入耗时和非交互模式从启动到待命的耗时及各阶段分解
+    --save保存结果作为基线，--compare与基线比较，到达待命变慢超过容差时返回非零退出码
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"每项运行 {args.number} 次（时间单位: ms）")
+    results = {}
+    for name, code in (("导入app（延迟导入）", "import app"),
+                       ("导入app（提前导入requests/asyncio）", "import requests, asyncio, app")):
+        times = [run_process(["-c", code]) for _ in range(args.number)]
+        results[name] = app.percentile(times, 50)
+        print(f"{name:36s} p50 {results[name]:8.1f}  最小 {min(times):8.1f}")
+
+    server = MockQun100(begin_in=3600, latency=args.latency / 1000)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            headers_file = os.path.join(directory, "headers.txt")
+            with open(headers_file, "w", encoding="utf-8") as f:
+                f.write("Authorization: mock\n")
+            config_file = os.path.join(directory, "config.json")
+            catalog_data = app.FormCatalog(server.catalogs)
+            with open(config_file, "w", encoding="utf-8") as f:
+                json.dump({
+                    "headers_file": headers_file,
+                    "form": FORM_ID,
+                    "name": "学生001",
+                    "class": "9(1)班",
+                    "courses": {question.slot: question.options[0].content
+                                for question in catalog_data if question.slot},
+                }, f, ensure_ascii=False)
+            cache_dir = os.path.join(directory, "cache")
+            profile_path = os.path.join(directory, "profile.json")
+            env = dict(os.environ, QUN100_BASE_URL=server.base_url, QUN100_CACHE_DIR=cache_dir)
+            command = [os.path.join(here, "app.py"), "--config", config_file, "--dry-run"]
+            cold, warm = [], []
+            for _ in range(args.number):
+                for entry in os.listdir(cache_dir) if os.path.isdir(cache_dir) else ():
+                    os.remove(os.path.join(cache_dir, entry))
+                cold.append(profile_run(command, env, profile_path))
+            warm = [profile_run(command, env, profile_path) for _ in range(args.number)]
+    finally:
+        server.stop()
+    tables = {}
+    for name, runs in (("无缓存", cold), ("有缓存", warm)):
+        walls = [wall for wall, _ in runs]
+        tables[name] = phase_table([report for _, report in runs])
+        results[f"配置启动到就绪（{name}）"] = app.percentile(walls, 50)
+        results[f"到达待命（{name}）"] = tables[name]["armed"]
+    for name in ("无缓存", "有缓存"):
+        key = f"配置启动到就绪（{name}）"
+        print(f"{key:36s} p50 {results[key]:8.1f}")
+    print("\n各阶段p50（从开始导入app计时，时间单位: ms）")
+    print(f"{'阶段':24s}{'无缓存':>10s}{'有缓存':>10s}")
+    # 按运行中出现的先后排列阶段，只在有缓存时出现的阶段排在后面
+    names = {"armed": None}
+    for _, report in cold + warm:
+        for span in sorted(report["spans"], key=lambda span: span["start"]):
+            names.setdefault(span["name"])
+    for name in names:
+        cells = "".join(f"{tables[key][name]:12.1f}" if name in tables[key] else f"{'-':>12s}"
+                        for key in ("无缓存", "有缓存"))
+        print(f"{'到达待命' if name == 'armed' else name:24s}{cells}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\n结果已保存到 {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n与基线 {args.compare} 比较（容差 {args.tolerance:.0%}，至少 {args.slack:g}ms）")
+        regressed = False
+        for name, value in results.items():
+            if name not in baseline:
+                continue
+            limit = max(baseline[name] * (1 + args.tolerance), baseline[name] + args.slack)
+            mark = "变慢" if value > limit else "正常"
+            regressed = regressed or (value > limit and name.startswith("到达待命"))
+            print(f"{name:36s} 基线 {baseline[name]:8.1f}  本次 {value:8.1f}  {mark}")
+        if regressed:
+            sys.exit(1)
+
+def legacy_catalog():
+    """改造前的目录获取：完整解码响应后再过滤"""
+    data = app.CLIENT.get(f"/v1/form/{FORM_ID}/catalog", FORM_ID).json()
+    catalogs = data["data"].get("catalogs", [])
+    return app.FormCatalog([c for c in catalogs if c.get("catalogType") == "QUESTION"])
+
+def legacy_roster():
+    """改造前的名单获取：完整解码响应，统计和收集已完成名单各遍历一次"""
+    name_list = app.CLIENT.get(f"/v1/{FORM_ID}/name_list/used", FORM_ID).json()["data"][0]["nameList"]
+    completed = sum(1 for person in name_list if person["status"] == 1)
+    return len(name_list), completed, [person["name"] for person in name_list if person["status"] == 1]
+
+def stream_roster():
+    """流式获取名单"""
+    total = 0
+    completed = []
+    for _, name, done in app.iter_name_list(FORM_ID):
+        total += 1
+        if done:
+            completed.append(name)
+    return total, len(completed), completed
+
+def measure(func, number):
+    """返回(耗时p50毫秒, 内存峰值MB)，内存单独测量，避免tracemalloc影响耗时"""
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return app.percentile(times, 50), peak / 2 ** 20
+
+def serve_large(args, ready):
+    """在子进程中运行带大目录和大名单的模拟服务器，服务器的内存不计入测量"""
+    server = MockQun100(begin_in=3600, roster_size=args.roster)
+    # 大的目录：很多问题，每个选项带较长的配置
+    slots = [f"第{i}题 14:10-14:50" for i in range(args.questions)]
+    server.catalogs = build_catalogs(args.options, slots=slots)
+    for catalog in server.catalogs:
+        for item in catalog.get("formCatalogs", []):
+            if item["role"] == "OPTION":
+                item["config"] = dict(item["config"], DESCRIPTION={"content": "课程介绍" * 40, "images": []})
+    for i, person in enumerate(server.roster):
+        person["status"] = int(i % 3 == 0)
+        person["extra"] = {"phone": "", "remark": "备注" * 10}
+    server.start()
+    ready.put(server.base_url)
+    while True:
+        time.sleep(1)
+
+def bench_parse(args):
+    """对比完整解码和流式解析大的目录和名单响应的耗时和内存峰值"""
+    import multiprocessing
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_large, args=(args, ready), daemon=True)
+    process.start()
+    client = app.CLIENT
+    app.CLIENT = app.Qun100Client(ready.get(timeout=30), headers={"Authorization": "mock"})
+    try:
+        catalog_bytes = len(app.CLIENT.get(f"/v1/form/{FORM_ID}/catalog", FORM_ID).content)
+        roster_bytes = len(app.CLIENT.get(f"/v1/{FORM_ID}/name_list/used", FORM_ID).content)
+        assert len(legacy_catalog()) == len(app.get_form_catalog(FORM_ID, verbose=False))
+        assert legacy_roster() == stream_roster()
+        print(f"目录 {args.questions}题x{args.options}项 {catalog_bytes / 2 ** 20:.1f}MB，"
+              f"名单 {args.roster}人 {roster_bytes / 2 ** 20:.1f}MB，每项 {args.number} 次")
+        print(f"{'':16s}{'耗时p50(ms)':>12s}{'内存峰值(MB)':>14s}")
+        for name, func in (("目录 完整解码", legacy_catalog),
+                           ("目录 流式解析", lambda: app.get_form_catalog(FORM_ID, verbose=False)),
+                           ("名单 完整解码", legacy_roster),
+                           ("名单 流式解析", stream_roster)):
+            elapsed, peak = measure(func, args.number)
+            print(f"{name:14s}{elapsed:12.1f}{peak:14.2f}")
+    finally:
+        app.CLIENT = client
+        process.terminate()
+
+def record_session(path, lead, scenario):
+    """对模拟服务器运行一次阻塞引擎并录制全部请求"""
+    server = MockQun100(begin_in=lead, latency=0.01, **SCENARIOS[scenario])
+    server.start()
+    try:
+        with mock_client(server), contextlib.redirect_stdout(io.StringIO()):
+            app.CLIENT.enable_record(path)
+            catalogs, show_questions, preferences = pick_choices(app.get_form_catalog(FORM_ID), "学生001")
+            begin_time = app.get_form_profile(FORM_ID, verbose=False)["config"]["actBeginTime"]
+            app.SyncEngine(FORM_ID, begin_time, catalogs, show_questions, preferences=preferences).run()
+            app.CLIENT.close()
+    finally:
+        server.stop()
+
+def replay_session(path, scale):
+    """用阻塞引擎回放一次录制
+    Returns:
+        dict: 本次回放的指标，时间按录制的时间线（毫秒）。发出时刻取决于本次时钟同步的估计，
+            发出之后的结果由录制决定，每次回放相同
+    """
+    client = app.CLIENT
+    app.CLIENT = app.Qun100Client(headers={"Authorization": "replay"})
+    replay = app.CLIENT.enable_replay(path, scale)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            form_id = replay.form_id
+            catalogs, show_questions, preferences = pick_choices(app.get_form_catalog(form_id), "学生001")
+            begin_time = app.get_form_profile(form_id, verbose=False)["config"]["actBeginTime"]
+            engine = app.SyncEngine(form_id, begin_time, catalogs, show_questions, preferences=preferences)
+            engine.run()
+            done = time.time()
+    finally:
+        app.CLIENT = client
+    launch = replay.to_recorded(engine.started.timestamp())
+    return {
+        "launch": (launch - replay.begin_rec) * 1000,
+        "success": (replay.to_recorded(done) - launch) * 1000,
+        "release": engine.timer.release_error_ns / 1e6,
+        "attempts": engine.submit_count,
+    }
+
+def bench_replay(args):
+    """回放录制的开放前后的请求，确定性地比较引擎改动"""
+    if not os.path.exists(args.file):
+        print(f"录制文件不存在，对模拟服务器录制一次（场景: {args.scenario}）: {args.file}")
+        record_session(args.file, args.lead, args.scenario)
+    with open(args.file, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    submits = [r for r in records if r["method"] == "POST"]
+    accepted = [r for r in submits if json.loads(r["body"]).get("code") == 0]
+    from transport import ReplayAdapter
+    begin = ReplayAdapter(args.file, tz=app.SERVER_TZ).begin_rec
+    print(f"录制: {len(records)}个请求，其中提交{len(submits)}次，成功{len(accepted)}次")
+    if accepted:
+        done = accepted[0]["ts"] + accepted[0]["elapsed"] / 1000
+        print(f"录制中 开放→发出 {(submits[0]['ts'] - begin) * 1000:.1f}ms  发出→成功 {(done - submits[0]['ts']) * 1000:.1f}ms")
+    print(f"每次回放的时间比例 {args.scale}，共 {args.runs} 次（时间单位: ms，按录制的时间线）")
+    print(f"{'':6s}{'开放→发出':>10s}{'发出→成功':>10s}{'释放误差':>10s}{'尝试':>6s}")
+    for run in range(args.runs):
+        result = replay_session(args.file, args.scale)
+        print(f"{run + 1:<6d}{result['launch']:12.1f}{result['success']:12.1f}{result['release']:12.3f}"
+              f"{result['attempts']:6d}")
+
+def legacy_link(url):
+    """改造前的短链接解析：跟随全部跳转并下载最终页面"""
+    response = app.CLIENT.session.get(url, allow_redirects=True, headers={"Authorization": None})
+    return app.form_id_in_url(response.url)
+
+def cached_link(url):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app.extract_form_id_from_url(url)
+
+def bench_link(args):
+    """对比短链接的完整跟随、逐跳解析和本地缓存的请求次数、下载字节数和耗时"""
+    server = MockQun100(begin_in=3600, latency=args.latency / 1000, page_size=args.page_size)
+    server.start()
+    url = f"{server.base_url}/link/{server.link_code}"
+    cache = app.FORM_CACHE
+    try:
+        with mock_client(server), tempfile.TemporaryDirectory() as directory:
+            app.FORM_CACHE = app.FormCache(directory)
+            print(f"服务器延迟 {args.latency:g}ms，最终页面 {args.page_size / 1024:.0f}KB，每种方式 {args.number} 次")
+            print(f"{'':12s}{'请求次数':>8s}{'下载(KB)':>10s}{'耗时p50(ms)':>12s}{'最大(ms)':>10s}")
+            for name, func in (("完整跟随", lambda: legacy_link(url)),
+                               ("逐跳解析", lambda: app.resolve_short_link(url)[0]),
+                               ("本地缓存", lambda: cached_link(url))):
+                # 先运行一次建立连接（缓存方式同时写入缓存），不计入统计
+                assert func() == FORM_ID
+                requests_before, bytes_before = len(server.link_requests), server.link_bytes
+                times = []
+                for _ in range(args.number):
+                    start = time.perf_counter()
+                    func()
+                    times.append((time.perf_counter() - start) * 1000)
+                hops = (len(server.link_requests) - requests_before) / args.number
+                downloaded = (server.link_bytes - bytes_before) / args.number / 1024
+                print(f"{name:10s}{hops:10.1f}{downloaded:10.1f}{app.percentile(times, 50):12.2f}{max(times):10.2f}")
+    finally:
+        app.FORM_CACHE = cache
+        server.stop()
+
+class StubResolver:
+    """存根解析器：每次解析等待lookup秒，返回固定的IPv4地址列表"""
+    def __init__(self, addresses, lookup):
+        self.addresses = addresses
+        self.lookup = lookup
+        self.calls = 0
+
+    def __call__(self, host, port, family=0, type=0, proto=0, flags=0):
+        self.calls += 1
+        time.sleep(self.lookup)
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))
+                for address in self.addresses]
+
+def tarpit(port, host="127.0.0.2"):
+    """在另一个回环地址的同一端口上监听但不accept
+    连接队列被占满后新的SYN被丢弃，连接这个地址会一直等到超时，模拟不可达的DNS记录
+    Returns:
+        (listener, filler): 两个socket，测完后关闭
+    """
+    listener = socket.socket()
+    listener.bind((host, port))
+    listener.listen(0)
+    return listener, socket.create_connection((host, port))
+
+def bench_dns(args):
+    """对比开始时刻新建连接时，经过系统解析和使用预热时固定的地址的耗时
+    存根解析器每次解析耗时--lookup毫秒，第一个记录不可达，第二个才是模拟服务器
+    """
+    server = MockQun100(begin_in=3600, latency=args.latency / 1000)
+    server.start()
+    port = server.server.server_address[1]
+    base_url = f"http://form.qun100.test:{port}"
+    sockets = tarpit(port)
+    resolver = StubResolver(["127.0.0.2", "127.0.0.1"], args.lookup / 1000)
+    pins = transport.PINS
+    default_resolver = pins.resolver
+    pins.resolver = resolver
+    print(f"解析耗时 {args.lookup:g}ms，第一个地址不可达（连接超时{args.timeout:g}秒），每种方式 {args.number} 次")
+    print(f"{'':12s}{'解析次数':>8s}{'预热(ms)':>10s}{'首次请求p50(ms)':>16s}{'最大(ms)':>10s}")
+    try:
+        for name, pin in (("系统解析", False), ("固定地址", True)):
+            lookups = 0
+            warm = []
+            times = []
+            for _ in range(args.number):
+                pins.pinned.clear()
+                client = app.Qun100Client(base_url, headers={"Authorization": "mock"})
+                client.session
+                start = time.perf_counter()
+                if pin:
+                    pins.pin("form.qun100.test", port, args.timeout)
+                warm.append((time.perf_counter() - start) * 1000)
+                # 开始时刻：连接池是空的，第一次提交需要新建连接
+                calls = resolver.calls
+                start = time.perf_counter()
+                client.get(f"/v1/form/{FORM_ID}/profile", FORM_ID, timeout=args.timeout).content
+                times.append((time.perf_counter() - start) * 1000)
+                lookups += resolver.calls - calls
+                client.close()
+            print(f"{name:10s}{lookups / args.number:10.1f}{app.percentile(warm, 50):10.1f}"
+                  f"{app.percentile(times, 50):16.2f}{max(times):10.2f}")
+    finally:
+        pins.resolver = default_resolver
+        pins.pinned.clear()
+        for sock in sockets:
+            sock.close()
+        server.stop()
+
+def legacy_prepare(form_id):
+    """改造前的准备：表单信息、名单、目录依次获取"""
+    form_data = app.get_form_profile(form_id, verbose=False)
+    app.count_name_list(form_id)
+    return form_data, app.get_form_catalog(form_id, verbose=False)
+
+def pipelined_prepare(form_id):
+    """同时获取表单信息和目录，名单在后台获取，不等待
+    Returns:
+        (form_data, catalog_data, roster): roster为名单的后台获取
+    """
+    roster = app.prefetch(app.count_name_list, form_id)
+    form_data, catalog_data, _ = app.prepare_form(form_id, use_cache=False)
+    return form_data, catalog_data, roster
+
+def bench_prepare(args):
+    """对比依次获取和同时获取时，从输入表单ID到完成选择的耗时（不使用缓存）"""
+    server = MockQun100(begin_in=3600, latency=args.latency / 1000)
+    server.start()
+    catalog_data = app.FormCatalog(server.catalogs)
+    courses = {question.slot: question.options[0].content for question in catalog_data if question.slot}
+    try:
+        with mock_client(server):
+            print(f"服务器延迟 {args.latency:g}ms，每种方式 {args.number} 次")
+            print(f"{'':12s}{'请求':>6s}{'耗时p50(ms)':>12s}{'最大(ms)':>10s}{'往返次数':>10s}")
+            for name, func in (("依次获取", legacy_prepare), ("同时获取", pipelined_prepare)):
+                # 先运行一次建立足够的连接，不计入统计
+                func(FORM_ID)
+                times = []
+                for _ in range(args.number):
+                    start = time.perf_counter()
+                    form_data, catalog_data, *roster = func(FORM_ID)
+                    app.resolve_selection(catalog_data, "学生001", "9(1)班", courses)
+                    times.append((time.perf_counter() - start) * 1000)
+                    # 名单在计时外等待，避免和下一次运行争用连接
+                    for fetch in roster:
+                        fetch.join()
+                p50 = app.percentile(times, 50)
+                print(f"{name:10s}{3:8d}{p50:12.2f}{max(times):10.2f}{p50 / args.latency:10.2f}")
+    finally:
+        server.stop()
+
+BENCHMARKS = {
+    "payload": bench_payload,
+    "release": bench_release,
+    "e2e": bench_e2e,
+    "startup": bench_startup,
+    "parse": bench_parse,
+    "replay": bench_replay,
+    "link": bench_link,
+    "dns": bench_dns,
+    "prepare": bench_prepare,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="qun100 抢课工具性能基准测试")
+    subparsers = parser.add_subparsers(dest="name", required=True)
+
+    payload = subparsers.add_parser("payload", help="每次提交构建请求的CPU开销")
+    payload.add_argument("-n", "--number", type=int, default=20000, help="迭代次数")
+    payload.add_argument("-q", "--questions", type=int, default=12, help="问题数量")
+
+    release = subparsers.add_parser("release", help="倒计时释放时刻的误差")
+    release.add_argument("-n", "--number", type=int, default=5, help="每种方式的次数")
+    release.add_argument("--min-lead", type=float, default=1.5, help="目标时刻最少在多少秒后")
+    release.add_argument("--max-lead", type=float, default=3.5, help="目标时刻最多在多少秒后")
+
+    e2e = subparsers.add_parser("e2e", help="基于本地模拟服务器的端到端基准")
+    e2e.add_argument("--engines", default="sync,async", help="逗号分隔: sync,async")
+    e2e.add_argument("--scenarios", default="open,bump", help="逗号分隔: " + ",".join(SCENARIOS))
+    e2e.add_argument("--latency", default="5,30", help="逗号分隔的服务器延迟（毫秒）")
+    e2e.add_argument("--runs", type=int, default=1, help="每种配置运行次数")
+    e2e.add_argument("--lead", type=float, default=7, help="开始前多少秒启动引擎")
+    e2e.add_argument("--hedge", default="0", help="逗号分隔的对冲等待时间（毫秒），0表示不对冲")
+    e2e.add_argument("--max-in-flight", type=int, default=app.MAX_IN_FLIGHT, help="对冲时同时在途的请求上限")
+
+    startup = subparsers.add_parser("startup", help="冷启动到待命的耗时和各阶段分解")
+    startup.add_argument("-n", "--number", type=int, default=5, help="每项运行次数")
+    startup.add_argument("--save", metavar="FILE", help="把结果保存为基线")
+    startup.add_argument("--compare", metavar="FILE", help="与基线比较，到达待命变慢时返回非零退出码")
+    startup.add_argument("--tolerance", type=float, default=0.2, help="允许变慢的比例")
+    startup.add_argument("--slack", type=float, default=10, help="允许变慢的最少毫秒数，避免小数值的抖动误报")
+    startup.add_argument("--latency", type=float, default=0, help="模拟服务器延迟（毫秒），按往返次数比较准备阶段")
+
+    parse = subparsers.add_parser("parse", help="大的目录和名单响应的解析耗时和内存峰值")
+    parse.add_argument("-n", "--number", type=int, default=5, help="每项运行次数")
+    parse.add_argument("--questions", type=int, default=200, help="目录中的问题数量")
+    parse.add_argument("--options", type=int, default=40, help="每个问题的选项数量")
+    parse.add_argument("--roster", type=int, default=20000, help="名单人数")
+
+    replay = subparsers.add_parser("replay", help="回放录制的请求，确定性地比较引擎")
+    replay.add_argument("--file", default="replay.jsonl", help="录制文件，不存在时对模拟服务器录制一次")
+    replay.add_argument("--scale", type=float, default=1.0, help="回放的时间比例")
+    replay.add_argument("--runs", type=int, default=3, help="回放次数")
+    replay.add_argument("--scenario", default="bump", help="录制时的模拟场景: " + ",".join(SCENARIOS))
+    replay.add_argument("--lead", type=float, default=7, help="录制时开始前多少秒启动引擎")
+
+    link = subparsers.add_parser("link", help="短链接解析的请求次数和耗时")
+    link.add_argument("-n", "--number", type=int, default=20, help="每种方式运行次数")
+    link.add_argument("--latency", type=float, default=30, help="服务器延迟（毫秒）")
+    link.add_argument("--page-size", type=int, default=200000, help="最终页面大小（字节）")
+
+    dns = subparsers.add_parser("dns", help="开始时刻新建连接经过系统解析和使用固定地址的耗时")
+    dns.add_argument("-n", "--number", type=int, default=5, help="每种方式运行次数")
+    dns.add_argument("--lookup", type=float, default=100, help="存根解析器每次解析的耗时（毫秒）")
+    dns.add_argument("--timeout", type=float, default=1, help="连接超时（秒）")
+    dns.add_argument("--latency", type=float, default=5, help="服务器延迟（毫秒）")
+
+    prepare = subparsers.add_parser("prepare", help="准备阶段依次获取和同时获取的耗时")
+    prepare.add_argument("-n", "--number", type=int, default=10, help="每种方式运行次数")
+    prepare.add_argument("--latency", type=float, default=50, help="服务器延迟（毫秒）")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""qun100 本地模拟服务器
+实现 app.py 用到的接口，用于在本地测量抢课工具的性能：
+    GET  /v1/form/{id}/profile
+    GET  /v1/form/{id}/catalog
+    POST /v1/{id}/form_data
+    GET  /v1/{id}/name_list/used
+    GET  /link/{code}  短链接，经过多次跳转后到达表单页面
+支持网络延迟、开始时间限制、中途修改版本、名额限制、错误注入和服务器时钟偏差
+用法：
+    python mock_server.py --port 8000 --begin-in 60 --latency 20
+    QUN100_BASE_URL=http://127.0.0.1:8000 python app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlparse
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FORM_ID = "1234567890123456789"
+SERVER_TZ = timezone(timedelta(hours=8))
+
+CLASSES = ["9(1)班", "9(2)班", "10文1班", "10理1班", "11文1班", "11理1班"]
+SLOTS = ["第一节 14:10-14:50", "第二节 15:05-15:45", "第三节 15:55-16:35"]
+COURSES = ["篮球", "足球", "书法", "国画", "编程", "合唱", "围棋", "摄影", "辩论", "陶艺",
+           "天文", "戏剧", "羽毛球", "乒乓球", "烘焙", "街舞"]
+
+# 提交失败时返回的错误
+NOT_STARTED = (40001, "表单尚未开始，请稍后再试")
+VERSION_CHANGED = (40002, "表单已修改，请刷新后重新填写")
+SEAT_FULL = (40003, "{}名额已满")
+ENDED = (40004, "表单已结束")
+DUPLICATE = (40005, "您已提交过，请勿重复提交")
+
+def build_catalogs(courses=8, seat_limit=30, classes=CLASSES, slots=SLOTS):
+    """构造模拟的表单目录
+    Returns:
+        list: 与qun100接口结构一致的目录列表
+    """
+    def question(cid, qtype, title, options=()):
+        items = [{"cid": f"{cid}_title", "role": "TITLE", "content": title}]
+        for i, (content, config) in enumerate(options):
+            items.append({"cid": f"{cid}_o{i}", "role": "OPTION", "content": content, "config": config})
+        return {"cid": cid, "catalogType": "QUESTION", "type": qtype, "formCatalogs": items}
+
+    catalogs = [
+        {"cid": "intro", "catalogType": "DESCRIPTION", "content": "请在规定时间内完成选课"},
+        question("q_name", "WORD", "学生姓名"),
+        question("q_class", "RADIO_V2", "学生班级", [(c, {}) for c in classes]),
+    ]
+    limit = {"LIMIT": {"content": str(seat_limit)}}
+    for i, slot in enumerate(slots):
+        options = [(COURSES[(i * 3 + j) % len(COURSES)], limit) for j in range(courses)]
+        catalogs.append(question(f"q_slot{i}", "RADIO_V2", slot, options))
+    return catalogs
+
+class MockQun100:
+    """qun100 模拟服务器
+    在后台线程中运行，可在基准测试中直接创建，也可以通过命令行启动
+    """
+    def __init__(self, form_id=FORM_ID, begin_in=10.0, duration=3600, latency=0.0, jitter=0.0,
+                 skew=0.0, version=1, bump_at=None, seat_limit=30, full=(), courses=8,
+                 error_rate=0.0, error_status=502, retry_after=None, roster_size=50,
+                 link_code="demo", page_size=200000, stall_rate=0.0, stall=0.5, seed=None):
+        """
+        Args:
+            form_id: 表单ID
+            begin_in: 多少秒后开始，开始时间取整到秒
+            duration: 开放多少秒
+            latency: 每个请求的服务器处理延迟（秒）
+            jitter: 延迟的随机抖动上限（秒）
+            skew: 服务器时钟比真实时间快多少秒
+            version: 初始版本号
+            bump_at: 相对开始时间多少秒时版本号加一，None表示不修改
+            seat_limit: 每门课程的名额
+            full: 开始时就已满的选项cid
+            courses: 每个时段的课程数量
+            error_rate: 提交返回HTTP错误的概率
+            error_status: 注入错误的HTTP状态码
+            retry_after: 注入错误时返回的Retry-After（秒），None表示不返回
+            roster_size: 名单人数
+            link_code: 短链接/link/{link_code}的代码
+            page_size: 短链接最终到达的表单页面大小（字节）
+            stall_rate: 提交请求被额外延迟的概率，模拟尾延迟
+            stall: 额外延迟的秒数
+            seed: 错误注入和额外延迟的随机种子，相同的种子按相同的顺序注入
+        """
+        self.form_id = form_id
+        self.latency = latency
+        self.jitter = jitter
+        self.skew = skew
+        self.version = version
+        self.bump_at = bump_at
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.link_code = link_code
+        self.page_size = page_size
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.random = random.Random(seed)
+        self.begin = math.ceil(self.now() + begin_in)
+        self.end = self.begin + duration
+        self.catalogs = build_catalogs(courses, seat_limit)
+        self.limits = {}
+        for catalog in self.catalogs:
+            for item in catalog.get("formCatalogs", []):
+                limit = item.get("config", {}).get("LIMIT")
+                if limit:
+                    self.limits[item["cid"]] = int(limit["content"])
+        self.used = {cid: (self.limits[cid] if cid in full else 0) for cid in self.limits}
+        self.roster = [{"name": f"学生{i:03d}", "status": 0} for i in range(1, roster_size + 1)]
+        self.lock = threading.Lock()
+        # 统计信息，时间均为服务器时间
+        self.posts = []
+        self.accepted = []
+        # 已接受的fid，同一个fid重复提交时返回重复提交错误，不再占用名额
+        self.fids = set()
+        # 短链接相关的请求路径和下载的响应体字节数
+        self.link_requests = []
+        self.link_bytes = 0
+        # 短链接相关的请求中携带了Cookie或认证信息的次数
+        self.link_credentials = 0
+        self.server = None
+
+    def now(self):
+        """服务器时间戳"""
+        return time.time() + self.skew
+
+    @staticmethod
+    def format_time(timestamp):
+        return datetime.fromtimestamp(timestamp, SERVER_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+    @property
+    def begin_time(self):
+        return self.format_time(self.begin)
+
+    def current_version(self):
+        if self.bump_at is not None and self.now() >= self.begin + self.bump_at:
+            return self.version + 1
+        return self.version
+
+    def profile(self):
+        return {
+            "title": "模拟选修课报名",
+            "version": self.current_version(),
+            "config": {"actBeginTime": self.begin_time, "actEndTime": self.format_time(self.end)},
+        }
+
+    def catalog(self):
+        """带各选项已选人数的目录"""
+        with self.lock:
+            return [dict(catalog, formCatalogs=[
+                dict(item, usedCount=self.used[item["cid"]]) if item["cid"] in self.used else item
+                for item in catalog.get("formCatalogs", [])
+            ]) if "formCatalogs" in catalog else catalog for catalog in self.catalogs]
+
+    def name_list(self):
+        with self.lock:
+            return [{"nameList": [dict(person) for person in self.roster]}]
+
+    def submit(self, payload):
+        """处理一次提交
+        Returns:
+            (code, msg): code为0表示成功
+        """
+        now = self.now()
+        with self.lock:
+            self.posts.append(now)
+            if now < self.begin:
+                return NOT_STARTED
+            if now >= self.end:
+                return ENDED
+            if payload.get("fid") in self.fids:
+                return DUPLICATE
+            if payload.get("formVersion") != self.current_version():
+                return VERSION_CHANGED
+            name = None
+            chosen = []
+            for answer in payload.get("catalogs", []):
+                if answer.get("type") == "WORD":
+                    name = answer.get("value")
+                elif isinstance(answer.get("value"), dict):
+                    cid = answer["value"].get("cid")
+                    if cid in self.limits:
+                        chosen.append(cid)
+            for cid in chosen:
+                if self.used[cid] >= self.limits[cid]:
+                    code, msg = SEAT_FULL
+                    return code, msg.format(self.option_content(cid))
+            for cid in chosen:
+                self.used[cid] += 1
+            self.accepted.append((now, name))
+            self.fids.add(payload.get("fid"))
+            for person in self.roster:
+                if person["name"] == name:
+                    person["status"] = 1
+            return 0, "ok"
+
+    def option_content(self, cid):
+        for catalog in self.catalogs:
+            for item in catalog.get("formCatalogs", []):
+                if item.get("cid") == cid:
+                    return item.get("content")
+        return cid
+
+    def start(self, host="127.0.0.1", port=0):
+        """在后台线程中启动服务器
+        Returns:
+            str: 服务器地址，可用作QUN100_BASE_URL
+        """
+        handler = type("Handler", (MockHandler,), {"mock": self})
+        self.server = MockServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+class MockServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 客户端放弃的请求（如对冲提交中慢的那个）在写响应时断开，不打印
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class MockHandler(BaseHTTPRequestHandler):
+    """模拟接口的请求处理，使用HTTP/1.1保持连接"""
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭Nagle避免与延迟确认叠加出40ms的等待
+    disable_nagle_algorithm = True
+    mock = None
+
+    ROUTES = [
+        ("GET", re.compile(r"^/v1/form/(\d+)/profile$"), "handle_profile"),
+        ("GET", re.compile(r"^/v1/form/(\d+)/catalog$"), "handle_catalog"),
+        ("POST", re.compile(r"^/v1/(\d+)/form_data$"), "handle_submit"),
+        ("GET", re.compile(r"^/v1/(\d+)/name_list/used$"), "handle_name_list"),
+    ]
+    # 短链接的跳转链：统计跳转 → 带表单ID的H5页面 → 登录 → 页面HTML，不需要认证
+    LINK_ROUTES = [
+        (re.compile(r"^/link/(\w+)$"), "handle_link"),
+        (re.compile(r"^/jump$"), "handle_jump"),
+        (re.compile(r"^/h5/form$"), "handle_form_page"),
+        (re.compile(r"^/auth$"), "handle_auth"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def date_time_string(self, timestamp=None):
+        # Date响应头使用带偏差的服务器时钟
+        return formatdate(self.mock.now() if timestamp is None else timestamp, usegmt=True)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        mock = self.mock
+        if mock.latency or mock.jitter:
+            time.sleep(mock.latency + random.uniform(0, mock.jitter))
+        path = self.path.split("?", 1)[0]
+        for pattern, name in self.LINK_ROUTES:
+            match = pattern.match(path)
+            if match and method == "GET":
+                with mock.lock:
+                    mock.link_requests.append(self.path)
+                    if self.headers.get("Authorization") or self.headers.get("Cookie"):
+                        mock.link_credentials += 1
+                return getattr(self, name)(match, parse_qs(urlparse(self.path).query))
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                if match.group(1) != mock.form_id:
+                    return self.reply({"code": 40400, "msg": "表单不存在"})
+                if not self.headers.get("Authorization"):
+                    return self.reply({"code": 40100, "msg": "登录已失效，请重新登录"}, status=401)
+                return getattr(self, name)(body)
+        self.reply({"message": "Not Found"}, status=404)
+
+    def reply(self, data, status=200, headers=None):
+        content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def redirect(self, location):
+        content = f'<a href="{location}">Found</a>'.encode("utf-8")
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        with self.mock.lock:
+            self.mock.link_bytes += len(content)
+
+    def handle_link(self, match, query):
+        if match.group(1) != self.mock.link_code:
+            return self.reply({"message": "Not Found"}, status=404)
+        self.redirect(f"/jump?code={match.group(1)}")
+
+    def handle_jump(self, match, query):
+        self.redirect(f"/h5/form?id={self.mock.form_id}&from=link")
+
+    def handle_form_page(self, match, query):
+        self.redirect("/auth?redirect=" + quote(self.path, safe=""))
+
+    def handle_auth(self, match, query):
+        content = b"<!DOCTYPE html><html><body>" + b" " * self.mock.page_size + b"</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        with self.mock.lock:
+            self.mock.link_bytes += len(content)
+
+    def handle_profile(self, body):
+        self.reply({"code": 0, "data": self.mock.profile()})
+
+    def handle_catalog(self, body):
+        self.reply({"code": 0, "data": {"catalogs": self.mock.catalog()}})
+
+    def handle_name_list(self, body):
+        self.reply({"code": 0, "data": self.mock.name_list()})
+
+    def handle_submit(self, body):
+        mock = self.mock
+        with mock.lock:
+            stalled = mock.stall_rate and mock.random.random() < mock.stall_rate
+            failed = mock.error_rate and mock.random.random() < mock.error_rate
+        if stalled:
+            time.sleep(mock.stall)
+        if failed:
+            headers = {"Retry-After": f"{mock.retry_after:g}"} if mock.retry_after is not None else None
+            return self.reply({"message": "Bad Gateway"}, status=mock.error_status, headers=headers)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self.reply({"message": "Bad Request"}, status=400)
+        code, msg = mock.submit(payload)
+        if code == 0:
+            self.reply({"code": 0, "data": {"fid": payload.get("fid")}})
+        else:
+            self.reply({"code": code, "msg": msg})
+
+def main():
+    parser = argparse.ArgumentParser(description="qun100 本地模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--form-id", default=FORM_ID)
+    parser.add_argument("--begin-in", type=float, default=60, help="多少秒后开始")
+    parser.add_argument("--latency", type=float, default=0, help="服务器延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="延迟抖动上限（毫秒）")
+    parser.add_argument("--skew", type=float, default=0, help="服务器时钟偏差（秒）")
+    parser.add_argument("--bump-at", type=float, default=None, help="相对开始时间多少秒时修改版本")
+    parser.add_argument("--seat-limit", type=int, default=30, help="每门课程的名额")
+    parser.add_argument("--full", action="append", default=[], help="开始时就已满的选项cid")
+    parser.add_argument("--courses", type=int, default=8, help="每个时段的课程数量")
+    parser.add_argument("--error-rate", type=float, default=0, help="提交返回HTTP错误的概率")
+    parser.add_argument("--error-status", type=int, default=502)
+    parser.add_argument("--retry-after", type=float, default=None, help="注入错误时返回的Retry-After（秒）")
+    parser.add_argument("--stall-rate", type=float, default=0, help="提交请求被额外延迟的概率")
+    parser.add_argument("--stall", type=float, default=500, help="额外延迟（毫秒）")
+    args = parser.parse_args()
+
+    mock = MockQun100(args.form_id, begin_in=args.begin_in, latency=args.latency / 1000,
+                      jitter=args.jitter / 1000, skew=args.skew, bump_at=args.bump_at,
+                      seat_limit=args.seat_limit, full=args.full, courses=args.courses,
+                      error_rate=args.error_rate, error_status=args.error_status,
+                      retry_after=args.retry_after, stall_rate=args.stall_rate, stall=args.stall / 1000)
+    base_url = mock.start(args.host, args.port)
+    print(f"模拟服务器: {base_url}")
+    print(f"表单ID: {mock.form_id}")
+    print(f"开始时间: {mock.begin_time}")
+    print(f"短链接: {base_url}/link/{mock.link_code}")
+    print(f"使用方法: QUN100_BASE_URL={base_url} python app.py")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == "__main__":
+    main()
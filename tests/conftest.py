@@ -0,0 +1,47 @@
+"""测试共用的夹具
+测试直接导入仓库根目录下的 app.py、transport.py 和 mock_server.py，
+联网的测试在本地模拟服务器上运行
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app
+from mock_server import FORM_ID, MockQun100
+
+@pytest.fixture
+def serve(monkeypatch):
+    """启动模拟服务器并让app.CLIENT指向它，测试结束后关闭
+    Returns:
+        function: 参数同MockQun100，返回已启动的服务器
+    """
+    servers = []
+
+    def start(**kwargs):
+        server = MockQun100(**kwargs)
+        server.start()
+        servers.append(server)
+        monkeypatch.setattr(app, "CLIENT", app.Qun100Client(server.base_url, headers={"Authorization": "mock"}))
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+def choose(name="学生001"):
+    """不经交互地完成选择：每个单选问题选第一个选项
+    Returns:
+        (catalogs, show_questions)
+    """
+    catalog_data = app.get_form_catalog(FORM_ID, verbose=False)
+    catalogs = []
+    for question in catalog_data:
+        if question.type == "WORD":
+            catalogs.append({"type": "WORD", "cid": question.cid, "value": name})
+        elif question.options:
+            catalogs.append({"type": "RADIO_V2", "cid": question.cid,
+                             "value": {"cid": question.options[0].cid, "customValue": ""}})
+    return catalogs, [question.cid for question in catalog_data]
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import app
+from conftest import choose
+from mock_server import FORM_ID
+
+def test_cached_form_arms_without_waiting(serve, monkeypatch, tmp_path):
+    """使用缓存时不等待校验，直接按缓存待命；校验完成后按最新的开始时间和版本号更新引擎"""
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    server = serve(begin_in=600, version=2)
+    form_data = app.get_form_profile(FORM_ID, verbose=False)
+    catalog_data = app.get_form_catalog(FORM_ID, verbose=False)
+    catalogs, show_questions = choose()
+    stale_begin = server.format_time(server.begin + 300)
+    stale = dict(form_data, version=1, config=dict(form_data["config"], actBeginTime=stale_begin))
+    app.FORM_CACHE.save(FORM_ID, stale, catalog_data)
+    server.latency = 0.3
+    start = time.perf_counter()
+    cached, cached_catalog, revalidation = app.prepare_form(FORM_ID)
+    assert time.perf_counter() - start < 0.1
+    assert cached == stale and revalidation.is_alive()
+    engine = app.SyncEngine(FORM_ID, stale_begin, catalogs, show_questions)
+    watcher = app.start_watcher(engine, cached_catalog, 1, None, revalidation)
+    watcher.join(5)
+    assert not watcher.is_alive()
+    assert engine.begin_timestamp == app.parse_begin_time(form_data["config"]["actBeginTime"])
+    assert watcher.version == 2
+
+def test_fresh_form_has_no_revalidation(serve, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    serve()
+    form_data, catalog_data, revalidation = app.prepare_form(FORM_ID)
+    assert form_data["version"] and len(catalog_data) and revalidation is None
+    assert app.FORM_CACHE.load(FORM_ID)["version"] == form_data["version"]
+
+@pytest.mark.parametrize("content", ['{"profile": {"version": 1}, "version": 1}', '{"catalog": {"questions": []}}',
+                                     '{"catalog": {"questions": [["q", "WORD"]]}, "profile": {}, "version": 1}',
+                                     '{"catalog": null, "profile": {}, "version": 1}', "[]", "{bad json"])
+def test_malformed_entry_is_a_miss(content, tmp_path):
+    cache = app.FormCache(str(tmp_path))
+    with open(cache.path(FORM_ID), "w", encoding="utf-8") as f:
+        f.write(content)
+    assert cache.load(FORM_ID) is None
+    cache.save_selection(FORM_ID, [], [])
+
+def test_profile_and_catalog_fetched_concurrently(serve, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    serve(latency=0.3)
+    app.get_form_profile(FORM_ID, verbose=False)
+    start = time.perf_counter()
+    form_data, catalog_data, _ = app.prepare_form(FORM_ID)
+    assert form_data and catalog_data
+    # 依次获取需要两次往返
+    assert time.perf_counter() - start < 0.5
+
+def test_late_roster_skipped(serve):
+    """名单没有及时返回时不等待，之后仍可取得结果"""
+    serve(latency=0.3, roster_size=5)
+    roster = app.prefetch(app.count_name_list, FORM_ID)
+    start = time.perf_counter()
+    assert roster.get(0.05) is None
+    assert time.perf_counter() - start < 0.1
+    assert roster.get() == (5, [])
+
+def test_prefetch_error_raised_on_get():
+    fetch = app.prefetch(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        fetch.get()
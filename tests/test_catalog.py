@@ -0,0 +1,52 @@
+import json
+
+import app
+
+def question(cid, title, *options):
+    items = [{"role": "TITLE", "content": title}]
+    items += [{"role": "OPTION", "cid": f"{cid}_{content}", "content": content} for content in options]
+    return {"cid": cid, "type": "RADIO_V2", "formCatalogs": items}
+
+def test_sync_keeps_server_order():
+    catalog = app.FormCatalog([question("a", "周一 15:30-16:30 ", "书法"), question("b", "周二 15:30-16:30 ", "围棋"), question("c", "姓名")])
+    assert catalog.find("周二").cid == "b"
+    changed = catalog.sync([question("c", "姓名"), question("n", "周二 15:30-16:30 ", "篮球"), question("a", "周一 15:30-16:30 ", "剪纸"),
+                            question("b", "周二 15:30-16:30 ", "围棋")])
+    assert sorted(changed) == ["a", "n"]
+    assert [q.cid for q in catalog] == ["c", "n", "a", "b"]
+    assert catalog.by_slot["15:30-16:30"].cid == "n"
+    assert catalog.find("周二").cid == "n"
+    assert catalog.by_cid["a"].options[0].content == "剪纸"
+
+def test_sync_unchanged():
+    catalogs = [question("a", "周一 15:30-16:30 ", "书法"), question("b", "周二 15:30-16:30 ", "围棋")]
+    catalog = app.FormCatalog(catalogs)
+    assert catalog.sync(catalogs) == []
+    assert [q.cid for q in catalog] == ["a", "b"]
+
+def test_indexes():
+    limited = question("a", "周一 15:30-16:30 选修", "书法", "围棋")
+    limited["formCatalogs"][1]["config"] = {"LIMIT": {"content": "30"}}
+    limited["formCatalogs"].append({"role": "OPTION", "cid": "a_empty", "content": ""})
+    catalog = app.FormCatalog([limited, question("b", "姓名")])
+    a = catalog.by_cid["a"]
+    assert a.slot == "15:30-16:30" and catalog.by_slot == {"15:30-16:30": a}
+    assert [option.cid for option in a.options] == ["a_书法", "a_围棋"]
+    assert a.option("围棋") is catalog.options["a_围棋"] and a.option("篮球") is None
+    assert catalog.options["a_书法"].limit == 30 and catalog.options["a_围棋"].limit is None
+    assert catalog.options["a_书法"].question is a
+    assert catalog.by_cid["b"].slot is None
+    assert catalog.find("姓名") is catalog.by_cid["b"] and catalog.find("班级") is None
+
+def test_find_cache_cleared_on_change():
+    catalog = app.FormCatalog([question("a", "姓名")])
+    assert catalog.find("班级") is None
+    catalog.sync([question("a", "姓名"), question("b", "班级")])
+    assert catalog.find("班级").cid == "b"
+
+def test_round_trip():
+    catalog = app.FormCatalog([question("a", "周一 15:30-16:30 选修", "书法"), question("b", "姓名")])
+    restored = app.FormCatalog.from_dict(json.loads(json.dumps(catalog.to_dict())))
+    assert [q.signature() for q in restored] == [q.signature() for q in catalog]
+    assert restored.by_slot["15:30-16:30"].cid == "a"
+    assert restored.options["a_书法"].question is restored.by_cid["a"]
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app
+from conftest import choose
+from mock_server import FORM_ID
+
+def test_launch_time_allows_for_estimate_error():
+    clock = app.ClockSync(FORM_ID)
+    clock.offset, clock.error, clock.rtt = 1.5, 0.02, 0.01
+    begin = 1_000_000.0
+    # 最坏情况下服务器比估计慢error秒，请求仍在开始时刻之后到达
+    arrival = clock.launch_time(begin) + clock.rtt / 2 + clock.offset - clock.error
+    assert arrival == pytest.approx(begin + app.LAUNCH_MARGIN)
+
+def test_launch_time_before_sync():
+    clock = app.ClockSync(FORM_ID)
+    assert clock.launch_time(1_000_000.0) == pytest.approx(1_000_000.0 + app.LAUNCH_MARGIN)
+
+def test_sync_brackets_skewed_server(serve):
+    server = serve(skew=2.37, latency=0.005)
+    clock = app.ClockSync(FORM_ID)
+    assert clock.sync(deadline=time.time() + 8)
+    assert abs(clock.offset - server.skew) <= clock.error
+    assert clock.error < 0.1
+
+@pytest.mark.parametrize("skew", [0.0, 1.37])
+def test_first_submit_lands_after_open(serve, monkeypatch, skew):
+    """完整运行时钟同步、预热和释放，第一次提交到达时表单已开放
+    采样次数少时误差在100ms以上，只对准估计的偏差时请求经常提前到达
+    """
+    monkeypatch.setattr(app, "WARMUP_LEAD", 1)
+    server = serve(begin_in=9, latency=0.005, skew=skew)
+    catalogs, show_questions = choose()
+    clock = app.ClockSync(FORM_ID, samples=3)
+    engine = app.SyncEngine(FORM_ID, server.begin_time, catalogs, show_questions, clock=clock)
+    assert engine.run() is not None
+    assert server.posts[0] >= server.begin
+    assert engine.submit_count == 1
+
+def test_timer_releases_on_target():
+    target = time.time() + 0.15
+    timer = app.LaunchTimer(target)
+    error_ns = timer.wait()
+    released = time.time()
+    assert error_ns == timer.release_error_ns
+    assert 0 <= error_ns < 2_000_000
+    assert target - 0.002 <= released < target + 0.005
+
+def test_timer_before_returns_early_without_spinning():
+    timer = app.LaunchTimer(time.time() + 0.3)
+    assert timer.wait(before=0.2) is None
+    assert 0.15 < timer.remaining() <= 0.2
+    assert timer.release_error_ns is None
+
+@pytest.mark.parametrize("shift", [0.3, -0.3])
+def test_timer_follows_target_changed_while_waiting(shift):
+    """等待期间修改释放时刻：推迟时继续等待，提前时立即醒来"""
+    target = time.time() + 0.5
+    timer = app.LaunchTimer(target)
+    changer = threading.Timer(0.1, timer.set_target, (target + shift,))
+    changer.start()
+    timer.wait()
+    assert time.time() == pytest.approx(target + shift, abs=0.005)
+
+def test_async_timer_releases_on_target():
+    target = time.time() + 0.15
+    timer = app.LaunchTimer(target)
+    error_ns = asyncio.run(timer.wait_async())
+    assert 0 <= error_ns < 2_000_000
+    assert time.time() == pytest.approx(target, abs=0.005)
+
+def test_scheduler_fires_forms_in_begin_order(serve, monkeypatch):
+    """多个表单按开始时间先后预热和提交，与加入顺序无关，结果按加入顺序返回"""
+    monkeypatch.setattr(app, "WARMUP_LEAD", 1)
+    server = serve(begin_in=3, latency=0.005)
+    scheduler = app.Scheduler()
+    offsets = {"学生001": 2, "学生002": 0, "学生003": 1}
+    for name, offset in offsets.items():
+        catalogs, show_questions = choose(name)
+        scheduler.add(FORM_ID, server.format_time(server.begin + offset), catalogs, show_questions, label=name)
+    results = scheduler.run()
+    assert all(result is not None for result in results)
+    assert [name for _, name in server.accepted] == ["学生002", "学生003", "学生001"]
+    for accepted_at, name in server.accepted:
+        assert accepted_at >= server.begin + offsets[name]
+    started = sorted(scheduler.engines, key=lambda engine: engine.started)
+    assert [engine.label for engine in started] == ["学生002", "学生003", "学生001"]
+    assert all(engine.clock is scheduler.clock for engine in scheduler.engines)
@@ -0,0 +1,43 @@
+import builtins
+import json
+import sys
+
+import app
+from mock_server import FORM_ID
+
+def parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["app.py", *argv])
+    return app.parse_args()
+
+def test_cli_overrides_config_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"headers_file": "headers.txt", "name": "学生001", "class": "9(1)班",
+                                "courses": {"14:10-14:50": "篮球", "15:05-15:45": "国画"}}), encoding="utf-8")
+    args = parse(monkeypatch, "--config", str(path), "--name", "学生002", "--course", "15:05-15:45=编程，国画 ,")
+    config = app.load_config(args)
+    assert (config["headers_file"], config["name"], config["class"]) == ("headers.txt", "学生002", "9(1)班")
+    assert config["courses"] == {"14:10-14:50": "篮球", "15:05-15:45": ["编程", "国画"]}
+
+def test_config_errors_reported_together(monkeypatch, capsys):
+    args = parse(monkeypatch, "--form", "12345", "--dry-run")
+    assert app.run_config(args) == 1
+    out = capsys.readouterr().out
+    assert "未指定请求头文件" in out and "表单ID格式错误" in out
+
+def test_dry_run_without_prompts(serve, monkeypatch, tmp_path):
+    """非交互模式完成获取、选课和就绪检查，不读取任何输入，选择保存到缓存"""
+    def no_input(*args):
+        raise AssertionError("不应等待输入")
+    monkeypatch.setattr(builtins, "input", no_input)
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path / "cache")))
+    serve(begin_in=600)
+    headers = tmp_path / "headers.txt"
+    headers.write_text("Authorization: mock\nContent-Length: 10\n", encoding="utf-8")
+    args = parse(monkeypatch, "--headers-file", str(headers), "--form", FORM_ID, "--name", "学生001",
+                 "--class", "9(1)班", "--course", "14:10-14:50=篮球,足球", "--course", "15:05-15:45=国画",
+                 "--course", "第三节=围棋", "--dry-run")
+    assert app.run_config(args) == 0
+    selection = app.FORM_CACHE.load(FORM_ID)["selection"]
+    assert selection["preferences"] == {"q_slot0": [["q_slot0_o0", "篮球"], ["q_slot0_o1", "足球"]],
+                                        "q_slot1": [["q_slot1_o0", "国画"]], "q_slot2": [["q_slot2_o0", "围棋"]]}
+    assert {"type": "WORD", "cid": "q_name", "value": "学生001"} in selection["catalogs"]
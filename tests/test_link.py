@@ -0,0 +1,23 @@
+import pytest
+
+import app
+from mock_server import FORM_ID
+
+def test_short_link_sent_without_credentials(serve, monkeypatch):
+    """逐跳解析不带用户粘贴的Cookie和认证信息"""
+    server = serve()
+    app.CLIENT.set_headers({"Cookie": "session=secret", "X-Token": "secret"})
+    app.CLIENT.session
+    assert app.resolve_short_link(f"{server.base_url}/link/{server.link_code}") == (FORM_ID, 2)
+    assert server.link_requests
+    assert server.link_credentials == 0
+
+@pytest.mark.parametrize("url", ["https://example.com/page", f"https://www.qun100.com/h5/form?fid={FORM_ID}"])
+def test_only_short_links_resolved(url, monkeypatch, tmp_path):
+    """不是短链接的地址不联网，直接从地址中取表单ID"""
+    def unexpected(url):
+        raise AssertionError("不应请求")
+    monkeypatch.setattr(app, "resolve_short_link", unexpected)
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    expected = FORM_ID if FORM_ID in url else None
+    assert app.extract_form_id_from_url(url) == expected
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+import app
+from mock_server import FORM_ID
+
+class RecordingPlan:
+    """只记录mark_full调用的提交方案"""
+    def __init__(self):
+        self.full = []
+
+    def mark_full(self, cid):
+        self.full.append(cid)
+        return False
+
+def test_seats_from_used_count(serve):
+    server = serve(full=("q_slot0_o1",))
+    plan = RecordingPlan()
+    monitor = app.RosterMonitor(FORM_ID, plan=plan)
+    changes = monitor.poll_seats()
+    assert monitor.seats
+    assert monitor.remaining["q_slot0_o1"] == 0
+    assert monitor.remaining["q_slot0_o2"] == server.limits["q_slot0_o2"]
+    assert "已满" in changes
+    assert plan.full == ["q_slot0_o1"]
+
+def test_other_count_fields_ignored(serve):
+    """选项中其他用途的count字段不当作已选人数"""
+    server = serve()
+    server.used = {}
+    for catalog in server.catalogs:
+        for item in catalog.get("formCatalogs", []):
+            if item["cid"] in server.limits:
+                item["count"] = server.limits[item["cid"]]
+    plan = RecordingPlan()
+    monitor = app.RosterMonitor(FORM_ID, plan=plan)
+    assert monitor.poll_seats() is None
+    assert not monitor.seats
+    assert plan.full == []
+
+def test_roster_reports_only_new_completions(serve):
+    server = serve(roster_size=20)
+    server.roster[0]["status"] = 1
+    monitor = app.RosterMonitor(FORM_ID)
+    assert monitor.poll_roster(0.0) == "已完成 1/20"
+    assert monitor.poll_roster(30.0) is None
+    for person in server.roster[1:4]:
+        person["status"] = 1
+    report = monitor.poll_roster(60.0)
+    assert report.startswith("+3 学生002、学生003、学生004 | 已完成 4/20 (20%)")
+    assert report.endswith("3.0人/分钟")
+    assert monitor.poll_roster(90.0) is None
+
+@pytest.mark.parametrize("remaining, quiet", [(100, False), (app.WARMUP_LEAD - 1, True), (-1, True), (-5, False)])
+def test_quiet_window_around_launch(remaining, quiet):
+    monitor = app.RosterMonitor(FORM_ID, timer=app.LaunchTimer(time.time() + remaining))
+    assert monitor.quiet_now() is quiet
+
+def test_no_polling_in_quiet_window():
+    polls = []
+    monitor = app.RosterMonitor(FORM_ID, timer=app.LaunchTimer(time.time() + 1))
+    monitor.poll_roster = polls.append
+    monitor.start()
+    time.sleep(0.1)
+    monitor.stop()
+    monitor.join(1)
+    assert polls == []
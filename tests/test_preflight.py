@@ -0,0 +1,42 @@
+import time
+
+import app
+from mock_server import FORM_ID
+
+def test_check_respects_total_deadline(serve, monkeypatch, tmp_path):
+    """每个请求的超时只限制单次读写，整次检查不超过给定的时间"""
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    server = serve(latency=0.5)
+    logged = []
+    preflight = app.Preflight(FORM_ID, server.begin, [], log=lambda text, *args: logged.append(text))
+    start = time.perf_counter()
+    assert preflight.check(600, headroom=1.2) is False
+    assert time.perf_counter() - start < 1.35
+    assert any("目录" in text for text in logged)
+
+def test_check_passes(serve, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "FORM_CACHE", app.FormCache(str(tmp_path)))
+    server = serve()
+    catalogs = [{"type": "RADIO_V2", "cid": "q_slot0", "value": {"cid": "q_slot0_o1", "customValue": ""}}]
+    logged = []
+    preflight = app.Preflight(FORM_ID, server.begin, catalogs, {"q_slot0": [["q_slot0_o2", "书法"]]},
+                              log=lambda text, *args: logged.append(text))
+    assert preflight.check(600) is True
+    assert "就绪检查通过" in logged[-1]
+    preflight.set_choices([{"type": "RADIO_V2", "cid": "q_slot0", "value": {"cid": "gone", "customValue": ""}}])
+    assert preflight.check(600) is False
+
+def test_leads_replanned_after_retarget():
+    """开始时间修改后，已做过的检查按新的开始时间重新安排，已错过的不再进行"""
+    timer = app.LaunchTimer(time.time() + 700)
+    preflight = app.Preflight(FORM_ID, 0, [])
+    assert preflight.next_lead(timer) == 600
+    assert preflight.due(timer, 600)
+    assert preflight.next_lead(timer) == 120
+    timer.set_target(time.time() + 900)
+    assert preflight.next_lead(timer) == 600
+    timer.set_target(time.time() + 300)
+    assert preflight.next_lead(timer) == 120
+    timer.set_target(time.time() + 100)
+    assert not preflight.due(timer, 120)
+    assert preflight.next_lead(timer) is None
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import app
+
+Decision = app.RetryDecision
+
+def reply(code, msg):
+    return {"code": code, "msg": msg}
+
+@pytest.fixture
+def policy():
+    return app.RetryPolicy(interval=0.1)
+
+def test_success(policy):
+    decision = policy.classify(200, {"code": 0, "data": {}})
+    assert (decision.kind, decision.action) == ("ok", Decision.DONE)
+
+@pytest.mark.parametrize("status, data, kind", [
+    (200, reply(40003, "篮球名额已满"), "full"),
+    (200, reply(40004, "表单已结束"), "ended"),
+    (401, reply(40100, "登录已失效，请重新登录"), "auth"),
+    (403, None, "auth"),
+    (400, {"message": "Bad Request"}, "rejected"),
+    (404, None, "rejected"),
+    (422, reply(40010, "参数错误"), "rejected"),
+])
+def test_terminal(policy, status, data, kind):
+    decision = policy.classify(status, data)
+    assert (decision.kind, decision.action) == (kind, Decision.STOP)
+    assert decision.reason
+
+@pytest.mark.parametrize("msg", ["您已提交过，请勿重复提交", "请勿重复提交", "已提交过"])
+def test_duplicate_is_done(policy, msg):
+    decision = policy.classify(200, reply(40005, msg))
+    assert (decision.kind, decision.action) == ("duplicate", Decision.DONE)
+    assert "已提交过" in decision.describe()
+
+def test_version_retries_immediately(policy):
+    decision = policy.classify(200, reply(40002, "表单已修改，请刷新后重新填写"))
+    assert (decision.kind, decision.action, decision.delay) == ("version", Decision.RETRY, 0.0)
+
+def test_not_open_without_open_time(policy):
+    decision = policy.classify(200, reply(40001, "表单尚未开始"))
+    assert (decision.kind, decision.action, decision.delay) == ("not_open", Decision.RETRY, 0.1)
+
+def test_not_open_waits_until_open(policy):
+    policy.open_at = time.time() + 0.5
+    assert 0.4 < policy.classify(200, reply(40001, "表单尚未开始")).delay <= 0.5
+
+def test_not_open_after_open_backs_off_from_short_gap(policy):
+    # 按开始时刻加误差发出后仍略早到达，先等很短的间隔，连续被拒绝时加倍，不超过提交间隔
+    policy.open_at = time.time() - 0.01
+    delays = [policy.classify(200, reply(40001, "表单尚未开始")).delay for _ in range(5)]
+    assert delays == [policy.EARLY_GAP, policy.EARLY_GAP * 2, policy.EARLY_GAP * 4, 0.1, 0.1]
+    policy.classify(200, reply(40002, "表单已修改，请刷新后重新填写"))
+    assert policy.classify(200, reply(40001, "表单尚未开始")).delay == policy.EARLY_GAP
+    # 过了开放时刻很久仍尚未开始，开始时间有误，按提交间隔重试
+    policy.open_at = time.time() - policy.EARLY_GRACE - 1
+    assert policy.classify(200, reply(40001, "表单尚未开始")).delay == 0.1
+
+def test_server_errors_back_off(policy):
+    delays = [policy.classify(503, None).delay for _ in range(10)]
+    assert all(0 <= delay <= policy.backoff_cap for delay in delays)
+    assert policy.failures == 10
+    policy.classify(200, reply(40001, "表单尚未开始"))
+    assert policy.failures == 0
+
+def test_retry_after(policy):
+    decision = policy.classify(429, None, {"Retry-After": "1.5"})
+    assert (decision.kind, decision.action) == ("server", Decision.RETRY)
+    assert decision.delay >= 1.5
+    assert policy.classify(503, None, {"Retry-After": "3600"}).delay == app.RETRY_AFTER_CAP
+
+def test_network_error(policy):
+    decision = policy.classify_error(ConnectionError("reset"))
+    assert (decision.kind, decision.action) == ("server", Decision.RETRY)
+    assert "ConnectionError" in decision.reason
+
+def test_unknown_message_retries(policy):
+    decision = policy.classify(200, reply(50000, "系统繁忙"))
+    assert (decision.kind, decision.action, decision.delay) == ("unknown", Decision.RETRY, 0.1)
+
+def test_summary(policy):
+    policy.classify(200, reply(40001, "表单尚未开始"))
+    policy.classify(200, reply(40001, "表单尚未开始"))
+    policy.classify(200, {"code": 0})
+    assert policy.summary() == "尚未开始×2 成功×1"
+
+def test_settings_show_actual_timing():
+    settings = app.RetryPolicy(interval=0.25, backoff_cap=3).settings()
+    assert "0.25秒" in settings and "3秒" in settings
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import app
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+ITEMS = [{"name": "张三", "value": "一年级(1)班"}, {"name": "李四", "value": "二年级[2]班, \"乙\""}, {}]
+
+@pytest.mark.parametrize("size", [1, 2, 7, 4096])
+def test_elements_across_chunks(size):
+    """任意位置切分，包括多字节字符和字符串中的括号、逗号"""
+    body = json.dumps({"code": 0, "data": {"total": 3, "list": ITEMS}}, ensure_ascii=False).encode("utf-8")
+    assert list(app.iter_json_array(split(body, size), "list")) == ITEMS
+
+def test_empty_array():
+    assert list(app.iter_json_array([b'{"code":0,"data":{"list": [ ]}}'], "list")) == []
+
+def test_error_response():
+    body = json.dumps({"code": 40001, "msg": "登录已过期"}, ensure_ascii=False).encode("utf-8")
+    with pytest.raises(RuntimeError, match="40001.*登录已过期"):
+        list(app.iter_json_array(split(body, 5), "list"))
+
+def test_malformed_response():
+    with pytest.raises(RuntimeError, match="格式错误"):
+        list(app.iter_json_array([b"<html>502 Bad Gateway</html>"], "list"))
+
+def test_incomplete_response():
+    body = json.dumps({"data": {"list": ITEMS}}, ensure_ascii=False).encode("utf-8")
+    elements = app.iter_json_array(split(body[:-12], 8), "list")
+    assert next(elements) == ITEMS[0]
+    with pytest.raises(RuntimeError, match="不完整"):
+        list(elements)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+
+import requests
+
+import app
+from conftest import choose
+from mock_server import FORM_ID
+
+def test_version_refresh_network_error_backs_off(monkeypatch):
+    """版本冲突后刷新版本号时网络出错，不抛出，按网络错误退避后重试"""
+    def unreachable(*args, **kwargs):
+        raise requests.ConnectionError("connection refused")
+    monkeypatch.setattr(app, "get_form_profile", unreachable)
+    cache = app.FormVersionCache(FORM_ID)
+    cache.set(3)
+    cache.invalidate()
+    assert cache.refresh() is None
+    policy = app.RetryPolicy()
+    assert app.submit_form_data(FORM_ID, [], [], cache, policy=policy) is None
+    assert policy.last.kind == "server"
+    assert policy.last.action == app.RetryDecision.RETRY
+    assert 0 <= policy.last.delay <= policy.backoff_cap
+
+def make_plan(preferences):
+    catalogs = [{"type": "WORD", "cid": "q_name", "value": "学生001"}]
+    catalogs += [{"type": "RADIO_V2", "cid": cid, "value": {"cid": ranked[0][0], "customValue": ""}}
+                 for cid, ranked in preferences.items()]
+    return app.SubmissionPlan(FORM_ID, catalogs, [c["cid"] for c in catalogs], preferences)
+
+def selected(plan):
+    payload = json.loads(plan.current.body("1", 1))
+    return [c["value"]["cid"] for c in payload["catalogs"] if isinstance(c["value"], dict)]
+
+def full(msg):
+    return app.RetryDecision("full", app.RetryDecision.STOP, reason=msg)
+
+PREFERENCES = {
+    "s0": [["s0_a", "篮球"], ["s0_b", "足球"]],
+    "s1": [["s1_a", "书法"]],
+    "s2": [["s2_a", "国画"], ["s2_b", "编程"]],
+}
+
+def test_plan_orders_combinations_by_preference():
+    plan = make_plan(PREFERENCES)
+    assert len(plan.variants) == 4
+    assert selected(plan) == ["s0_a", "s1_a", "s2_a"]
+    assert plan.describe() == "篮球/书法/国画"
+
+def test_full_course_switches_only_its_slot():
+    plan = make_plan(PREFERENCES)
+    decision = plan.on_decision(full("国画名额已满"))
+    assert (decision.action, decision.delay) == (app.RetryDecision.RETRY, 0.0)
+    assert selected(plan) == ["s0_a", "s1_a", "s2_b"]
+    decision = plan.on_decision(full("篮球名额已满"))
+    assert decision.action == app.RetryDecision.RETRY
+    assert selected(plan) == ["s0_b", "s1_a", "s2_b"]
+
+def test_full_course_without_alternative_stops():
+    """只填了一门的时段已满时，不切换其他时段的志愿，直接停止"""
+    plan = make_plan(PREFERENCES)
+    decision = plan.on_decision(full("书法名额已满"))
+    assert decision.action == app.RetryDecision.STOP
+    assert "书法名额已满" in decision.reason
+    assert selected(plan) == ["s0_a", "s1_a", "s2_a"]
+
+def test_unrecognized_full_message_drops_current_combination():
+    plan = make_plan(PREFERENCES)
+    assert plan.on_decision(full("名额已满")).action == app.RetryDecision.RETRY
+    assert selected(plan) == ["s0_a", "s1_a", "s2_b"]
+
+def test_longest_course_name_wins():
+    plan = make_plan({"s0": [["s0_a", "篮球"], ["s0_b", "足球"]], "s1": [["s1_a", "小篮球"], ["s1_b", "围棋"]]})
+    plan.on_decision(full("小篮球名额已满"))
+    assert selected(plan) == ["s0_a", "s1_b"]
+
+def test_mark_full_and_rebuild_keep_known_full_courses():
+    plan = make_plan(PREFERENCES)
+    assert plan.mark_full("s0_a")
+    assert selected(plan) == ["s0_b", "s1_a", "s2_a"]
+    # 表单修改后按新的选择重新编码，已知满额的课程仍然排除
+    plan.build([{"type": "RADIO_V2", "cid": "s0", "value": {"cid": "s0_a", "customValue": ""}}], ["s0"],
+               {"s0": PREFERENCES["s0"]})
+    assert selected(plan) == ["s0_b"]
+    assert not plan.mark_full("s0_b")
+
+def test_fid_sequence_unique_across_threads():
+    sequence = app.FidSequence(FORM_ID)
+    results = []
+    def take():
+        results.append([int(sequence.next()) for _ in range(1000)])
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({fid for fids in results for fid in fids}) == 8000
+    for fids in results:
+        assert fids == sorted(fids)
+        assert fids[0] >= int(FORM_ID)
+
+def test_prepared_body_matches_payload():
+    """拼接出的请求体与直接编码完整数据一致，版本号变化后重新编码"""
+    catalogs = [{"type": "RADIO_V2", "cid": "q_slot0", "value": {"cid": "q_slot0_o1", "customValue": "\"引号\""}}]
+    prepared = app.PreparedSubmission(FORM_ID, catalogs, ["q_name", "q_slot0"])
+    for fid, version in [("123", 3), ("124", 3), ("125", 4)]:
+        payload = json.loads(prepared.body(fid, version))
+        assert payload["fid"] == fid
+        assert payload["formVersion"] == version
+        assert payload["catalogs"] == catalogs
+        assert payload["showQuestions"] == ["q_slot0"]
+        assert prepared.body(fid, version) == json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+def run_engine(serve, monkeypatch, engine_class):
+    """在首选课程已满的模拟服务器上运行一次引擎
+    Returns:
+        (engine, result, server)
+    """
+    monkeypatch.setattr(app, "WARMUP_LEAD", 1)
+    server = serve(begin_in=2, full=("q_slot0_o0",))
+    catalogs, show_questions = choose()
+    options = app.get_form_catalog(FORM_ID, verbose=False).by_cid["q_slot0"].options
+    preferences = {"q_slot0": [[option.cid, option.content] for option in options[:2]]}
+    engine = engine_class(FORM_ID, server.begin_time, catalogs, show_questions, preferences=preferences)
+    if engine_class is app.AsyncEngine:
+        result = asyncio.run(engine.run())
+    else:
+        result = engine.run()
+    return engine, result, server
+
+def test_sync_and_async_engines_agree(serve, monkeypatch):
+    """两个引擎对同一场景的处理一致：首选已满时改用备选，提交成功一次"""
+    outcomes = []
+    for engine_class in (app.SyncEngine, app.AsyncEngine):
+        engine, result, server = run_engine(serve, monkeypatch, engine_class)
+        assert result is not None
+        assert engine.policy.counts["full"] == 1
+        assert engine.policy.counts["ok"] == 1
+        outcomes.append((result.get("code"), engine.plan.describe(), server.used, len(server.accepted)))
+    assert outcomes[0] == outcomes[1]
+    assert outcomes[0][2]["q_slot0_o1"] == 1
+    assert outcomes[0][3] == 1
@@ -0,0 +1,145 @@
+import json
+import socket
+
+import pytest
+import requests
+from urllib3.exceptions import NameResolutionError
+
+import app
+import transport
+from transport import ReplayAdapter
+from conftest import choose
+from mock_server import FORM_ID
+
+def read_trace(path):
+    app.CLIENT.tracer.close()
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_streamed_responses_traced_after_body(serve, tmp_path):
+    """流式读取的目录和名单在读完响应体后才写入记录，包括实际大小和code"""
+    serve(latency=0.01)
+    path = str(tmp_path / "trace.jsonl")
+    app.CLIENT.enable_trace(path)
+    catalog = app.get_form_catalog(FORM_ID, verbose=False)
+    total, _ = app.count_name_list(FORM_ID)
+    roster = app.iter_name_list(FORM_ID)
+    next(roster)
+    roster.close()
+    records = read_trace(path)
+    assert [record["path"].rsplit("/", 1)[-1] for record in records] == ["catalog", "used", "used"]
+    for record in records:
+        assert record["status"] == 200
+        assert record["code"] == 0
+        assert record["bytes"] > 0
+        assert record["total"] >= record["ttfb"]
+    assert len(catalog) > 0 and total == 50
+    # 读完的名单与只读开头就关闭的名单都有记录，前者的大小是完整的响应体
+    assert records[1]["bytes"] >= records[2]["bytes"]
+
+def exchange(ts, method, path, body):
+    return {"ts": ts, "method": method, "url": f"http://qun100.test{path}", "request_headers": {},
+            "request_body": None, "status": 200, "headers": {}, "body": json.dumps(body), "elapsed": 0.0}
+
+def test_replay_after_first_submit_follows_request_order(tmp_path):
+    """第一次提交之后按请求先后回放，与回放时机无关"""
+    profile, submit = f"/v1/form/{FORM_ID}/profile", f"/v1/{FORM_ID}/form_data"
+    records = [
+        exchange(100.0, "GET", profile, {"code": 0, "data": {"version": 1}}),
+        exchange(104.0, "GET", profile, {"code": 0, "data": {"version": 1}}),
+        exchange(109.0, "POST", submit, {"code": 40002, "msg": "表单已修改"}),
+        exchange(109.1, "GET", profile, {"code": 0, "data": {"version": 2}}),
+        exchange(109.2, "POST", submit, {"code": 0, "data": {}}),
+    ]
+    path = tmp_path / "record.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    replay = ReplayAdapter(str(path))
+
+    def send(method, url):
+        response = replay.send(requests.Request(method, f"http://qun100.test{url}").prepare())
+        return response.json()
+
+    # 开始提交之前，时间线上所有时刻都只会回放第一次提交之前的响应
+    assert send("GET", profile)["data"]["version"] == 1
+    assert send("GET", profile)["data"]["version"] == 1
+    assert send("POST", submit)["code"] == 40002
+    assert send("GET", profile)["data"]["version"] == 2
+    assert send("POST", submit)["code"] == 0
+    # 超出录制的次数时重复最后一次
+    assert send("POST", submit)["code"] == 0
+    assert send("GET", f"/v1/form/{FORM_ID}/catalog")["message"] == "录制中没有该接口"
+
+def test_fetch_failures_reported_through_renderer(serve, monkeypatch, capsys):
+    """获取失败的原因交给RENDERER，提交路径上调用时不直接写终端"""
+    serve()
+    logged = []
+    monkeypatch.setattr(app.RENDERER, "log", lambda text, color="white", style="normal": logged.append(text))
+    other = "9" * 19
+    assert app.get_form_profile(other, verbose=False) is None
+    assert app.get_form_catalog(other, verbose=False) is None
+    assert capsys.readouterr().out == ""
+    assert [text.split("，")[0] for text in logged] == ["获取表单详情失败", "获取表单目录失败"]
+
+def stub_resolver(answers):
+    """按主机名返回固定地址的解析函数，answers中的值为异常时抛出"""
+    def resolve(host, port, type=0):
+        answer = answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return [(socket.AF_INET, type, 0, "", (address, port)) for address in answer]
+    return resolve
+
+@pytest.fixture
+def listener():
+    sock = socket.create_server(("127.0.0.1", 0))
+    yield sock.getsockname()[1]
+    sock.close()
+
+def test_pinned_address_used_without_resolving(listener, monkeypatch):
+    """127.0.0.2上没有监听，竞速后固定127.0.0.1；之后解析失败也直接使用固定的地址"""
+    answers = {"pins.test": ["127.0.0.2", "127.0.0.1"]}
+    pins = transport.AddressPins(resolver=stub_resolver(answers), delay=0.01)
+    monkeypatch.setattr(transport, "PINS", pins)
+    address, _ = pins.pin("pins.test", listener, timeout=1)
+    assert address == "127.0.0.1"
+    assert pins.pinned["pins.test"] == ["127.0.0.1", "127.0.0.2"]
+    answers["pins.test"] = socket.gaierror(socket.EAI_NONAME, "stub")
+    conn = transport.TracedHTTPConnection("pins.test", listener, timeout=1)
+    conn._new_conn().close()
+    assert conn._dns_host == "pins.test"
+
+def test_falls_back_to_next_address(listener, monkeypatch):
+    pins = transport.AddressPins(resolver=stub_resolver({"pins.test": ["127.0.0.2", "127.0.0.1"]}))
+    monkeypatch.setattr(transport, "PINS", pins)
+    conn = transport.TracedHTTPConnection("pins.test", listener, timeout=1)
+    sock = conn._new_conn()
+    assert sock.getpeername()[0] == "127.0.0.1"
+    sock.close()
+
+@pytest.mark.parametrize("answer", [[], socket.gaierror(socket.EAI_NONAME, "stub")])
+def test_resolution_failure(answer, monkeypatch):
+    """解析失败或没有任何地址时抛出urllib3的NameResolutionError，requests会转为ConnectionError"""
+    monkeypatch.setattr(transport, "PINS", transport.AddressPins(resolver=stub_resolver({"pins.test": answer})))
+    conn = transport.TracedHTTPConnection("pins.test", 80, timeout=1)
+    with pytest.raises(NameResolutionError):
+        conn._new_conn()
+
+def test_warmed_connection_reused(serve, tmp_path):
+    """预热建立的连接被之后的请求和提交复用，只有第一个请求新建连接"""
+    serve()
+    catalogs, show_questions = choose()
+    app.CLIENT.close()
+    path = str(tmp_path / "trace.jsonl")
+    app.CLIENT.enable_trace(path)
+    assert app.CLIENT.warm_up(FORM_ID)
+    assert app.CLIENT.warmed
+    session = app.CLIENT.session
+    cache = app.FormVersionCache(FORM_ID)
+    assert cache.refresh()
+    prepared = app.PreparedSubmission(FORM_ID, catalogs, show_questions)
+    prepared.send(cache.version).close()
+    assert app.CLIENT.session is session
+    records = read_trace(path)
+    assert [record["method"] for record in records] == ["GET", "GET", "POST"]
+    assert "connect" in records[0]
+    assert all("connect" not in record for record in records[1:])
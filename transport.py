@@ -0,0 +1,467 @@
+"""qun100 网络传输层
+带计时记录的requests会话和urllib3连接，以及请求的录制和回放。
+requests及其依赖的导入耗时约100ms，app.py 只在第一次需要联网时才导入本模块
+"""
+import bisect
+import json
+import math
+import queue
+import re
+import socket
+import threading
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError, NewConnectionError, ConnectTimeoutError
+
+# 当前线程正在记录的请求计时，未开启记录时为None
+_trace_local = threading.local()
+# 多个地址竞速时，每个地址比前一个晚多少秒发起连接（RFC 8305的建议值）
+HAPPY_EYEBALLS_DELAY = 0.25
+
+def current_trace():
+    return getattr(_trace_local, "record", None)
+
+def to_ms(seconds):
+    """秒转换为保留3位小数的毫秒"""
+    return round(seconds * 1000, 3)
+
+class AddressPins:
+    """主机地址固定
+    预热时解析一次主机名，有多个A/AAAA记录时按happy eyeballs的方式错开发起TCP连接，
+    最先连上的地址排在最前面固定下来。之后新建连接直接使用固定的地址，
+    开始时刻不再经过系统解析，解析慢或失败都不会推迟提交
+    """
+    def __init__(self, resolver=None, delay=HAPPY_EYEBALLS_DELAY):
+        """
+        Args:
+            resolver: 与socket.getaddrinfo参数相同的解析函数，测试时可替换为存根
+            delay: 竞速时相邻两个地址发起连接的间隔（秒）
+        """
+        self.resolver = resolver or socket.getaddrinfo
+        self.delay = delay
+        # 主机名 -> 地址列表，最快的在前，其余按解析顺序作为备用
+        self.pinned = {}
+
+    def resolve(self, host, port):
+        """解析主机名
+        Returns:
+            list: 去重后的地址，IPv6和IPv4交替排列
+        Raises:
+            socket.gaierror: 解析失败
+        """
+        families = {}
+        for family, _, _, _, sockaddr in self.resolver(host, port, type=socket.SOCK_STREAM):
+            addresses = families.setdefault(family, [])
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        groups = list(families.values())
+        return [group[i] for i in range(max(map(len, groups), default=0)) for group in groups if i < len(group)]
+
+    def addresses(self, host, port):
+        """新建连接时使用的地址
+        Returns:
+            (addresses, pinned): 地址列表，以及是否为固定的地址
+        """
+        pinned = self.pinned.get(host)
+        if pinned:
+            return pinned, True
+        return self.resolve(host, port), False
+
+    def pin(self, host, port, timeout=5.0):
+        """解析主机名，所有地址竞速连接，固定最先连上的地址
+        Args:
+            timeout: 每个地址的连接超时（秒）
+        Returns:
+            (address, elapsed): 最快的地址和它的TCP连接耗时（秒）
+        Raises:
+            OSError: 解析失败或所有地址都连接失败，此时保留原来固定的地址
+        """
+        addresses = self.resolve(host, port)
+        address, elapsed = self.race(addresses, port, timeout)
+        self.pinned[host] = [address] + [a for a in addresses if a != address]
+        return address, elapsed
+
+    def race(self, addresses, port, timeout):
+        """错开delay秒依次发起连接，返回最先连上的地址，只用于测速，连接随即关闭"""
+        results = queue.SimpleQueue()
+        won = threading.Event()
+
+        def attempt(index, address):
+            if won.wait(index * self.delay):
+                return
+            start = time.perf_counter()
+            try:
+                socket.create_connection((address, port), timeout).close()
+            except OSError as e:
+                results.put((address, None, e))
+            else:
+                results.put((address, time.perf_counter() - start, None))
+
+        for index, address in enumerate(addresses):
+            threading.Thread(target=attempt, args=(index, address), daemon=True).start()
+        error = OSError(f"没有可用的地址: {addresses}")
+        for _ in addresses:
+            address, elapsed, e = results.get()
+            if e is None:
+                won.set()
+                return address, elapsed
+            error = e
+        raise error
+
+# 所有连接共用的地址固定表
+PINS = AddressPins()
+
+class TracedHTTPConnection(HTTPConnection):
+    """记录DNS、TCP连接、发送和首字节耗时的连接
+    新建连接时优先使用PINS中固定的地址，没有固定时才解析
+    """
+    def _new_conn(self):
+        record = current_trace()
+        start = time.perf_counter()
+        try:
+            addresses, pinned = PINS.addresses(self._dns_host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        if not addresses:
+            raise NameResolutionError(self.host, self, socket.gaierror(socket.EAI_NONAME, "解析结果中没有地址"))
+        resolved = time.perf_counter()
+        if record is not None:
+            record["dns"] = to_ms(resolved - start)
+            record["pinned"] = pinned
+        # 依次连接各地址，与urllib3的默认行为一致
+        dns_host = self._dns_host
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+            else:
+                raise error
+        finally:
+            self._dns_host = dns_host
+        if record is not None:
+            record["peer"] = address
+            record["connect"] = to_ms(time.perf_counter() - resolved)
+        return sock
+
+    def connect(self):
+        record = current_trace()
+        start = time.perf_counter()
+        super().connect()
+        if record is not None and "connect" in record:
+            tls = (time.perf_counter() - start) * 1000 - record["dns"] - record["connect"]
+            record["tls"] = round(tls, 3) if isinstance(self, HTTPSConnection) else None
+
+    def request(self, *args, **kwargs):
+        record = current_trace()
+        if record is None:
+            return super().request(*args, **kwargs)
+        # HTTP连接在发送时才建立，发送耗时要扣除期间的建连耗时
+        before = self._connect_ms(record)
+        start = time.perf_counter()
+        super().request(*args, **kwargs)
+        record["_sent"] = time.perf_counter()
+        record["send"] = round((record["_sent"] - start) * 1000 - (self._connect_ms(record) - before), 3)
+        record["reused"] = "connect" not in record
+        if "peer" not in record and self.sock is not None:
+            # 复用的连接也记录对端地址，可以看出每次提交由哪个地址处理
+            record["peer"] = self.sock.getpeername()[0]
+
+    @staticmethod
+    def _connect_ms(record):
+        return record.get("dns", 0) + record.get("connect", 0) + (record.get("tls") or 0)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        record = current_trace()
+        if record is not None and "_sent" in record:
+            record["ttfb"] = to_ms(time.perf_counter() - record.pop("_sent"))
+        return response
+
+class TracedHTTPSConnection(TracedHTTPConnection, HTTPSConnection):
+    """记录各阶段耗时的HTTPS连接，TLS握手耗时单独记录"""
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+class Qun100Adapter(requests.adapters.HTTPAdapter):
+    """使用可计时连接的适配器"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TracedHTTPConnectionPool,
+            "https": TracedHTTPSConnectionPool,
+        }
+
+# 录制时替换掉的认证相关请求头和响应头
+REDACTED_HEADERS = ("authorization", "cookie", "set-cookie")
+
+def redact(headers):
+    return {key: "<redacted>" if key.lower() in REDACTED_HEADERS else value for key, value in headers.items()}
+
+def exchange_record(method, url, request_headers, request_body, status, headers, content, ts, elapsed):
+    """构建一条录制记录
+    Args:
+        ts: 请求发出时的Unix时间戳
+        elapsed: 从发出请求到读完响应体的耗时（秒）
+    Returns:
+        dict: 可写入JSONL的记录，认证信息已替换
+    """
+    if isinstance(request_body, bytes):
+        request_body = request_body.decode("utf-8", "replace")
+    return {
+        "ts": round(ts, 6),
+        "method": method,
+        "url": url,
+        "request_headers": redact(request_headers),
+        "request_body": request_body or None,
+        "status": status,
+        "headers": redact(headers),
+        "body": content.decode("utf-8", "replace"),
+        "elapsed": to_ms(elapsed),
+    }
+
+class TracedSession(requests.Session):
+    """开启记录时为每个请求生成一条计时记录的会话
+    未开启记录时直接调用requests.Session.send，几乎没有额外开销。
+    设置recorder时录制每个请求和响应，用于ReplayAdapter回放
+    """
+    tracer = None
+    recorder = None
+
+    def send(self, request, **kwargs):
+        recorder = self.recorder
+        if recorder is None:
+            return self._send(request, **kwargs)
+        ts = time.time()
+        start = time.perf_counter()
+        response = self._send(request, **kwargs)
+        # 录制时读完响应体，之后流式读取会直接使用已读的内容
+        content = response.content
+        recorder.emit(exchange_record(request.method, request.url, request.headers, request.body,
+                                      response.status_code, response.headers, content, ts,
+                                      time.perf_counter() - start))
+        return response
+
+    def _send(self, request, **kwargs):
+        tracer = self.tracer
+        if tracer is None:
+            return super().send(request, **kwargs)
+        parsed = urlparse(request.url)
+        record = {"ts": round(time.time(), 6), "method": request.method, "host": parsed.netloc, "path": parsed.path}
+        previous = current_trace()
+        _trace_local.record = record
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            record["total"] = to_ms(time.perf_counter() - start)
+            record["error"] = f"{type(e).__name__}: {e}"
+            tracer.emit(record)
+            raise
+        finally:
+            _trace_local.record = previous
+        record.pop("_sent", None)
+        if kwargs.get("stream"):
+            # 流式响应（目录、名单）在读完或关闭时才写入记录，大小和耗时包括响应体
+            StreamTrace(tracer, record, response, start)
+            return response
+        record["total"] = to_ms(time.perf_counter() - start)
+        tracer.finish(record, response.status_code, response.content)
+        return response
+
+class StreamTrace:
+    """流式响应的计时记录
+    替换响应的iter_content和close：边读边统计字节数，只保留开头的一段用于取code/msg，
+    响应体读完或响应关闭（如只读开头就断开）时补充总耗时并写入记录，只写一次
+    """
+    HEAD = 65536
+
+    def __init__(self, tracer, record, response, start):
+        self.tracer = tracer
+        self.record = record
+        self.response = response
+        self.start = start
+        self.head = bytearray()
+        self.size = 0
+        self.done = False
+        self._iter_content = response.iter_content
+        self._close = response.close
+        # response.content和iter_response_array都通过实例上的这两个方法读取和关闭
+        response.iter_content = self.iter_content
+        response.close = self.close
+
+    def iter_content(self, *args, **kwargs):
+        for chunk in self._iter_content(*args, **kwargs):
+            if isinstance(chunk, bytes):
+                self.size += len(chunk)
+                if len(self.head) < self.HEAD:
+                    self.head += chunk[:self.HEAD - len(self.head)]
+            yield chunk
+        self.finish()
+
+    def close(self):
+        try:
+            self._close()
+        finally:
+            self.finish()
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        self.record["total"] = to_ms(time.perf_counter() - self.start)
+        self.tracer.finish(self.record, self.response.status_code, bytes(self.head), self.size)
+
+class ReplayAdapter(BaseAdapter):
+    """按录制的时间线回放响应的传输层
+    录制的时间线按比例映射到回放时的时间，表单的开始/结束时间和Date响应头按同样的映射改写，
+    录制中的开放时刻在回放时落在未来的整秒上，引擎像当时一样等待并提交。
+    录制以第一次提交为界分为两段：第一次提交之前的请求（准备、时钟同步、预热）
+    返回同一接口在回放时刻之前最近的一次响应；回放中发出第一次提交之后，
+    每个接口按请求的先后依次返回录制中第一次提交之后的响应，与回放的时机无关，
+    提前或推迟发出都得到同样的结果，多次回放的尝试次数相同。
+    每个响应按录制的耗时乘以比例等待
+    """
+    TIME_FIELD = re.compile(r'("act\w*Time"\s*:\s*")(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})"')
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, path, scale=1.0, tz=None):
+        """
+        Args:
+            path: 录制的JSONL文件
+            scale: 时间比例，0.5表示以两倍速回放
+            tz: 表单时间字段所用的时区
+        """
+        super().__init__()
+        self.scale = scale
+        self.tz = tz
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        if not records:
+            raise ValueError(f"录制文件为空: {path}")
+        records.sort(key=lambda record: record["ts"])
+        launch = next((record["ts"] for record in records if record["method"] == "POST"), math.inf)
+        # 各接口在录制中第一次提交之前和之后的响应
+        self.before, self.after = {}, {}
+        for record in records:
+            phase = self.before if record["ts"] < launch else self.after
+            phase.setdefault(self.key(record["method"], record["url"]), []).append(record)
+        self.times = {key: [record["ts"] for record in exchanges] for key, exchanges in self.before.items()}
+        # 回放中是否已发出第一次提交，以及之后各接口已回放的次数
+        self.launched = False
+        self.served = {}
+        self.lock = threading.Lock()
+        parsed = urlparse(records[0]["url"])
+        self.base_url = f"{parsed.scheme}://{parsed.netloc}"
+        match = re.search(r"\d{19}", " ".join(record["url"] for record in records))
+        self.form_id = match.group(0) if match else None
+        self.start_rec = records[0]["ts"]
+        self.skew = self.recorded_skew(records)
+        # 录制中的开放时刻映射到回放时的整秒
+        begin_rec = self.begin_rec = self.recorded_begin(records)
+        lead = (begin_rec - self.start_rec) * scale if begin_rec else 0.0
+        self.start_wall = math.ceil(time.time() + lead) - lead
+
+    @staticmethod
+    def key(method, url):
+        return method, re.sub(r"\d{19}", "{id}", urlparse(url).path)
+
+    def recorded_begin(self, records):
+        """录制中表单的开始时间戳，没有时返回None"""
+        for record in records:
+            match = self.TIME_FIELD.search(record.get("body") or "")
+            if match and match.group(1).startswith('"actBeginTime"'):
+                return datetime.strptime(match.group(2), self.TIME_FORMAT).replace(tzinfo=self.tz).timestamp()
+        return None
+
+    @staticmethod
+    def recorded_skew(records):
+        """从录制的Date响应头估计当时服务器时钟比本地快多少秒
+        每条记录的Date（只精确到秒）在请求发出到读完响应之间生成，各记录的区间取交集
+        """
+        low, high = -math.inf, math.inf
+        for record in records:
+            date = next((value for name, value in record["headers"].items() if name.lower() == "date"), None)
+            if not date:
+                continue
+            server = parsedate_to_datetime(date).timestamp()
+            low = max(low, server - record["ts"] - record["elapsed"] / 1000)
+            high = min(high, server + 1 - record["ts"])
+        return (low + high) / 2 if low <= high else 0.0
+
+    def to_wall(self, recorded):
+        """录制时刻映射到回放时刻"""
+        return self.start_wall + (recorded - self.start_rec) * self.scale
+
+    def to_recorded(self, wall):
+        """回放时刻映射到录制时刻"""
+        return self.start_rec + (wall - self.start_wall) / self.scale
+
+    def shift_body(self, body):
+        def shift(match):
+            recorded = datetime.strptime(match.group(2), self.TIME_FORMAT).replace(tzinfo=self.tz).timestamp()
+            wall = datetime.fromtimestamp(self.to_wall(recorded), self.tz).strftime(self.TIME_FORMAT)
+            return f'{match.group(1)}{wall}"'
+        return self.TIME_FIELD.sub(shift, body)
+
+    def pick(self, method, key):
+        """选出本次请求回放的录制记录，录制中没有该接口时返回None"""
+        later = self.after.get(key)
+        with self.lock:
+            if method == "POST":
+                self.launched = True
+            if self.launched and later:
+                # 按先后依次回放，超出录制的次数时重复最后一次
+                count = self.served[key] = self.served.get(key, 0) + 1
+                return later[min(count, len(later)) - 1]
+        earlier = self.before.get(key)
+        if not earlier:
+            return later[0] if later else None
+        # 回放时刻之前录制的最近一次响应，更早的请求使用第一次响应
+        return earlier[max(bisect.bisect_right(self.times[key], self.to_recorded(time.time())) - 1, 0)]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        record = self.pick(request.method, self.key(request.method, request.url))
+        if record is None:
+            return self.build(request, 404, {}, json.dumps({"message": "录制中没有该接口"}).encode())
+        time.sleep(record["elapsed"] / 1000 * self.scale)
+        # Date按回放时刻生成，保持录制时服务器与本地的时钟偏差
+        headers = dict(record["headers"])
+        for name in [name for name in headers if name.lower() == "date"]:
+            headers[name] = formatdate(time.time() + self.skew * self.scale, usegmt=True)
+        return self.build(request, record["status"], headers, self.shift_body(record["body"]).encode("utf-8"))
+
+    @staticmethod
+    def build(request, status, headers, content):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = "utf-8"
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+    def close(self):
+        pass